@@ -0,0 +1,225 @@
+import asyncio
+import contextvars
+import io
+import sys
+from asgiref.wsgi import WsgiToAsgi
+from flask import current_app, redirect, render_template, request, session, url_for
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import configure_mappers, joinedload
+from werkzeug.exceptions import NotFound
+from database import async_engine_options, async_url
+from extensions import page_cache, search_index, slug_cache
+from models import ArchivedPosts, Posts
+from pagination import keyset_page, keyset_query
+from views.posts import feed_options, render_feed, show_post
+
+# ASGI serving mode (`uvicorn asgi:app`)
+#
+# The read-heavy pages (feed, single post, search) are served by async views
+# that query the database through an async SQLAlchemy engine, so a worker
+# keeps answering other connections while it waits on the database. They
+# render the same templates as the sync views and only take anonymous GET
+# requests; everything else, and every route without an async view, goes to
+# the unchanged WSGI app through a thread pool.
+
+
+class Fallback(Exception):
+    """Raised by an async view to hand the request to the WSGI app."""
+
+
+class AsyncDatabase:
+    def __init__(self, config):
+        # Only reads run here, so they go to the replica when there is one
+        uri = config.get('DB_REPLICA_URL') or config['SQLALCHEMY_DATABASE_URI']
+        self.engine = create_async_engine(async_url(uri), **async_engine_options(config, uri))
+        self.sessions = async_sessionmaker(self.engine, expire_on_commit=False)
+
+
+async def posts(session):
+    config = current_app.config
+    query = select(Posts).filter(Posts.live()).options(*feed_options())
+    page_query, backwards = keyset_query(query, Posts.date_posted, Posts.id, config['POSTS_PER_PAGE'],
+                                         request.args.get('after'), request.args.get('before'))
+    rows = (await session.execute(page_query)).scalars().all()
+    if backwards and not rows:
+        page_query, backwards = keyset_query(query, Posts.date_posted, Posts.id, config['POSTS_PER_PAGE'])
+        rows = (await session.execute(page_query)).scalars().all()
+    return render_feed(keyset_page(rows, Posts.date_posted, Posts.id, config['POSTS_PER_PAGE'],
+                                   backwards, request.args.get('after')))
+
+
+def live_post(post):
+    # Archived posts are rare; the sync view looks them up in posts_archive
+    if post is None:
+        raise Fallback()
+    if post.deleted_at is not None:
+        raise NotFound()
+    return post
+
+
+async def post(session, id):
+    post = await session.get(Posts, id, options=[joinedload(Posts.poster)])
+    return show_post(live_post(post))
+
+
+async def post_by_slug(session, slug):
+    post = None
+    id = slug_cache.get(slug)
+    if id is not None:
+        post = await session.get(Posts, id, options=[joinedload(Posts.poster)])
+        if post is None or post.slug != slug:
+            slug_cache.discard(slug)
+            post = None
+    if post is None:
+        result = await session.execute(select(Posts).options(joinedload(Posts.poster)).filter_by(slug=slug))
+        post = live_post(result.scalars().first())
+        slug_cache.set(slug, post.id)
+    return show_post(post)
+
+
+async def search(session):
+    searched = request.args.get('searched', '')
+    if not searched.strip():
+        return redirect(url_for('posts.posts'))
+    page = request.args.get('page', 1, type=int)
+    archive = bool(request.args.get('archive'))
+    model = ArchivedPosts if archive else Posts
+    try:
+        results = await search_index(archive).search_async(session, model, searched,
+                                                           page=max(page, 1),
+                                                           per_page=current_app.config['POSTS_PER_PAGE'],
+                                                           options=feed_options(model))
+    except NotImplementedError:
+        # The in-memory index ranks in Python and has no async path
+        raise Fallback()
+    return render_template("search.html", searched=searched, archive=archive, posts=results)
+
+
+# Async views by endpoint, and whether their responses go through the page cache
+VIEWS = {
+    'posts.posts': (posts, True),
+    'posts.post': (post, True),
+    'posts.post_by_slug': (post_by_slug, True),
+    'search.search': (search, False),
+}
+
+
+def build_environ(scope):
+    """WSGI environ for an ASGI http scope without a request body."""
+    server = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf8').decode('latin1'),
+        'PATH_INFO': scope['path'].encode('utf8').decode('latin1'),
+        'QUERY_STRING': scope['query_string'].decode('latin1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1] or 80),
+        'SERVER_PROTOCOL': 'HTTP/%s' % scope['http_version'],
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    if scope.get('client'):
+        environ['REMOTE_ADDR'] = scope['client'][0]
+    for name, value in scope['headers']:
+        name = name.decode('latin1')
+        if name == 'content-length':
+            key = 'CONTENT_LENGTH'
+        elif name == 'content-type':
+            key = 'CONTENT_TYPE'
+        else:
+            key = 'HTTP_' + name.upper().replace('-', '_')
+        value = value.decode('latin1')
+        if key in environ:
+            value = environ[key] + ',' + value
+        environ[key] = value
+    return environ
+
+
+class AsyncApp:
+    """ASGI application wrapping a Flask app created by create_app()."""
+
+    def __init__(self, app):
+        self.app = app
+        self.wsgi = WsgiToAsgi(app)
+        self.database = AsyncDatabase(app.config)
+        # The sync views configure the mappers on their first query, the async
+        # ones use relationship attributes like Posts.poster before that
+        configure_mappers()
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+        if scope['type'] == 'http' and scope['method'] in ('GET', 'HEAD'):
+            response = await self.dispatch(build_environ(scope))
+            if response is not None:
+                return await self.send_response(scope, response, send)
+        # asgiref keeps its executor in context variables, which leak into the
+        # next request on a keep-alive connection; give every call a clean one
+        return await contextvars.Context().run(asyncio.ensure_future, self.wsgi(scope, receive, send))
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self.database.engine.dispose()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    def anonymous(self):
+        # Logged-in visitors and pending flash messages need the sync views
+        remember = self.app.config.get('REMEMBER_COOKIE_NAME', 'remember_token')
+        return '_user_id' not in session and '_flashes' not in session and remember not in request.cookies
+
+    async def dispatch(self, environ):
+        """Run the async view for the request, or return None to use WSGI."""
+        app = self.app
+        with app.request_context(environ):
+            entry = VIEWS.get(request.endpoint)
+            if entry is None or request.routing_exception is not None or not self.anonymous():
+                return None
+            view, cacheable = entry
+            cacheable = cacheable and page_cache.cacheable()
+            try:
+                try:
+                    rv = app.preprocess_request()
+                    if rv is None:
+                        rv = await self.call_view(view, cacheable)
+                except Fallback:
+                    return None
+                except Exception as e:
+                    rv = app.handle_user_exception(e)
+                return app.finalize_request(rv)
+            except Exception as e:
+                return app.handle_exception(e)
+
+    async def call_view(self, view, cacheable):
+        if not cacheable:
+            async with self.database.sessions() as session:
+                return await view(session, **request.view_args)
+
+        # The cache backends may block on files or sockets
+        key = page_cache.key()
+        response = await asyncio.to_thread(page_cache.lookup, key)
+        if response is None:
+            async with self.database.sessions() as session:
+                rv = await view(session, **request.view_args)
+            response = await asyncio.to_thread(page_cache.store, key, self.app.make_response(rv))
+        return response
+
+    async def send_response(self, scope, response, send):
+        body = b'' if scope['method'] == 'HEAD' else response.get_data()
+        await send({
+            'type': 'http.response.start',
+            'status': response.status_code,
+            'headers': [(name.lower().encode('latin1'), value.encode('latin1'))
+                        for name, value in response.headers.items()],
+        })
+        await send({'type': 'http.response.body', 'body': body})
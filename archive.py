@@ -0,0 +1,45 @@
+from sqlalchemy import delete, insert, select
+from extensions import db, page_cache, search_index
+from models import ArchivedPosts, PostRevisions, Posts
+
+# Archival of old posts
+#
+# `flask archive-posts` moves posts written before a cutoff from posts to
+# posts_archive, a table with the same columns, ids and slugs. The feed,
+# author pages and search then work on a table and indexes that only grow
+# with recent activity, while old permalinks keep working with a second
+# primary key or slug lookup in the archive (see views/posts.find_post).
+# Archived posts are read-only; /archive and ?archive=1 searches list them.
+
+
+def archive_batch(cutoff, batch_size):
+    """Move up to ``batch_size`` of the oldest posts from before ``cutoff``; returns how many."""
+    rows = (db.session.query(Posts.id, Posts.poster_id)
+            .filter(Posts.date_posted < cutoff)
+            .order_by(Posts.date_posted, Posts.id)
+            .limit(batch_size)
+            .all())
+    if not rows:
+        return 0
+    ids = [row.id for row in rows]
+    # Copied and deleted in one transaction, so a post is never in both tables
+    names = [column.name for column in Posts.__table__.columns]
+    db.session.execute(insert(ArchivedPosts.__table__).from_select(
+        names, select(*[Posts.__table__.c[name] for name in names]).where(Posts.id.in_(ids))))
+    # Archived posts are read-only, their revisions go
+    db.session.execute(delete(PostRevisions).where(PostRevisions.post_id.in_(ids)))
+    db.session.execute(delete(Posts).where(Posts.id.in_(ids)))
+
+    hot = search_index()
+    if hot.index_updates is not None:
+        for id in ids:
+            hot.remove_post(id)
+    # The memory backend only updates this process; web workers load the
+    # archive index from the table on its first search
+    search_index(archive=True).index_posts(
+        ArchivedPosts.query.filter(ArchivedPosts.id.in_(ids), ArchivedPosts.live()))
+    db.session.commit()
+
+    posters = {row.poster_id for row in rows if row.poster_id is not None}
+    page_cache.invalidate(*['post:%d' % id for id in ids], *['author-posts:%d' % poster for poster in posters])
+    return len(ids)
@@ -0,0 +1,5 @@
+from aio import AsyncApp
+from hello import create_app
+
+# Entry point for ASGI servers, e.g. `uvicorn --workers 4 asgi:app`
+app = AsyncApp(create_app({'MIGRATE_ENABLED': False}))
@@ -0,0 +1,224 @@
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import re
+from flask import abort, request
+from werkzeug.security import safe_join
+from werkzeug.utils import send_file
+
+# Static asset pipeline
+#
+# url_for('static') puts a content hash into the file name
+# (css/style.3f2a9c1d0b7e.css), so browsers may keep those responses forever:
+# a changed file gets a new URL. `flask build-assets` records the hashes in a
+# manifest and writes gzip (and, with the brotli package, brotli) copies of
+# the text assets; files missing from it, or changed since, are hashed on
+# first use and served without a precompressed copy. The static view serves
+# the precompressed copy the client accepts, answers conditional GETs from
+# the content-hash ETag, and with STATIC_SENDFILE leaves the file transfer
+# to the front server:
+#
+#     location /_static/ {            # STATIC_SENDFILE=x-accel-redirect
+#         internal;
+#         alias /srv/flaskblogger/static/;
+#         gzip_static on;
+#         brotli_static on;
+#     }
+
+HASH_LENGTH = 12
+FINGERPRINTED = re.compile(r"^(.*)\.([0-9a-f]{%d})(\.[^./]+)$" % HASH_LENGTH)
+# Uploads and their variants are named after their sha256 already (images.py)
+CONTENT_ADDRESSED = re.compile(r"(?:^|/)([0-9a-f]{64}(?:_\d+)?)\.[^./]+$")
+COMPRESSIBLE = (".css", ".js", ".svg", ".json", ".txt", ".xml", ".html")
+# In order of preference
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+MIN_COMPRESS_SIZE = 256
+
+
+def brotli_module():
+    # brotli is optional; without it only gzip copies are written
+    try:
+        import brotli
+    except ImportError:
+        return None
+    return brotli
+
+
+def file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(64 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def fingerprinted_name(filename, digest):
+    root, extension = os.path.splitext(filename)
+    return "%s.%s%s" % (root, digest[:HASH_LENGTH], extension)
+
+
+def compress(path):
+    """Write the precompressed copies of ``path`` and return their encodings."""
+    with open(path, "rb") as f:
+        data = f.read()
+    outputs = {"gzip": gzip.compress(data, 9, mtime=0)}
+    brotli = brotli_module()
+    if brotli is not None:
+        outputs["br"] = brotli.compress(data, quality=11)
+
+    kept = []
+    for encoding, suffix in ENCODINGS:
+        output = outputs.get(encoding)
+        if output is not None and len(output) < len(data):
+            with open(path + suffix + ".tmp", "wb") as f:
+                f.write(output)
+            os.replace(path + suffix + ".tmp", path + suffix)
+            kept.append(encoding)
+        elif os.path.exists(path + suffix):
+            # Left over from an earlier build
+            os.remove(path + suffix)
+    return kept
+
+
+class Assets:
+    def __init__(self, app=None):
+        self.manifest = None
+        self.digests = {}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('STATIC_FINGERPRINT', True)
+        app.config.setdefault('STATIC_MANIFEST', os.path.join(app.instance_path, 'static-manifest.json'))
+        app.config.setdefault('STATIC_MAX_AGE', 365 * 24 * 3600)
+        # None, 'x-sendfile' (Apache, lighttpd) or 'x-accel-redirect' (nginx)
+        app.config.setdefault('STATIC_SENDFILE', None)
+        app.config.setdefault('STATIC_ACCEL_PREFIX', '/_static/')
+        self.app = app
+        self.manifest = None
+        self.digests = {}
+        app.extensions['assets'] = self
+        if app.has_static_folder:
+            app.url_defaults(self.url_defaults)
+            app.view_functions['static'] = self.send_static
+
+    def get_manifest(self):
+        if self.manifest is None:
+            try:
+                with open(self.app.config['STATIC_MANIFEST']) as f:
+                    self.manifest = json.load(f)
+            except (OSError, ValueError):
+                self.manifest = {}
+        return self.manifest
+
+    def lookup(self, filename):
+        """(content hash, precompressed encodings) of a static file, None if there is none."""
+        path = safe_join(self.app.static_folder, filename)
+        try:
+            stat = os.stat(path) if path and os.path.isfile(path) else None
+        except OSError:
+            stat = None
+        if stat is None:
+            return None
+        mtime = stat.st_mtime_ns
+
+        entry = self.get_manifest().get(filename)
+        # A file changed since `flask build-assets` must not be served under
+        # its old hash, nor from its outdated .gz/.br copies
+        if entry is not None and entry.get('mtime') == mtime and entry.get('size') == stat.st_size:
+            return entry['hash'], entry['encodings']
+        cached = self.digests.get(filename)
+        if cached is None or cached[0] != mtime:
+            # Not in the manifest: hashed here, and any .gz/.br copy may be
+            # stale, so only the original is served
+            match = CONTENT_ADDRESSED.search(filename)
+            cached = self.digests[filename] = (mtime, match.group(1) if match else file_digest(path), [])
+        return cached[1], cached[2]
+
+    def url_defaults(self, endpoint, values):
+        if endpoint != 'static' or not self.app.config['STATIC_FINGERPRINT']:
+            return
+        filename = values.get('filename')
+        if not filename or CONTENT_ADDRESSED.search(filename) or not os.path.splitext(filename)[1]:
+            return
+        found = self.lookup(filename)
+        if found is not None:
+            values['filename'] = fingerprinted_name(filename, found[0])
+
+    def send_static(self, filename):
+        found = None
+        immutable = bool(CONTENT_ADDRESSED.search(filename))
+        match = FINGERPRINTED.match(filename)
+        if match:
+            original = match.group(1) + match.group(3)
+            found = self.lookup(original)
+            if found is not None:
+                # An outdated hash still gets the current file, just not for good
+                immutable = found[0].startswith(match.group(2))
+                filename = original
+        if found is None:
+            found = self.lookup(filename)
+        if found is None:
+            abort(404)
+        digest, encodings = found
+
+        config = self.app.config
+        mode = config['STATIC_SENDFILE']
+        encoding = None
+        if mode != 'x-accel-redirect':
+            # nginx picks the precompressed copy itself (gzip_static/brotli_static)
+            encoding = next((name for name in encodings if request.accept_encodings[name]), None)
+        path = safe_join(self.app.static_folder, filename)
+        if encoding:
+            path += dict(ENCODINGS)[encoding]
+
+        response = send_file(path, request.environ,
+                             mimetype=mimetypes.guess_type(filename)[0] or 'application/octet-stream',
+                             etag=digest if encoding is None else "%s-%s" % (digest, encoding),
+                             use_x_sendfile=mode is not None,
+                             response_class=self.app.response_class)
+        if mode == 'x-accel-redirect':
+            del response.headers['X-Sendfile']
+            response.headers['X-Accel-Redirect'] = config['STATIC_ACCEL_PREFIX'] + filename
+        if encoding:
+            response.content_encoding = encoding
+        if encodings or filename.endswith(COMPRESSIBLE):
+            response.vary.add('Accept-Encoding')
+
+        if immutable:
+            response.cache_control.no_cache = None
+            response.cache_control.public = True
+            response.cache_control.max_age = config['STATIC_MAX_AGE']
+            response.cache_control.immutable = True
+        else:
+            # Cheap to revalidate: a 304 from the ETag
+            response.cache_control.no_cache = True
+        return response
+
+    def build(self):
+        """Hash every static file, precompress the text assets and write the manifest."""
+        static = self.app.static_folder
+        suffixes = tuple(suffix for encoding, suffix in ENCODINGS)
+        manifest = {}
+        for directory, dirs, files in os.walk(static):
+            for name in sorted(files):
+                path = os.path.join(directory, name)
+                filename = os.path.relpath(path, static).replace(os.sep, '/')
+                if name.startswith('.') or name.endswith(suffixes) or CONTENT_ADDRESSED.search(filename):
+                    continue
+                stat = os.stat(path)
+                encodings = []
+                if name.endswith(COMPRESSIBLE) and stat.st_size >= MIN_COMPRESS_SIZE:
+                    encodings = compress(path)
+                manifest[filename] = {'hash': file_digest(path), 'encodings': encodings,
+                                      'mtime': stat.st_mtime_ns, 'size': stat.st_size}
+
+        path = self.app.config['STATIC_MANIFEST']
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + ".tmp", "w") as f:
+            json.dump(manifest, f, indent=1, sort_keys=True)
+        os.replace(path + ".tmp", path)
+        self.manifest = manifest
+        return manifest
@@ -0,0 +1,372 @@
+"""Route benchmark and load test.
+
+Seeds a SQLite database with a reproducible set of users and posts, then
+drives the main routes through the Flask test client and through a threaded
+WSGI server, and reports throughput, p50/p95/p99 latency and SQL queries per
+request for each route. Results are written as JSON and can be compared
+with an earlier run to catch regressions.
+
+    python benchmarks/routes.py --users 10000 --posts 1000000 --output baseline.json
+    python benchmarks/routes.py --baseline baseline.json --tolerance 0.15
+    python benchmarks/routes.py --url http://127.0.0.1:8000   # a running gunicorn
+
+Seeded databases are kept in --data-dir and reused by later runs with the
+same volumes and seed. The add-post route writes, so every run adds a few
+posts to the seeded database.
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+from urllib.parse import urlencode, urlsplit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+PASSWORD = "benchmark-password"
+WORDS = ("python flask query index cache engine template render worker thread pool "
+         "socket commit session cursor latency replica schema migration search "
+         "garden coffee travel music recipe bicycle mountain river winter summer").split()
+
+
+def percentile(samples, fraction):
+    # Nearest-rank percentile of an already sorted list
+    if not samples:
+        return 0.0
+    return samples[min(len(samples) - 1, int(round(fraction * (len(samples) - 1))))]
+
+
+def summarize(latencies, elapsed, queries, errors):
+    latencies = sorted(latencies)
+    count = len(latencies)
+    return {
+        'requests': count,
+        'errors': errors,
+        'throughput_rps': count / elapsed if elapsed else 0.0,
+        'mean_ms': statistics.mean(latencies) * 1000 if latencies else 0.0,
+        'p50_ms': percentile(latencies, 0.50) * 1000,
+        'p95_ms': percentile(latencies, 0.95) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+        'queries_per_request': queries / count if count and queries is not None else None,
+    }
+
+
+class QueryCounter:
+    """Counts statements sent by every engine in this process."""
+
+    def __init__(self):
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, *args):
+        with self.lock:
+            self.count += 1
+
+    def install(self):
+        from sqlalchemy import event
+        from sqlalchemy.engine import Engine
+        event.listen(Engine, 'after_cursor_execute', self)
+
+
+def make_app(database_path, page_cache):
+    from hello import create_app
+    return create_app({
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + database_path,
+        'SECRET_KEY': 'benchmark',
+        'WTF_CSRF_ENABLED': False,
+        'MIGRATE_ENABLED': False,
+        'SEARCH_BACKEND': 'sqlite',
+        'PAGE_CACHE_BACKEND': page_cache,
+    })
+
+
+def seed(app, users, posts, rng, batch_size=10000):
+    """Fill an empty database; every user gets the same password."""
+    from sqlalchemy import insert, text
+    from extensions import db, passwords
+    from models import Posts, Users
+    from postprocess import make_excerpt, reading_time
+    from search import strip_html
+
+    with app.app_context():
+        db.create_all()
+        db.session.execute(text("CREATE VIRTUAL TABLE IF NOT EXISTS posts_fts USING fts5(title, content)"))
+        password_hash = passwords.hash(PASSWORD)
+        start = datetime(2020, 1, 1)
+
+        rows = []
+        for i in range(1, users + 1):
+            rows.append({'id': i, 'username': 'user%d' % i, 'name': 'User %d' % i,
+                         'email': 'user%d@example.com' % i, 'favorite_color': rng.choice(WORDS),
+                         'date_added': start + timedelta(minutes=i), 'password_hash': password_hash})
+            if len(rows) == batch_size or i == users:
+                db.session.execute(insert(Users), rows)
+                rows = []
+
+        for i in range(1, posts + 1):
+            title = " ".join(rng.choice(WORDS) for n in range(rng.randint(3, 7))).capitalize()
+            content = "<p>%s</p>" % " ".join(rng.choice(WORDS) for n in range(rng.randint(50, 400)))
+            body = strip_html(content)
+            rows.append({'id': i, 'title': title, 'content': content, 'content_html': content,
+                         'excerpt': make_excerpt(body), 'reading_time': reading_time(body),
+                         'date_posted': start + timedelta(seconds=i * 30), 'slug': 'post-%d' % i,
+                         'poster_id': rng.randint(1, users)})
+            if len(rows) == batch_size or i == posts:
+                db.session.execute(insert(Posts), rows)
+                db.session.execute(text("INSERT INTO posts_fts (rowid, title, content) VALUES (:id, :title, :body)"),
+                                   [{'id': row['id'], 'title': row['title'], 'body': strip_html(row['content'])}
+                                    for row in rows])
+                db.session.commit()
+                rows = []
+                print("seeded %d/%d posts" % (i, posts), file=sys.stderr)
+        db.session.execute(text("ANALYZE"))
+        db.session.commit()
+
+
+def sample_posts(app, count, rng):
+    from extensions import db
+    from models import Posts
+    with app.app_context():
+        top = db.session.query(db.func.max(Posts.id)).scalar()
+        ids = [rng.randint(1, top) for i in range(count)]
+        return db.session.query(Posts.id, Posts.date_posted).filter(Posts.id.in_(ids)).all()
+
+
+def scenarios(users, posts, rng):
+    """(name, method, needs login, request factory) for every benchmarked route."""
+    from pagination import encode_cursor
+    counter = iter(range(10 ** 9))
+    # Slugs must stay unique across runs against the same database
+    run = int(time.time())
+
+    def feed():
+        if rng.random() < 0.5:
+            return '/posts', None
+        post = rng.choice(posts)
+        return '/posts?' + urlencode({'after': encode_cursor(post.date_posted, post.id)}), None
+
+    def login():
+        return '/login', {'username': 'user%d' % rng.randint(1, users), 'password': PASSWORD}
+
+    def add_post():
+        n = next(counter)
+        return '/add-post', {'title': 'Benchmark post %d' % n, 'slug': 'benchmark-%d-%d' % (run, n),
+                             'content': '<p>%s</p>' % " ".join(rng.choice(WORDS) for i in range(100))}
+
+    return [
+        ('feed', 'GET', False, feed),
+        ('post', 'GET', False, lambda: ('/posts/%d' % rng.choice(posts).id, None)),
+        ('search', 'GET', False, lambda: ('/search?' + urlencode({'searched': rng.choice(WORDS)}), None)),
+        ('login', 'POST', False, login),
+        ('add-post', 'POST', True, add_post),
+        ('dashboard', 'GET', True, lambda: ('/dashboard', None)),
+    ]
+
+
+def run_test_client(app, routes, requests, queries):
+    results = {}
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = '1'
+    anonymous = app.test_client()
+    for name, method, needs_login, make_request in routes:
+        browser = client if needs_login else anonymous
+        latencies, errors = [], 0
+        queries.count = 0
+        started = time.perf_counter()
+        for i in range(requests):
+            path, form = make_request()
+            begin = time.perf_counter()
+            response = browser.open(path, method=method, data=form)
+            latencies.append(time.perf_counter() - begin)
+            errors += response.status_code >= 400
+        results[name] = summarize(latencies, time.perf_counter() - started, queries.count, errors)
+    return results
+
+
+class HTTPClient:
+    """Keep-alive connection that remembers the session cookie."""
+
+    def __init__(self, url):
+        parts = urlsplit(url)
+        self.connection = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=60)
+        self.cookie = None
+
+    def request(self, method, path, form=None):
+        headers = {}
+        body = None
+        if form is not None:
+            body = urlencode(form)
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        if self.cookie:
+            headers['Cookie'] = self.cookie
+        self.connection.request(method, path, body, headers)
+        response = self.connection.getresponse()
+        response.read()
+        cookie = response.getheader('Set-Cookie')
+        if cookie:
+            self.cookie = cookie.split(';', 1)[0]
+        return response.status
+
+    def login(self):
+        self.request('POST', '/login', {'username': 'user1', 'password': PASSWORD})
+
+
+def run_http(url, routes, requests, concurrency, queries):
+    results = {}
+    for name, method, needs_login, make_request in routes:
+        clients = [HTTPClient(url) for i in range(concurrency)]
+        if needs_login:
+            for client in clients:
+                client.login()
+        # The request factories share one Random, so build the work list up front
+        work = [make_request() for i in range(requests)]
+        latencies, errors = [], [0]
+        lock = threading.Lock()
+
+        def worker(client, jobs):
+            for path, form in jobs:
+                begin = time.perf_counter()
+                try:
+                    failed = client.request(method, path, form) >= 400
+                except (OSError, http.client.HTTPException):
+                    failed = True
+                elapsed = time.perf_counter() - begin
+                with lock:
+                    latencies.append(elapsed)
+                    errors[0] += failed
+
+        threads = [threading.Thread(target=worker, args=(client, work[i::concurrency]))
+                   for i, client in enumerate(clients)]
+        if queries is not None:
+            queries.count = 0
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+        results[name] = summarize(latencies, elapsed, queries.count if queries is not None else None, errors[0])
+    return results
+
+
+def serve(app):
+    # Werkzeug's threaded server on a free port, in a background thread
+    import logging
+    from werkzeug.serving import make_server
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+def compare(results, baseline, tolerance):
+    """Return the metrics that got worse than ``baseline`` by more than ``tolerance``."""
+    regressions = []
+    for mode, routes in results['modes'].items():
+        for name, current in routes.items():
+            previous = baseline.get('modes', {}).get(mode, {}).get(name)
+            if previous is None:
+                continue
+            for metric in ('p50_ms', 'p95_ms', 'p99_ms'):
+                if previous[metric] and current[metric] > previous[metric] * (1 + tolerance):
+                    regressions.append("%s %s %s: %.1f -> %.1f" % (mode, name, metric, previous[metric], current[metric]))
+            if previous['throughput_rps'] and current['throughput_rps'] < previous['throughput_rps'] * (1 - tolerance):
+                regressions.append("%s %s throughput_rps: %.1f -> %.1f" % (mode, name, previous['throughput_rps'],
+                                                                           current['throughput_rps']))
+            if (previous.get('queries_per_request') is not None and current.get('queries_per_request') is not None
+                    and current['queries_per_request'] > previous['queries_per_request']):
+                regressions.append("%s %s queries_per_request: %.1f -> %.1f" % (
+                    mode, name, previous['queries_per_request'], current['queries_per_request']))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--posts", type=int, default=20000)
+    parser.add_argument("--seed", type=int, default=1, help="random seed for the data and the request mix")
+    parser.add_argument("--data-dir", default=os.path.join(ROOT, "instance", "benchmarks"))
+    parser.add_argument("--requests", type=int, default=200, help="requests per route and mode")
+    parser.add_argument("--concurrency", type=int, default=8, help="client threads against the server")
+    parser.add_argument("--page-cache", default="none", help="PAGE_CACHE_BACKEND while benchmarking")
+    parser.add_argument("--routes", help="comma separated subset of feed,post,search,login,add-post,dashboard")
+    parser.add_argument("--url", help="benchmark an already running server instead of starting one")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="earlier results to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="allowed slowdown against the baseline")
+    args = parser.parse_args()
+
+    os.chdir(ROOT)
+    os.makedirs(args.data_dir, exist_ok=True)
+    database_path = os.path.join(args.data_dir, "bench-%d-%d-%d.db" % (args.users, args.posts, args.seed))
+    rng = random.Random(args.seed)
+    app = make_app(database_path, args.page_cache)
+    if not os.path.exists(database_path + ".done"):
+        if os.path.exists(database_path):
+            os.remove(database_path)
+        seed(app, args.users, args.posts, rng)
+        open(database_path + ".done", "w").close()
+
+    queries = QueryCounter()
+    queries.install()
+    routes = scenarios(args.users, sample_posts(app, 1000, rng), rng)
+    if args.routes:
+        wanted = args.routes.split(",")
+        routes = [route for route in routes if route[0] in wanted]
+
+    results = {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'python': sys.version.split()[0],
+        'users': args.users,
+        'posts': args.posts,
+        'seed': args.seed,
+        'requests': args.requests,
+        'concurrency': args.concurrency,
+        'page_cache': args.page_cache,
+        'modes': {},
+    }
+    if args.url:
+        results['modes']['external'] = run_http(args.url, routes, args.requests, args.concurrency, None)
+    else:
+        results['modes']['test_client'] = run_test_client(app, routes, args.requests, queries)
+        server = serve(app)
+        try:
+            url = "http://127.0.0.1:%d" % server.server_port
+            results['modes']['wsgi_server'] = run_http(url, routes, args.requests, args.concurrency, queries)
+        finally:
+            server.shutdown()
+
+    for mode, routes in results['modes'].items():
+        print("%s:" % mode)
+        for name, stats in routes.items():
+            qpr = stats['queries_per_request']
+            print("  %-10s %8.1f req/s  p50 %7.1f  p95 %7.1f  p99 %7.1f ms  %s queries/req  %d errors" % (
+                name, stats['throughput_rps'], stats['p50_ms'], stats['p95_ms'], stats['p99_ms'],
+                "%.1f" % qpr if qpr is not None else "-", stats['errors']))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+            f.write("\n")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print("Regressions against %s:" % args.baseline)
+            for line in regressions:
+                print("  " + line)
+            sys.exit(1)
+        print("No regressions against %s" % args.baseline)
+
+
+if __name__ == "__main__":
+    main()
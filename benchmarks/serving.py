@@ -0,0 +1,141 @@
+"""Sync (WSGI) against async (ASGI) serving benchmark.
+
+Starts gunicorn with sync workers on wsgi:app and with uvicorn workers on
+asgi:app, with the same number of processes and the same seeded database,
+and drives the anonymous read routes (feed, post, search) at increasing
+numbers of concurrent connections. Reports throughput and p50/p95/p99
+latency per mode, route and concurrency level.
+
+    python benchmarks/serving.py --posts 100000 --concurrency 1,16,64
+    python benchmarks/serving.py --workers 4 --output serving.json
+
+Needs gunicorn, uvicorn, asgiref and aiosqlite. The data set is seeded
+and cached exactly like benchmarks/routes.py does.
+"""
+import argparse
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from routes import ROOT, make_app, run_http, sample_posts, scenarios, seed  # noqa: E402
+
+ROUTES = ('feed', 'post', 'search')
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def server_command(mode, port, workers):
+    # Both modes run under gunicorn, so they share the process model and
+    # socket handling and differ only in the worker class
+    worker_class = 'sync' if mode == 'wsgi' else 'uvicorn.workers.UvicornWorker'
+    module = 'wsgi:app' if mode == 'wsgi' else 'asgi:app'
+    return [sys.executable, '-m', 'gunicorn', '--worker-class', worker_class, '--workers', str(workers),
+            '--bind', '127.0.0.1:%d' % port, '--log-level', 'warning', module]
+
+
+def start_server(mode, workers, env, timeout=30):
+    port = free_port()
+    process = subprocess.Popen(server_command(mode, port, workers), cwd=ROOT, env=env)
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("%s server exited with status %d" % (mode, process.returncode))
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return process, "http://127.0.0.1:%d" % port
+        except OSError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError("%s server did not start within %ds" % (mode, timeout))
+
+
+def stop_server(process):
+    process.terminate()
+    try:
+        process.wait(10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--posts", type=int, default=20000)
+    parser.add_argument("--seed", type=int, default=1, help="random seed for the data and the request mix")
+    parser.add_argument("--data-dir", default=os.path.join(ROOT, "instance", "benchmarks"))
+    parser.add_argument("--requests", type=int, default=500, help="requests per route, mode and concurrency")
+    parser.add_argument("--concurrency", default="1,8,32,64", help="comma separated connection counts")
+    parser.add_argument("--workers", type=int, default=2, help="server processes in both modes")
+    parser.add_argument("--page-cache", default="none", help="PAGE_CACHE_BACKEND of the servers")
+    parser.add_argument("--modes", default="wsgi,asgi")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    args = parser.parse_args()
+
+    os.chdir(ROOT)
+    os.makedirs(args.data_dir, exist_ok=True)
+    database_path = os.path.join(args.data_dir, "bench-%d-%d-%d.db" % (args.users, args.posts, args.seed))
+    rng = random.Random(args.seed)
+    app = make_app(database_path, args.page_cache)
+    if not os.path.exists(database_path + ".done"):
+        if os.path.exists(database_path):
+            os.remove(database_path)
+        seed(app, args.users, args.posts, rng)
+        open(database_path + ".done", "w").close()
+    posts = sample_posts(app, 1000, rng)
+
+    env = dict(os.environ,
+               DATABASE_URL='sqlite:///' + database_path,
+               APP_KEY='benchmark',
+               SEARCH_BACKEND='sqlite',
+               PAGE_CACHE_BACKEND=args.page_cache)
+    levels = [int(level) for level in args.concurrency.split(",")]
+    results = {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'python': sys.version.split()[0],
+        'users': args.users,
+        'posts': args.posts,
+        'seed': args.seed,
+        'requests': args.requests,
+        'workers': args.workers,
+        'page_cache': args.page_cache,
+        'modes': {},
+    }
+    for mode in args.modes.split(","):
+        process, url = start_server(mode, args.workers, env)
+        try:
+            results['modes'][mode] = {}
+            for level in levels:
+                # Same request mix for every mode at a given level
+                routes = [route for route in scenarios(args.users, posts, random.Random(args.seed + level))
+                          if route[0] in ROUTES]
+                results['modes'][mode][str(level)] = run_http(url, routes, args.requests, level, None)
+        finally:
+            stop_server(process)
+
+    for level in levels:
+        print("%d concurrent connections:" % level)
+        for name in ROUTES:
+            for mode, by_level in results['modes'].items():
+                stats = by_level[str(level)][name]
+                print("  %-6s %-4s %8.1f req/s  p50 %7.1f  p95 %7.1f  p99 %7.1f ms  %d errors" % (
+                    name, mode, stats['throughput_rps'], stats['p50_ms'], stats['p95_ms'], stats['p99_ms'],
+                    stats['errors']))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+            f.write("\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""Worker startup benchmark.
+
+Measures, in fresh interpreters, how long importing the app module, running
+create_app() and serving the first request take, and how much memory forked
+workers keep sharing with a preloaded parent (as gunicorn --preload does).
+
+    python benchmarks/startup.py --runs 10 --workers 4 --output startup.json
+    python benchmarks/startup.py --freeze      # gc.freeze() before forking
+"""
+import argparse
+import gc
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Same as wsgi.py, with an in-memory database
+CONFIG = {'SQLALCHEMY_DATABASE_URI': 'sqlite://', 'SECRET_KEY': 'benchmark', 'PAGE_CACHE_BACKEND': 'none',
+          'MIGRATE_ENABLED': False}
+
+COLD_START = """
+import json, sys, time
+start = time.perf_counter()
+from hello import create_app
+imported = time.perf_counter()
+app = create_app(%r)
+created = time.perf_counter()
+with app.app_context():
+    from extensions import db
+    db.create_all()
+app.test_client().get('/')
+served = time.perf_counter()
+json.dump({'import_ms': (imported - start) * 1000,
+           'create_app_ms': (created - imported) * 1000,
+           'first_request_ms': (served - created) * 1000,
+           'modules': len(sys.modules)}, sys.stdout)
+""" % CONFIG
+
+
+def cold_start(runs):
+    samples = []
+    for i in range(runs):
+        out = subprocess.run([sys.executable, "-c", COLD_START], cwd=ROOT, check=True,
+                             capture_output=True, text=True).stdout
+        samples.append(json.loads(out))
+    return {key: statistics.median(sample[key] for sample in samples) for key in samples[0]}
+
+
+def memory_kb():
+    # Proportional, private and shared memory of this process from smaps_rollup
+    values = {}
+    with open("/proc/self/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) >= 3 and parts[2] == "kB":
+                values[parts[0].rstrip(":")] = int(parts[1])
+    return {
+        'pss_kb': values.get('Pss', 0),
+        'private_kb': values.get('Private_Clean', 0) + values.get('Private_Dirty', 0),
+        'shared_kb': values.get('Shared_Clean', 0) + values.get('Shared_Dirty', 0),
+    }
+
+
+def fork_sharing(workers, requests, freeze):
+    sys.path.insert(0, ROOT)
+    os.chdir(ROOT)
+    from hello import create_app
+    from extensions import db
+
+    app = create_app(CONFIG)
+    with app.app_context():
+        db.create_all()
+    app.test_client().get('/')
+    if freeze:
+        # Move everything allocated so far out of the GC's reach so that
+        # collections in the children do not touch (and copy) shared pages
+        gc.freeze()
+
+    results = []
+    for i in range(workers):
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_fd)
+            client = app.test_client()
+            for n in range(requests):
+                client.get('/')
+                client.get('/posts')
+            os.write(write_fd, json.dumps(memory_kb()).encode())
+            os._exit(0)
+        os.close(write_fd)
+        with os.fdopen(read_fd) as pipe:
+            results.append(json.loads(pipe.read()))
+        os.waitpid(pid, 0)
+
+    return {key: statistics.mean(result[key] for result in results) for key in results[0]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="fresh interpreters to time")
+    parser.add_argument("--workers", type=int, default=4, help="children forked from the preloaded app")
+    parser.add_argument("--requests", type=int, default=50, help="requests each child serves before measuring")
+    parser.add_argument("--freeze", action="store_true", help="call gc.freeze() before forking")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    args = parser.parse_args()
+
+    results = {'cold_start': cold_start(args.runs)}
+    if sys.platform.startswith("linux"):
+        results['forked_worker'] = fork_sharing(args.workers, args.requests, args.freeze)
+        results['forked_worker']['gc_freeze'] = args.freeze
+
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
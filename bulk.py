@@ -0,0 +1,156 @@
+import csv
+import json
+from datetime import datetime
+from types import SimpleNamespace
+from sqlalchemy import insert
+from extensions import db, page_cache, search_index
+from models import ArchivedPosts, Posts, Users, refresh_author_stats
+from postprocess import make_excerpt, reading_time, sanitize_html
+from slugs import candidate_slugs, slugify
+
+# Bulk post import and export
+#
+# Records are flat dicts with the FIELDS below, stored one JSON object per
+# line or as CSV with a header row. Imports insert a whole chunk of posts
+# with one executemany INSERT in one transaction, and look up every author
+# of the chunk with a single query.
+
+FIELDS = ('title', 'slug', 'content', 'date_posted', 'author', 'author_name', 'author_email')
+FORMATS = ('jsonl', 'csv')
+
+
+def read_records(f, format):
+    if format == 'csv':
+        yield from csv.DictReader(f)
+    else:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def write_records(f, format, records):
+    if format == 'csv':
+        writer = csv.DictWriter(f, FIELDS)
+        writer.writeheader()
+        for record in records:
+            writer.writerow(record)
+    else:
+        for record in records:
+            f.write(json.dumps(record) + '\n')
+
+
+def export_records(batch_size=1000):
+    """Every live post with its author, archived ones first, read a batch at a time."""
+    for model in (ArchivedPosts, Posts):
+        rows = (db.session.query(model.title, model.slug, model.content, model.date_posted,
+                                 Users.username, Users.name, Users.email)
+                .outerjoin(Users, model.poster_id == Users.id)
+                .filter(model.live())
+                .order_by(model.id)
+                .yield_per(batch_size))
+        for row in rows:
+            record = dict(zip(FIELDS, row))
+            if record['date_posted'] is not None:
+                record['date_posted'] = record['date_posted'].isoformat()
+            yield record
+
+
+def chunks(records, size):
+    chunk = []
+    for record in records:
+        chunk.append(record)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def resolve_authors(chunk):
+    """Map the chunk's usernames to user ids, creating unknown authors.
+
+    Authors missing from the database are created when the record carries
+    an author_email; they have no password until they reset it.
+    """
+    usernames = {record['author'] for record in chunk if record.get('author')}
+    if not usernames:
+        return {}, 0
+    ids = dict(db.session.query(Users.username, Users.id).filter(Users.username.in_(usernames)))
+
+    new_users = {}
+    for record in chunk:
+        username = record.get('author')
+        if username and username not in ids and username not in new_users and record.get('author_email'):
+            new_users[username] = {'username': username,
+                                   'name': record.get('author_name') or username,
+                                   'email': record['author_email']}
+    if new_users:
+        db.session.execute(insert(Users), list(new_users.values()))
+        ids.update(db.session.query(Users.username, Users.id).filter(Users.username.in_(new_users)))
+    return ids, len(new_users)
+
+
+def resolve_slugs(bases, attempts=50):
+    """Pick a free slug for each base, numbering the ones already taken."""
+    chosen = [None] * len(bases)
+    pending = {i: candidate_slugs(base, attempts) for i, base in enumerate(bases)}
+    used = set()
+    while pending:
+        candidates = {}
+        for i, candidate in list(pending.items()):
+            slug = next(candidate, None)
+            if slug is None:
+                raise ValueError("No free slug left for %r" % bases[i])
+            candidates[i] = slug
+        # One query per round; most chunks need a single round
+        wanted = set(candidates.values())
+        taken = {slug for model in (Posts, ArchivedPosts)
+                 for (slug,) in db.session.query(model.slug).filter(model.slug.in_(wanted))}
+        for i, slug in candidates.items():
+            if slug not in taken and slug not in used:
+                chosen[i] = slug
+                used.add(slug)
+                del pending[i]
+    return chosen
+
+
+def import_chunk(chunk):
+    """Insert one chunk of records in a single transaction.
+
+    Returns (posts imported, authors created, posts without a known author).
+    """
+    try:
+        author_ids, created = resolve_authors(chunk)
+        slugs = resolve_slugs([slugify(record.get('slug')) or slugify(record.get('title')) or 'post'
+                               for record in chunk])
+        rows = []
+        orphans = 0
+        for record, slug in zip(chunk, slugs):
+            html, text = sanitize_html(record.get('content'))
+            poster_id = author_ids.get(record.get('author'))
+            orphans += poster_id is None
+            rows.append({
+                'title': record.get('title') or '',
+                'content': record.get('content') or '',
+                'content_html': html,
+                'excerpt': make_excerpt(text),
+                'reading_time': reading_time(text),
+                'date_posted': (datetime.fromisoformat(record['date_posted'])
+                                if record.get('date_posted') else datetime.utcnow()),
+                'slug': slug,
+                'poster_id': poster_id,
+            })
+        db.session.execute(insert(Posts), rows)
+
+        # Read the new ids back by slug for the search index
+        ids = dict(db.session.query(Posts.slug, Posts.id).filter(Posts.slug.in_(slugs)))
+        search_index().index_posts([SimpleNamespace(id=ids[row['slug']], title=row['title'], content=row['content'])
+                                    for row in rows])
+        posters = {row['poster_id'] for row in rows if row['poster_id'] is not None}
+        refresh_author_stats(posters)
+        db.session.commit()
+    except BaseException:
+        db.session.rollback()
+        raise
+    page_cache.invalidate('feed:head', *['author-posts:%d' % id for id in posters])
+    return len(rows), created, orphans
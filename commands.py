@@ -0,0 +1,273 @@
+import json
+import os
+import sys
+from datetime import datetime, timedelta
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import func
+from sqlalchemy.exc import SQLAlchemyError
+from archive import archive_batch
+from assets import brotli_module
+from bulk import FORMATS, chunks, export_records, import_chunk, read_records, write_records
+from extensions import assets, db, jobs, page_cache, search_index, templating
+from models import ArchivedPosts, PostRevisions, Posts, Users, author_stats_subqueries, refresh_author_stats
+from pagination import encode_cursor
+from passwords import calibrate
+from postprocess import process_post
+from query_plans import check
+from revisions import latest, prune, prune_drafts
+from search import tokenize
+
+# Flask CLI commands, registered by create_app()
+
+@click.command('reindex-search')
+@with_appcontext
+def reindex_search():
+    search_index().rebuild(Posts.query.filter(Posts.live()).yield_per(500))
+    search_index(archive=True).rebuild(ArchivedPosts.query.filter(ArchivedPosts.live()).yield_per(500))
+    print("Search indexes rebuilt")
+
+@click.command('backfill-posts')
+@click.option('--batch-size', default=500, help='Posts processed per transaction.')
+@with_appcontext
+def backfill_posts(batch_size):
+    # Walk the table by primary key so every batch is a short index range
+    last_id = 0
+    done = 0
+    while True:
+        batch = Posts.query.filter(Posts.id > last_id).order_by(Posts.id).limit(batch_size).all()
+        if not batch:
+            break
+        for post in batch:
+            process_post(post)
+        db.session.commit()
+        last_id = batch[-1].id
+        done += len(batch)
+        print("Processed %d posts" % done)
+        db.session.expunge_all()
+
+@click.command('archive-posts')
+@click.option('--older-than', type=int, help='Age in days, POST_ARCHIVE_DAYS by default.')
+@click.option('--batch-size', default=500, help='Posts moved per transaction.')
+@with_appcontext
+def archive_posts(older_than, batch_size):
+    # Safe to interrupt and run again: every batch is moved in one transaction
+    cutoff = datetime.utcnow() - timedelta(days=older_than or current_app.config['POST_ARCHIVE_DAYS'])
+    done = 0
+    while True:
+        moved = archive_batch(cutoff, batch_size)
+        if not moved:
+            break
+        done += moved
+        print("Archived %d posts" % done)
+        db.session.expunge_all()
+    print("Done: %d posts posted before %s are in the archive" % (done, cutoff.date()))
+
+@click.command('prune-revisions')
+@click.option('--keep', type=int, help='Revisions kept per post, REVISION_KEEP by default.')
+@with_appcontext
+def prune_revisions(keep):
+    # Saving a post prunes its own history; this catches up after lowering
+    # REVISION_KEEP and drops drafts of new posts that were never added
+    config = current_app.config
+    keep = config['REVISION_KEEP'] if keep is None else keep
+    removed = 0
+    if keep:
+        post_ids = [post_id for (post_id,) in db.session.query(PostRevisions.post_id)
+                    .filter(PostRevisions.post_id != None)
+                    .group_by(PostRevisions.post_id)
+                    .having(func.count(PostRevisions.id) > keep)]
+        for post_id in post_ids:
+            removed += prune(post_id, keep)
+            db.session.commit()
+    drafts = prune_drafts(config['REVISION_DRAFT_DAYS'])
+    db.session.commit()
+    print("%d revisions and %d abandoned drafts removed" % (removed, drafts))
+
+@click.command('calibrate-passwords')
+@click.option('--target-ms', default=250, help='Wanted time for one hash in milliseconds.')
+@click.option('--algorithm', type=click.Choice(['scrypt', 'pbkdf2']), default='scrypt')
+def calibrate_passwords(target_ms, algorithm):
+    method, elapsed = calibrate(target_ms, algorithm)
+    print("PASSWORD_HASH_METHOD=%s  (%.0f ms per hash on this machine)" % (method, elapsed))
+
+@click.command('reconcile-authors')
+@click.option('--batch-size', default=1000, help='Users checked per transaction.')
+@click.option('--dry-run', is_flag=True, help='Only report the users whose counters drifted.')
+@with_appcontext
+def reconcile_authors(batch_size, dry_run):
+    count, latest = author_stats_subqueries()
+    last_id = 0
+    drifted_total = 0
+    while True:
+        rows = (db.session.query(Users.id, Users.username, Users.post_count, count, Users.last_posted_at, latest)
+                .filter(Users.id > last_id)
+                .order_by(Users.id)
+                .limit(batch_size)
+                .all())
+        if not rows:
+            break
+        drifted = [row for row in rows if row[2] != row[3] or row[4] != row[5]]
+        for row in drifted:
+            print("%s: %d posts counted as %d, last posted %s recorded as %s"
+                  % (row.username, row[3], row[2], row[5], row[4]))
+        if drifted and not dry_run:
+            refresh_author_stats([row.id for row in drifted])
+            db.session.commit()
+            page_cache.invalidate(*['author:%d' % row.id for row in drifted])
+        drifted_total += len(drifted)
+        last_id = rows[-1].id
+    print("%d authors %s" % (drifted_total, "drifted" if dry_run else "repaired"))
+
+def file_format(path, format):
+    # Taken from the file extension unless given
+    if format:
+        return format
+    return 'csv' if path.endswith('.csv') else 'jsonl'
+
+@click.command('import-posts')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', type=click.Choice(FORMATS), help='Defaults to the file extension.')
+@click.option('--chunk-size', default=1000, help='Posts inserted per transaction.')
+@click.option('--restart', is_flag=True, help='Ignore the progress file of an earlier run.')
+@with_appcontext
+def import_posts(path, format, chunk_size, restart):
+    # Committed chunks are recorded in PATH.progress; running the same
+    # import again after a failure continues after the last one
+    progress_path = path + '.progress'
+    done = 0
+    if os.path.exists(progress_path) and not restart:
+        with open(progress_path) as f:
+            done = json.load(f)['records']
+        print("Resuming after %d records" % done)
+
+    totals = [0, 0, 0]
+    with open(path, newline='', encoding='utf-8') as f:
+        records = read_records(f, file_format(path, format))
+        for i in range(done):
+            next(records, None)
+        for chunk in chunks(records, chunk_size):
+            try:
+                counts = import_chunk(chunk)
+            except (ValueError, SQLAlchemyError) as e:
+                raise click.ClickException("Records %d-%d were not imported: %s\n"
+                                           "Fix the file and run the same command to resume."
+                                           % (done + 1, done + len(chunk), e))
+            done += len(chunk)
+            totals = [total + count for total, count in zip(totals, counts)]
+            with open(progress_path + '.tmp', 'w') as progress:
+                json.dump({'records': done}, progress)
+            os.replace(progress_path + '.tmp', progress_path)
+            print("Imported %d records" % done)
+
+    if os.path.exists(progress_path):
+        os.remove(progress_path)
+    print("Done: %d posts, %d new authors, %d posts without a known author" % tuple(totals))
+
+@click.command('export-posts')
+@click.argument('path', default='-')
+@click.option('--format', type=click.Choice(FORMATS), help='Defaults to the file extension, jsonl for stdout.')
+@click.option('--batch-size', default=1000, help='Rows fetched from the database at a time.')
+@with_appcontext
+def export_posts(path, format, batch_size):
+    format = file_format(path, format)
+    if path == '-':
+        write_records(sys.stdout, format, export_records(batch_size))
+        return
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        write_records(f, format, export_records(batch_size))
+
+@click.command('check-query-plans')
+@click.option('--verbose', is_flag=True, help='Print the plan of every query, not only failing ones.')
+@with_appcontext
+def check_query_plans(verbose):
+    # Read-only: pages are fetched with GET as the first user, so point
+    # DATABASE_URL at a copy with some posts to check MySQL plans
+    user = Users.query.order_by(Users.id).first()
+    post = Posts.query.order_by(Posts.date_posted.desc(), Posts.id.desc()).first()
+    if user is None or post is None:
+        raise click.ClickException("Needs at least one user and one post in the database")
+
+    client = current_app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user.id)
+
+    def page(path):
+        def run():
+            response = client.get(path)
+            if response.status_code != 200:
+                print("warning: %s returned %d" % (path, response.status_code))
+        return (path, run)
+
+    terms = tokenize(post.title) or ['post']
+    checks = [
+        page('/posts'),
+        page('/posts?after=%s' % encode_cursor(post.date_posted, post.id)),
+        page('/posts/%d' % post.id),
+        page('/user/add'),
+        page('/dashboard'),
+        page('/user/%s' % user.username),
+        page('/search?searched=%s' % terms[0]),
+        page('/feed.atom'),
+        page('/archive'),
+        ('login by username', lambda: Users.query.filter_by(username=user.username).first()),
+        ('login by email', lambda: Users.query.filter_by(email=user.email).first()),
+        ('profile picture in use', lambda: Users.query.filter_by(profile_pic=user.profile_pic or '').first()),
+        ('Users.posts', lambda: db.session.get(Users, user.id).posts),
+        ('due jobs', lambda: jobs.due(datetime.utcnow()).all()),
+        ('latest revision', lambda: latest(post.id)),
+        ('draft of a new post', lambda: latest(None, user.id)),
+    ]
+    if post.slug:
+        checks.append(page('/posts/%s' % post.slug))
+
+    failures = 0
+    for result in check(db.engines.values(), checks, db.session):
+        if not result.ok:
+            failures += 1
+        if verbose or not result.ok:
+            print("%s  %s" % ("FULL SCAN of %s" % ", ".join(result.scans) if result.scans else "ok", result.name))
+            print("    " + " ".join(result.statement.split()))
+            for line in result.lines:
+                print("    -> " + line)
+    if failures:
+        raise click.ClickException("%d queries scan a whole table" % failures)
+    print("All query plans use an index")
+
+@click.command('build-assets')
+@with_appcontext
+def build_assets():
+    # Run on deploy, after the static files changed
+    manifest = assets.build()
+    compressed = sum(1 for entry in manifest.values() if entry['encodings'])
+    print("%d static files hashed, %d precompressed, manifest written to %s"
+          % (len(manifest), compressed, current_app.config['STATIC_MANIFEST']))
+    if brotli_module() is None:
+        print("brotli is not installed, only gzip copies were written")
+
+@click.command('compile-templates')
+@with_appcontext
+def compile_templates():
+    # Run on deploy, so workers load compiled templates from the start
+    count = templating.compile()
+    print("%d templates compiled into %s" % (count, current_app.config['TEMPLATE_BYTECODE_DIR']))
+
+@click.command('run-jobs')
+@click.option('--processes', type=int, help='Worker processes, JOB_WORKER_PROCESSES by default.')
+@click.option('--threads', type=int, help='Worker threads per process, JOB_WORKER_THREADS by default.')
+@click.option('--once', is_flag=True, help='Exit when no job is due instead of waiting for more.')
+@with_appcontext
+def run_jobs(processes, threads, once):
+    # Stops after the running jobs on SIGTERM or Ctrl-C
+    config = current_app.config
+    jobs.run_workers(processes or config['JOB_WORKER_PROCESSES'], threads or config['JOB_WORKER_THREADS'], once)
+
+@click.command('retry-jobs')
+@click.option('--name', help='Only jobs of this kind, e.g. index-post.')
+@with_appcontext
+def retry_jobs(name):
+    print("%d failed jobs queued again" % jobs.retry_failed(name))
+
+COMMANDS = [reindex_search, backfill_posts, archive_posts, prune_revisions, calibrate_passwords, check_query_plans, import_posts, export_posts,
+            reconcile_authors, build_assets, compile_templates, run_jobs, retry_jobs]
@@ -0,0 +1,65 @@
+import hashlib
+import os
+from flask import current_app, make_response, request, session
+from flask_login import current_user
+from werkzeug.http import is_resource_modified
+from assets import CONTENT_ADDRESSED
+
+# Conditional GET
+#
+# Pages that can be revalidated get an ETag built from the columns that
+# decide what they show (post and profile timestamps, ids on the page) plus
+# the visitor and the deployed templates. A request whose If-None-Match or
+# If-Modified-Since still matches gets a 304 before the template is rendered.
+
+
+def deploy_version(app):
+    # ETAG_SALT (e.g. the git revision) when set, so every host agrees;
+    # otherwise derived from the templates and static files on this host
+    version = app.extensions.get('etag_version')
+    if version is None:
+        version = app.config.get('ETAG_SALT')
+        if not version:
+            digest = hashlib.sha1()
+            for folder in (os.path.join(app.root_path, app.template_folder), app.static_folder):
+                for directory, dirs, files in os.walk(folder or ''):
+                    for name in sorted(files):
+                        # Uploads never change what a template renders
+                        if name.startswith('.') or CONTENT_ADDRESSED.search(name) or name.endswith(('.gz', '.br')):
+                            continue
+                        stat = os.stat(os.path.join(directory, name))
+                        digest.update(("%s|%d|%d\n" % (name, stat.st_mtime_ns, stat.st_size)).encode())
+            version = digest.hexdigest()[:12]
+        app.extensions['etag_version'] = version
+    return version
+
+
+def make_etag(*parts):
+    raw = "|".join(str(part) for part in (deploy_version(current_app), current_user.get_id()) + parts)
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+
+def conditional_response(parts, render, last_modified=None):
+    """Return a 304 when the client's copy matches ``parts``, else ``render()``.
+
+    ``parts`` must cover everything the page shows. ``last_modified`` is
+    for clients that only send If-Modified-Since; an If-None-Match always
+    takes precedence.
+    """
+    # Pending flash messages are shown once, so those pages are always rendered
+    if request.method not in ('GET', 'HEAD') or '_flashes' in session:
+        return render()
+    etag = make_etag(*parts)
+    if not is_resource_modified(request.environ, etag, last_modified=last_modified):
+        response = current_app.response_class(status=304)
+    else:
+        response = make_response(render())
+        if response.status_code != 200:
+            return response
+    # Weak: the same validator covers compressed and plain bodies
+    response.set_etag(etag, weak=True)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    # Browsers revalidate on every visit and get a 304 while nothing changed
+    response.cache_control.no_cache = True
+    return response
@@ -0,0 +1,100 @@
+from database import database_uri
+
+# Settings read from the environment (or .env) when the app is created
+
+
+def from_env(environ):
+    config = {
+        # secret key
+        'SECRET_KEY': environ.get('APP_KEY'),
+
+        'UPLOAD_FOLDER': 'static/images/',
+
+        # database, pool settings and optional read replica (see database.py)
+        'SQLALCHEMY_DATABASE_URI': database_uri(environ),
+        'DB_POOL_SIZE': int(environ.get('DB_POOL_SIZE', 10)),
+        'DB_MAX_OVERFLOW': int(environ.get('DB_MAX_OVERFLOW', 20)),
+        'DB_POOL_TIMEOUT': float(environ.get('DB_POOL_TIMEOUT', 10)),
+        # below MySQL's wait_timeout so the server never closes a pooled connection first
+        'DB_POOL_RECYCLE': int(environ.get('DB_POOL_RECYCLE', 280)),
+        'DB_PRE_PING': environ.get('DB_PRE_PING', '1') not in ('0', 'false', 'no'),
+        'DB_CONNECT_TIMEOUT': int(environ.get('DB_CONNECT_TIMEOUT', 5)),
+        'DB_READ_TIMEOUT': int(environ.get('DB_READ_TIMEOUT', 30)),
+        'DB_WRITE_TIMEOUT': int(environ.get('DB_WRITE_TIMEOUT', 30)),
+        # longest a single SELECT may run on MySQL, 0 disables the limit
+        'DB_STATEMENT_TIMEOUT_MS': int(environ.get('DB_STATEMENT_TIMEOUT_MS', 0)),
+        'DB_REPLICA_URL': environ.get('DB_REPLICA_URL'),
+
+        # password hashing: werkzeug method string, see `flask calibrate-passwords`
+        'PASSWORD_HASH_METHOD': environ.get('PASSWORD_HASH_METHOD', 'scrypt:32768:8:1'),
+        'PASSWORD_HASH_WORKERS': int(environ.get('PASSWORD_HASH_WORKERS', 2)),
+
+        # logged-in user snapshots kept per worker
+        'USER_CACHE_SIZE': int(environ.get('USER_CACHE_SIZE', 10000)),
+        'USER_CACHE_TTL': int(environ.get('USER_CACHE_TTL', 300)),
+
+        # background jobs (see jobs.py): `flask run-jobs` pool size and attempts per job
+        'JOB_WORKER_PROCESSES': int(environ.get('JOB_WORKER_PROCESSES', 1)),
+        'JOB_WORKER_THREADS': int(environ.get('JOB_WORKER_THREADS', 4)),
+        'JOB_MAX_ATTEMPTS': int(environ.get('JOB_MAX_ATTEMPTS', 5)),
+
+        # posts per feed page, users per page of the user list, entries in the Atom/RSS feed
+        'POSTS_PER_PAGE': int(environ.get('POSTS_PER_PAGE', 10)),
+        'USERS_PER_PAGE': int(environ.get('USERS_PER_PAGE', 50)),
+        'FEED_ITEMS': int(environ.get('FEED_ITEMS', 20)),
+
+        # post revisions (see revisions.py): how many are kept per post, a full copy
+        # every n of them, days unsaved drafts of new posts are kept, and how
+        # often the editor autosaves in seconds
+        'REVISION_KEEP': int(environ.get('REVISION_KEEP', 50)),
+        'REVISION_SNAPSHOT_INTERVAL': int(environ.get('REVISION_SNAPSHOT_INTERVAL', 10)),
+        'REVISION_DRAFT_DAYS': int(environ.get('REVISION_DRAFT_DAYS', 30)),
+        'AUTOSAVE_INTERVAL': int(environ.get('AUTOSAVE_INTERVAL', 30)),
+
+        # age in days at which `flask archive-posts` moves posts to posts_archive
+        'POST_ARCHIVE_DAYS': int(environ.get('POST_ARCHIVE_DAYS', 730)),
+
+        # rendered-page cache for anonymous visitors: memory, filesystem, redis or none
+        'PAGE_CACHE_BACKEND': environ.get('PAGE_CACHE_BACKEND', 'memory'),
+        'PAGE_CACHE_TTL': int(environ.get('PAGE_CACHE_TTL', 300)),
+        'PAGE_CACHE_MAX_BYTES': int(environ.get('PAGE_CACHE_MAX_BYTES', 32 * 1024 * 1024)),
+
+        # how many slug -> post id mappings each worker remembers
+        'SLUG_CACHE_SIZE': int(environ.get('SLUG_CACHE_SIZE', 10000)),
+
+        # per-request timing, /metrics and slow-request profiles (see instrumentation.py)
+        'INSTRUMENTATION': environ.get('INSTRUMENTATION', '0') in ('1', 'true', 'yes'),
+        'INSTRUMENTATION_PROFILE_RATE': float(environ.get('INSTRUMENTATION_PROFILE_RATE', 0)),
+        'INSTRUMENTATION_SLOW_MS': int(environ.get('INSTRUMENTATION_SLOW_MS', 500)),
+
+        # static files: hashed URLs (see `flask build-assets`), and whether the front
+        # server sends them: x-sendfile, x-accel-redirect or unset
+        'STATIC_FINGERPRINT': environ.get('STATIC_FINGERPRINT', '1') not in ('0', 'false', 'no'),
+        'STATIC_SENDFILE': environ.get('STATIC_SENDFILE') or None,
+        # proxies in front of the app (nginx: 1) whose X-Forwarded-For is trusted
+        # for request.remote_addr, which per-ip rate limits are keyed on
+        'PROXY_FIX_X_FOR': int(environ.get('PROXY_FIX_X_FOR', 0)),
+
+        # per-process cache of {% cache %} template fragments, and where compiled
+        # templates are kept (see `flask compile-templates`)
+        'FRAGMENT_CACHE': environ.get('FRAGMENT_CACHE', '1') not in ('0', 'false', 'no'),
+
+        # part of every page ETag; set it to the deployed revision so all hosts agree
+        'ETAG_SALT': environ.get('ETAG_SALT'),
+
+        # counters behind RATELIMITS (see ratelimit.py): memory, redis or none
+        'RATELIMIT_STORE': environ.get('RATELIMIT_STORE', 'memory'),
+
+        # full-text search backend: auto, mysql, sqlite or memory
+        'SEARCH_BACKEND': environ.get('SEARCH_BACKEND', 'auto'),
+    }
+    if 'STATIC_ACCEL_PREFIX' in environ:
+        config['STATIC_ACCEL_PREFIX'] = environ['STATIC_ACCEL_PREFIX']
+    if 'PAGE_CACHE_REDIS_URL' in environ:
+        config['PAGE_CACHE_REDIS_URL'] = environ['PAGE_CACHE_REDIS_URL']
+    if 'TEMPLATE_BYTECODE_DIR' in environ:
+        # empty disables the bytecode cache
+        config['TEMPLATE_BYTECODE_DIR'] = environ['TEMPLATE_BYTECODE_DIR']
+    if 'RATELIMIT_REDIS_URL' in environ:
+        config['RATELIMIT_REDIS_URL'] = environ['RATELIMIT_REDIS_URL']
+    return config
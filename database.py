@@ -0,0 +1,158 @@
+import threading
+import time
+from functools import wraps
+from flask import g, has_app_context
+from flask_sqlalchemy.session import Session
+from sqlalchemy.engine import URL, make_url
+from sqlalchemy.pool import QueuePool
+
+# Database configuration
+#
+# Builds the connection URL and engine options from the environment, routes
+# read-only views to an optional replica, and keeps pool statistics that the
+# admin pages can show.
+
+REPLICA = 'replica'
+
+
+def database_uri(environ):
+    # DATABASE_URL wins, otherwise the MySQL URL is assembled from its parts
+    # with proper escaping of user names and passwords. None when neither is
+    # set, so a test config can supply its own URI.
+    if environ.get('DATABASE_URL'):
+        return environ['DATABASE_URL']
+    if 'DB_USER' not in environ:
+        return None
+    return URL.create("mysql+pymysql",
+                      username=environ['DB_USER'],
+                      password=environ.get('DB_PASS'),
+                      host=environ.get('DB_HOST'),
+                      port=int(environ['DB_PORT']) if environ.get('DB_PORT') else None,
+                      database=environ.get('DB_NAME', 'blogusers')).render_as_string(hide_password=False)
+
+
+def configure(app):
+    """Derive SQLAlchemy engine options and binds from the DB_* settings."""
+    config = app.config
+    if not config.get('SQLALCHEMY_DATABASE_URI'):
+        raise RuntimeError("No database configured: set DATABASE_URL or DB_USER/DB_PASS/DB_HOST")
+    config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', engine_options(config, config['SQLALCHEMY_DATABASE_URI']))
+    if config.get('DB_REPLICA_URL'):
+        replica = engine_options(config, config['DB_REPLICA_URL'])
+        replica['url'] = config['DB_REPLICA_URL']
+        config.setdefault('SQLALCHEMY_BINDS', {})[REPLICA] = replica
+
+
+def engine_options(config, uri):
+    url = make_url(uri)
+    if url.get_backend_name() == 'sqlite':
+        # SQLite has no server-side pool; just wait on locks instead of failing
+        return {'connect_args': {'timeout': config['DB_POOL_TIMEOUT']}}
+
+    options = {
+        'poolclass': TimedQueuePool,
+        'pool_size': config['DB_POOL_SIZE'],
+        'max_overflow': config['DB_MAX_OVERFLOW'],
+        'pool_timeout': config['DB_POOL_TIMEOUT'],
+        'pool_recycle': config['DB_POOL_RECYCLE'],
+        'pool_pre_ping': config['DB_PRE_PING'],
+    }
+    if url.get_backend_name() == 'mysql':
+        connect_args = {
+            'connect_timeout': config['DB_CONNECT_TIMEOUT'],
+            'read_timeout': config['DB_READ_TIMEOUT'],
+            'write_timeout': config['DB_WRITE_TIMEOUT'],
+        }
+        if config['DB_STATEMENT_TIMEOUT_MS']:
+            connect_args['init_command'] = "SET SESSION max_execution_time=%d" % config['DB_STATEMENT_TIMEOUT_MS']
+        options['connect_args'] = connect_args
+    return options
+
+
+# Async drivers for the ASGI serving mode (aio.py)
+ASYNC_DRIVERS = {'sqlite': 'aiosqlite', 'mysql': 'aiomysql', 'postgresql': 'asyncpg'}
+
+
+def async_url(uri):
+    url = make_url(uri)
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError("No async driver known for %s" % backend)
+    return url.set(drivername="%s+%s" % (backend, ASYNC_DRIVERS[backend]))
+
+
+def async_engine_options(config, uri):
+    options = engine_options(config, uri)
+    # Async engines bring their own pool class, and aiomysql has no
+    # read/write timeouts
+    options.pop('poolclass', None)
+    connect_args = options.get('connect_args', {})
+    connect_args.pop('read_timeout', None)
+    connect_args.pop('write_timeout', None)
+    return options
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that records how long callers waited for a connection."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stats_lock = threading.Lock()
+        self.checkouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.timeouts = 0
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except Exception:
+            with self.stats_lock:
+                self.timeouts += 1
+            raise
+        finally:
+            waited = time.perf_counter() - start
+            with self.stats_lock:
+                self.checkouts += 1
+                self.wait_total += waited
+                self.wait_max = max(self.wait_max, waited)
+
+
+def pool_stats(db):
+    stats = {}
+    for key, engine in db.engines.items():
+        pool = engine.pool
+        entry = {'class': type(pool).__name__}
+        if isinstance(pool, QueuePool):
+            entry.update(size=pool.size(), checked_in=pool.checkedin(),
+                         checked_out=pool.checkedout(), overflow=pool.overflow())
+        if isinstance(pool, TimedQueuePool):
+            with pool.stats_lock:
+                entry.update(checkouts=pool.checkouts, timeouts=pool.timeouts,
+                             wait_avg_ms=1000 * pool.wait_total / pool.checkouts if pool.checkouts else 0.0,
+                             wait_max_ms=1000 * pool.wait_max)
+        stats[key or 'default'] = entry
+    return stats
+
+
+class RoutingSession(Session):
+    """Sends reads from views marked with @read_only to the replica."""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and has_app_context() and g.get('use_replica'):
+            engine = self._db.engines.get(REPLICA)
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def read_only(view):
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        g.use_replica = True
+        try:
+            return view(*args, **kwargs)
+        finally:
+            g.use_replica = False
+    return wrapper
@@ -0,0 +1,42 @@
+from flask import current_app
+from flask_sqlalchemy import SQLAlchemy
+from flask_login import LoginManager
+from flask_ckeditor import CKEditor
+from database import RoutingSession
+from page_cache import PageCache
+from assets import Assets
+from instrumentation import Instrumentation
+from images import ImagePipeline
+from jobs import JobQueue
+from passwords import PasswordHasher
+from ratelimit import RateLimiter
+from slugs import SlugCache
+from templating import Templating
+from search import create_backend
+
+# Extension objects, bound to an app by create_app()
+
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+ckeditor = CKEditor()
+page_cache = PageCache()
+assets = Assets()
+images = ImagePipeline()
+passwords = PasswordHasher()
+slug_cache = SlugCache()
+instrumentation = Instrumentation()
+ratelimiter = RateLimiter()
+jobs = JobQueue(db)
+templating = Templating()
+
+# Manage Logins
+login_manager = LoginManager()
+login_manager.login_view = 'auth.login'
+
+
+# Search index of the live posts, or of the archive, created on first use
+def search_index(archive=False):
+    name = 'search-archive' if archive else 'search'
+    if name not in current_app.extensions:
+        current_app.extensions[name] = create_backend(current_app.config['SEARCH_BACKEND'], db,
+                                                      'posts_archive' if archive else 'posts')
+    return current_app.extensions[name]
@@ -0,0 +1,14 @@
+import gc
+
+# gunicorn settings for `gunicorn -c gunicorn.conf.py wsgi:app`
+
+# Import and build the app once in the master; workers are forked from it
+# and share its memory pages instead of repeating the startup work
+preload_app = True
+workers = 4
+
+
+def pre_fork(server, worker):
+    # Keep the preloaded objects out of the workers' garbage collections,
+    # which would otherwise write to (and un-share) those pages
+    gc.freeze()
@@ -1,429 +1,64 @@
-from flask import Flask, render_template, flash, request, redirect, url_for
-from datetime import datetime
-from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy import desc
-from flask_migrate import Migrate
-from werkzeug.security import generate_password_hash, check_password_hash
-from werkzeug.utils import secure_filename
-from flask_login import UserMixin, login_user, LoginManager, login_required, logout_user, current_user
-from webforms import LoginForm, PostForm, UserForm, NamerForm, PasswordForm, SearchForm
-from flask_ckeditor import CKEditor
+from flask import Flask
 from dotenv.main import load_dotenv
 import os
-import uuid as uuid
-
-# load env
-load_dotenv()
+import config
+import database
+from extensions import db, ckeditor, login_manager, page_cache, assets, images, passwords, slug_cache, instrumentation, \
+    ratelimiter, jobs, templating
 
 # Create a Flask instance
-app = Flask(__name__)
-ckeditor = CKEditor(app)
-
-# add database
-app.config['SQLALCHEMY_DATABASE_URI'] = "mysql+pymysql://" + os.environ['DB_USER'] + ":" + os.environ['DB_PASS'] + "@" + os.environ['DB_HOST'] + "/blogusers"
-
-# secret key
-app.config['SECRET_KEY'] = os.environ['APP_KEY']
-
-app.config['UPLOAD_FOLDER'] = 'static/images/'
-
-# Initialize the database
-db = SQLAlchemy(app)
-migrate = Migrate(app, db)
-
-# Manage Logins
-login_manager = LoginManager()
-login_manager.init_app(app)
-login_manager.login_view = 'login'
-
-@login_manager.user_loader
-def load_user(user_id):
-    return Users.query.get(int(user_id))
-
-@app.context_processor
-def base():
-    form = SearchForm()
-    return dict(form=form)
-
-# Create a route decorator
-@app.route('/')
-def index():
-    first_name = "Peter"
-    return render_template("index.html", 
-                           first_name = first_name)
-
-@app.route('/user/add', methods=['GET', 'POST'])
-def add_user():
-    name = None
-    form = UserForm()
-
-    # Validate form
-    if form.validate_on_submit():
-        user = Users.query.filter_by(email = form.email.data).first()
-        if user is None:
-            # Hash the password
-            hashed_pw = generate_password_hash(form.password_hash.data, "sha256")
-            user = Users(username=form.username.data, name=form.name.data, email=form.email.data, favorite_color=form.favorite_color.data, password_hash=hashed_pw)
-            db.session.add(user)
-            db.session.commit()
-        name = form.name.data
-        form.name.data = ''
-        form.username.data = ''
-        form.email.data = ''
-        form.favorite_color.data = ''
-        form.password_hash.data = ''
-        form.password_hash2.data = ''
-        flash("User added successfully")
-
-    our_users = Users.query.order_by(Users.date_added)
-
-    return render_template("add_user.html",
-                           form = form,
-                           name = name,
-                           our_users = our_users)
-
-@app.route('/user/<name>')
-def user(name):
-    return render_template("user.html", 
-                           user_name = name)
-
-#Create custom error message
-
-#Invalid URL
-
-@app.errorhandler(404)
-def page_not_found(e):
-    return render_template("404.html"), 404
-
-#internal server Error
-
-@app.errorhandler(500)
-def page_not_found(e):
-    return render_template("500.html"), 500
-
-# Create name page
-@app.route('/name', methods=['GET', 'POST'])
-def name():
-    name = None
-    form = NamerForm()
-    # Validate form
-    if form.validate_on_submit():
-        name = form.name.data
-        form.name.data = ''
-        flash("Form submitted succesfully!")
-
-    return render_template("name.html", 
-                           name = name, 
-                           form = form)
-
-# Create pw test page
-@app.route('/test_pw', methods=['GET', 'POST'])
-def test_pw():
-    email = None
-    password = None
-    pw_to_check = None
-    passed = None
-    form = PasswordForm()
-
-
-    # Validate form
-    if form.validate_on_submit():
-        email = form.email.data
-        password = form.password_hash.data
-        # clear the form
-        form.email.data = ''
-        form.password_hash.data = ''
-
-        #look up user by email
-        pw_to_check = Users.query.filter_by(email=email).first()
-
-        # Check hash password
-        passed = check_password_hash(pw_to_check.password_hash, password)
-
-    return render_template("test_pw.html", 
-                           email = email, 
-                           password = password,
-                           pw_to_check = pw_to_check,
-                           passed = passed, 
-                           form = form)
-
-# Upodate DB record
-@app.route("/update/<int:id>", methods=['GET', 'POST'])
-@login_required
-def update(id):
-    form = UserForm()
-    name_to_update = Users.query.get_or_404(id)
-    if request.method == "POST":
-        name_to_update.name = request.form["name"]
-        name_to_update.email = request.form["email"]
-        name_to_update.favorite_color = request.form["favorite_color"]
-        name_to_update.about_author = request.form["about_author"]
-        name_to_update.username = request.form["username"]
-        try:
-            db.session.commit()
-            flash("User updated successfully!")
-            return render_template("update.html",
-                                   form = form,
-                                   name_to_update = name_to_update)
-        except:
-            flash("Error! Looks like there was a problem. Maybe try it again.")
-            return render_template("update.html",
-                                   form = form,
-                                   name_to_update = name_to_update)
-    else:
-        return render_template("update.html",
-                                   form = form,
-                                   name_to_update = name_to_update,
-                                   id = id)
-    
-@app.route("/delete/<int:id>", methods =['GET', 'POST'])
-def delete(id):
-    user_to_delete = Users.query.get_or_404(id)
-    name = None
-    form = UserForm()
-
-    try:
-        db.session.delete(user_to_delete)
-        db.session.commit()
-        flash("User deleted successfully!")
-
-        our_users = Users.query.order_by(Users.date_added)
-
-        return render_template("add_user.html",
-                               form = form,
-                               name = name,
-                               our_users = our_users)
-
-    except:
-        flash("There was a problem. Maybe it works if you try again.")
-        return render_template("add_user.html",
-                               form = form,
-                               name = name,
-                               our_users = our_users)
-
-# Add Post Page
-@app.route('/add-post', methods=["GET", "POST"])
-#@login_required
-def add_post():
-    form = PostForm()
-
-    if form.validate_on_submit():
-        poster = current_user.id
-        post = Posts(title=form.title.data, content=form.content.data, poster_id = poster, slug=form.slug.data)
-        # Clear the form
-        form.title.data = ""
-        form.content.data = ""
-        #form.author.data = ""
-        form.slug.data = ""
-
-        #Add post data to database
-        db.session.add(post)
-        db.session.commit()
-
-        #return a message
-        flash("Post is submitted succesfully")
-
-    #redirect to webpage
-    return render_template("add_post.html", form=form)
-
-# View post page
-@app.route('/posts')
-def posts():
-
-    posts = Posts.query.order_by(desc(Posts.date_posted))
-    return render_template("posts.html", posts=posts)
-
-@app.route('/posts/<int:id>')
-def post(id):
-    post = Posts.query.get_or_404(id)
-    return render_template("post.html", post=post)
-
-@app.route('/posts/edit/<int:id>', methods=['GET', 'POST'])
-@login_required
-def edit_post(id):
-    post = Posts.query.get_or_404(id)
-    form = PostForm()
-
-    if form.validate_on_submit():
-        post.title = form.title.data
-        post.content = form.content.data
-        #post.author = form.author.data
-        post.slug = form.slug.data
-
-        #Update DB
-        db.session.add(post)
-        db.session.commit()
-        flash("Post has been updated!")
-        return redirect(url_for('post', id=post.id))
-    
-    if current_user.id == post.poster_id:
-        form.title.data = post.title
-        form.content.data = post.content
-        #form.author.data = post.author
-        form.slug.data = post.slug
-        return render_template('edit_post.html', form=form)
-    else:
-        flash("You are not allowed to edit this post")
-        posts = Posts.query.order_by(desc(Posts.date_posted))
-        return render_template("posts.html", posts=posts)
-
-@app.route('/posts/delete/<int:id>')
-@login_required
-def delete_post(id):
-    post_to_delete = Posts.query.get_or_404(id)
-    id = current_user.id
-    if id == post_to_delete.poster.id:   
-        try:
-            db.session.delete(post_to_delete)
-            db.session.commit()
-
-            flash("Post deleted, i hope you know what you did ...")
-
-            posts = Posts.query.order_by(desc(Posts.date_posted))
-            return render_template("posts.html", posts=posts)
-
-        except:
-            flash("Whoops, there was a problem with deleting your post. But you did your best and that is what count!")
-            
-            posts = Posts.query.order_by(desc(Posts.date_posted))
-            return render_template("posts.html", posts=posts)
-        
-    else:
-        flash("You are not allowed to delete this post")
-
-        posts = Posts.query.order_by(desc(Posts.date_posted))
-        return render_template("posts.html", posts=posts)
-    
-@app.route('/login', methods=['GET', 'POST'])
-def login():
-    form = LoginForm()
-
-    if form.validate_on_submit():
-        user = Users.query.filter_by(username=form.username.data).first()
-        if user:
-            #chech pass hash
-            if check_password_hash(user.password_hash, form.password.data):
-                login_user(user)
-                return redirect(url_for('dashboard'))
-            else:
-                flash("Wrong password - Do you try to hack?!")
-        else:
-            flash("User does not exist - Nice try buddy.")
-
-    return render_template('login.html', form=form)
-
-# Create logout page
-@app.route('/logout', methods=['GET', 'POST'])
-@login_required
-def logout():
-    logout_user()
-    flash("You are logged out - Bye")
-    return redirect(url_for('login'))
-
-@app.route('/dashboard', methods=['GET', 'POST'])
-@login_required
-def dashboard():
-    
-    form = UserForm()
-    id = current_user.id
-    name_to_update = Users.query.get_or_404(id)
-    if request.method == "POST":
-        name_to_update.name = request.form["name"]
-        name_to_update.email = request.form["email"]
-        name_to_update.favorite_color = request.form["favorite_color"]
-        name_to_update.username = request.form["username"]
-        name_to_update.about_author = request.form["about_author"]
-        name_to_update.profile_pic = request.files["profile_pic"]
-        
-        #grab image name
-        pic_filename = secure_filename(name_to_update.profile_pic.filename)
-        #set uuid
-        pic_name = str(uuid.uuid1()) + "_" + pic_filename
-        #save image
-        name_to_update.profile_pic.save(os.path.join(app.config['UPLOAD_FOLDER'], pic_name))
-        name_to_update.profile_pic = pic_name
-
-        try:
-            db.session.commit()
-            flash("User updated successfully!")
-            return render_template("dashboard.html",
-                                   form = form,
-                                   name_to_update = name_to_update)
-        except:
-            flash("Error! Looks like there was a problem. Maybe try it again.")
-            return render_template("dashboard.html",
-                                   form = form,
-                                   name_to_update = name_to_update)
-    else:
-        return render_template("dashboard.html",
-                                   form = form,
-                                   name_to_update = name_to_update,
-                                   id = id)
-
-# Search function
-@app.route('/search', methods=['POST'])
-def search():
-    form = SearchForm()
-    posts = Posts.query
-    if form.validate_on_submit():
-        # Get data from search bar
-        post.searched = form.searched.data
-
-        # Query the database
-        posts = posts.filter(Posts.content.like('%' + post.searched + '%'))
-        posts = posts.order_by(Posts.title).all()
-
-        return render_template("search.html", 
-                               form = form, 
-                               searched = post.searched,
-                               posts=posts)
-
-@app.route('/admin')
-@login_required
-def admin():
-    id = current_user.id
-    if id == 9:
-        return render_template("admin.html")
-    else:
-        flash("You are not god enough to see this page. Go back you peasant.")
-        return redirect(url_for('posts'))
-
-# Create blog post model
-class Posts(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    title = db.Column(db.String(255))
-    content = db.Column(db.Text)
-    #author = db.Column(db.String(255))
-    date_posted = db.Column(db.DateTime, default=datetime.utcnow)
-    slug = db.Column(db.String(255))
-    # Couple user to post
-    poster_id = db.Column(db.Integer, db.ForeignKey("users.id"))
-
-# Create Model
-class Users(db.Model, UserMixin):
-    id = db.Column(db.Integer, primary_key=True)
-    username = db.Column(db.String(20), nullable=False, unique=True)
-    name = db.Column(db.String(200), nullable=False)
-    email = db.Column(db.String(120), nullable=False, unique=True)
-    favorite_color = db.Column(db.String(120))
-    about_author = db.Column(db.Text(500), nullable=True)
-    date_added = db.Column(db.DateTime, default=datetime.utcnow)
-    profile_pic = db.Column(db.String(200), nullable=True)
-    # Do some password stuff
-    password_hash = db.Column(db.String(128))
-    posts = db.relationship("Posts", backref='poster')
-
-    @property
-    def password(self):
-        raise AttributeError('password is not a readable attribute!')
-    
-    @password.setter
-    def password(self, password):
-        self.password_hash = generate_password_hash(password)
-
-    def verify_password(self, password):
-        return check_password_hash(self.password_hash, password)
-
-    # Create a string
-    def __repr__(self):
-        return '<Name %r>' % self.name
\ No newline at end of file
+#
+# Nothing is set up at import time: `flask run` and gunicorn
+# ('hello:create_app()' or wsgi:app) call the factory, and tests pass their
+# own settings, e.g. create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite://'}).
+def create_app(overrides=None):
+    # load env
+    load_dotenv()
+
+    app = Flask(__name__)
+    app.config.from_mapping(config.from_env(os.environ))
+    if overrides:
+        app.config.from_mapping(overrides)
+
+    # Behind a reverse proxy every request comes from the proxy's address
+    if app.config.get('PROXY_FIX_X_FOR'):
+        from werkzeug.middleware.proxy_fix import ProxyFix
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config['PROXY_FIX_X_FOR'])
+
+    # Initialize the database and extensions
+    database.configure(app)
+    # Registered first so its timer runs before every other request hook
+    instrumentation.init_app(app)
+    # Before anything that touches the database, so rejections stay cheap
+    ratelimiter.init_app(app)
+    db.init_app(app)
+    if app.config.get('MIGRATE_ENABLED', True):
+        # Flask-Migrate pulls in all of alembic; web workers never need it
+        from flask_migrate import Migrate
+        Migrate(app, db)
+    ckeditor.init_app(app)
+    login_manager.init_app(app)
+    page_cache.init_app(app)
+    assets.init_app(app)
+    images.init_app(app)
+    passwords.init_app(app)
+    jobs.init_app(app)
+    templating.init_app(app)
+    slug_cache.max_size = app.config['SLUG_CACHE_SIZE']
+
+    # Models register the Flask-Login user loader on import
+    from models import user_cache
+    user_cache.max_size = app.config['USER_CACHE_SIZE']
+    user_cache.ttl = app.config['USER_CACHE_TTL']
+    # Job handlers register themselves with the queue on import
+    import tasks
+
+    from views import auth, main, posts, search, users
+    for module in (main, users, posts, auth, search):
+        app.register_blueprint(module.bp)
+
+    from commands import COMMANDS
+    for command in COMMANDS:
+        app.cli.add_command(command)
+
+    return app
@@ -0,0 +1,121 @@
+import hashlib
+import os
+import threading
+from flask import url_for
+from werkzeug.utils import secure_filename
+
+# Profile picture pipeline
+#
+# Uploads are streamed to disk in chunks while being hashed, and stored under
+# their content hash so the same picture is only ever kept once. Resized
+# WebP/JPEG variants are produced by the image-variants job (tasks.py), so
+# the request only pays for the copy to disk.
+
+CHUNK_SIZE = 64 * 1024
+ALLOWED_EXTENSIONS = {"png", "jpg", "jpeg", "gif", "webp"}
+FORMATS = {"webp": "WEBP", "jpg": "JPEG"}
+
+
+class ImagePipeline:
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('UPLOAD_FOLDER', 'static/images/')
+        app.config.setdefault('IMAGE_VARIANT_SIZES', (64, 175, 512))
+        self.app = app
+        app.extensions['images'] = self
+        app.add_template_global(self.profile_pic)
+
+    @property
+    def folder(self):
+        return os.path.join(self.app.root_path, self.app.config['UPLOAD_FOLDER'])
+
+    def store(self, upload):
+        """Save a werkzeug FileStorage and return its stored file name.
+
+        Returns None when no file was sent or the extension is not an image.
+        """
+        filename = secure_filename(upload.filename or "")
+        extension = filename.rsplit(".", 1)[-1].lower() if "." in filename else ""
+        if extension not in ALLOWED_EXTENSIONS:
+            return None
+
+        os.makedirs(self.folder, exist_ok=True)
+        digest = hashlib.sha256()
+        tmp_path = os.path.join(self.folder, ".upload-%d-%d" % (os.getpid(), threading.get_ident()))
+        with open(tmp_path, "wb") as f:
+            while True:
+                chunk = upload.stream.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                f.write(chunk)
+
+        name = "%s.%s" % (digest.hexdigest(), extension)
+        path = os.path.join(self.folder, name)
+        if os.path.exists(path):
+            # Same picture uploaded before
+            os.remove(tmp_path)
+        else:
+            os.replace(tmp_path, path)
+        return name
+
+    def variant_name(self, name, size, extension):
+        return "%s_%d.%s" % (name.rsplit(".", 1)[0], size, extension)
+
+    def variant_names(self, name):
+        return [self.variant_name(name, size, extension)
+                for size in self.app.config['IMAGE_VARIANT_SIZES'] for extension in FORMATS]
+
+    def make_variants(self, name):
+        if all(os.path.exists(os.path.join(self.folder, variant)) for variant in self.variant_names(name)):
+            return
+        # Pillow is imported here, in the job worker, to keep it out of app
+        # startup; without it the original upload is served instead
+        try:
+            from PIL import Image, ImageOps
+        except ImportError:
+            return
+        try:
+            with Image.open(os.path.join(self.folder, name)) as original:
+                original = ImageOps.exif_transpose(original)
+                if original.mode not in ("RGB", "RGBA"):
+                    original = original.convert("RGBA")
+                for size in self.app.config['IMAGE_VARIANT_SIZES']:
+                    image = original.copy()
+                    image.thumbnail((size, size))
+                    for extension, format in FORMATS.items():
+                        out = image.convert("RGB") if format == "JPEG" else image
+                        path = os.path.join(self.folder, self.variant_name(name, size, extension))
+                        out.save(path + ".tmp", format, quality=85)
+                        os.replace(path + ".tmp", path)
+        except (OSError, ValueError) as e:
+            self.app.logger.warning("Could not resize %s: %s", name, e)
+
+    def remove(self, name):
+        # A picture nobody uses any more, with its variants
+        for name in [name] + self.variant_names(name):
+            try:
+                os.remove(os.path.join(self.folder, secure_filename(name)))
+            except OSError:
+                pass
+
+    def profile_pic(self, name, size):
+        """URLs for showing a picture at ``size`` pixels in templates.
+
+        Falls back to the original upload until the variants are ready, and
+        to the default picture when the user has none.
+        """
+        if not name:
+            return {"src": url_for('static', filename='images/default_profile_pic.png'), "webp": None}
+        sources = {"src": url_for('static', filename='images/' + name), "webp": None}
+        if size in self.app.config['IMAGE_VARIANT_SIZES']:
+            jpg = self.variant_name(name, size, "jpg")
+            webp = self.variant_name(name, size, "webp")
+            if os.path.exists(os.path.join(self.folder, jpg)):
+                sources["src"] = url_for('static', filename='images/' + jpg)
+            if os.path.exists(os.path.join(self.folder, webp)):
+                sources["webp"] = url_for('static', filename='images/' + webp)
+        return sources
@@ -0,0 +1,218 @@
+import cProfile
+import os
+import random
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+from flask import Response, before_render_template, g, has_request_context, request, template_rendered
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Request instrumentation (opt-in with INSTRUMENTATION=1)
+#
+# Splits the time of every request into database, template and Python
+# phases, counts the SQL statements it sends and warns when one statement
+# repeats often enough to look like an N+1 lazy load. Results go out as a
+# Server-Timing header, as Prometheus metrics per endpoint, and as cProfile
+# dumps of sampled requests that turn out slow.
+
+# Upper bounds of the latency histogram buckets, in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class RequestStats:
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.db_time = 0.0
+        self.template_time = 0.0
+        self.queries = 0
+        self.statements = Counter()
+        # (start, db_time at start) for templates being rendered
+        self.rendering = []
+        self.profiler = None
+        self.profiling = False
+
+
+def current_stats():
+    if has_request_context():
+        return g.get('instrumentation_stats')
+    return None
+
+
+# The engine hooks are installed once per process and only record while a
+# request of an instrumented app is running
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if current_stats() is not None:
+        conn.info.setdefault('instrumentation_start', []).append(time.perf_counter())
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = current_stats()
+    starts = conn.info.get('instrumentation_start')
+    if stats is None or not starts:
+        return
+    stats.db_time += time.perf_counter() - starts.pop()
+    stats.queries += 1
+    stats.statements[statement] += 1
+
+
+def install_engine_hooks():
+    if not event.contains(Engine, 'before_cursor_execute', before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', after_cursor_execute)
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.total = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        for i, bound in enumerate(BUCKETS):
+            if value <= bound:
+                self.counts[i] += 1
+        self.total += 1
+        self.sum += value
+
+
+class Instrumentation:
+    def __init__(self, app=None):
+        self.lock = threading.Lock()
+        self.profiling = False
+        self.latency = defaultdict(Histogram)
+        self.queries = Counter()
+        self.n_plus_one = Counter()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('INSTRUMENTATION', False)
+        # a statement sent this many times in one request is reported as N+1
+        app.config.setdefault('INSTRUMENTATION_N_PLUS_ONE', 5)
+        app.config.setdefault('INSTRUMENTATION_METRICS_PATH', '/metrics')
+        # share of requests run under cProfile, and the duration above which
+        # their profile is written to INSTRUMENTATION_PROFILE_DIR
+        app.config.setdefault('INSTRUMENTATION_PROFILE_RATE', 0.0)
+        app.config.setdefault('INSTRUMENTATION_SLOW_MS', 500)
+        app.config.setdefault('INSTRUMENTATION_PROFILE_DIR', os.path.join(app.instance_path, 'profiles'))
+        self.app = app
+        self.latency.clear()
+        self.queries.clear()
+        self.n_plus_one.clear()
+        app.extensions['instrumentation'] = self
+        if not app.config['INSTRUMENTATION']:
+            return
+
+        install_engine_hooks()
+        app.before_request(self.start_request)
+        app.after_request(self.finish_request)
+        app.teardown_request(self.stop_profiler)
+        before_render_template.connect(self.start_template, app)
+        template_rendered.connect(self.finish_template, app)
+        if app.config['INSTRUMENTATION_METRICS_PATH']:
+            app.add_url_rule(app.config['INSTRUMENTATION_METRICS_PATH'], 'metrics', self.metrics)
+
+    def start_request(self):
+        stats = g.instrumentation_stats = RequestStats()
+        rate = self.app.config['INSTRUMENTATION_PROFILE_RATE']
+        if rate and random.random() < rate:
+            # One profiled request at a time, cProfile cannot nest
+            with self.lock:
+                if self.profiling:
+                    return
+                self.profiling = True
+            stats.profiler = cProfile.Profile()
+            try:
+                stats.profiler.enable()
+                stats.profiling = True
+            except ValueError:
+                # Another profiler (a debugger, coverage) is active
+                stats.profiler = None
+                with self.lock:
+                    self.profiling = False
+
+    def start_template(self, app, template, context, **extra):
+        stats = current_stats()
+        if stats is not None:
+            stats.rendering.append((time.perf_counter(), stats.db_time))
+
+    def finish_template(self, app, template, context, **extra):
+        stats = current_stats()
+        if stats is None or not stats.rendering:
+            return
+        start, db_time = stats.rendering.pop()
+        # Lazy loads fired from the template count as database time
+        elapsed = time.perf_counter() - start - (stats.db_time - db_time)
+        if not stats.rendering:
+            stats.template_time += elapsed
+
+    def finish_request(self, response):
+        stats = current_stats()
+        if stats is None:
+            return response
+        total = time.perf_counter() - stats.start
+        python_time = max(total - stats.db_time - stats.template_time, 0.0)
+        response.headers['Server-Timing'] = ", ".join([
+            'db;dur=%.1f;desc="%d queries"' % (stats.db_time * 1000, stats.queries),
+            'tpl;dur=%.1f' % (stats.template_time * 1000),
+            'app;dur=%.1f' % (python_time * 1000),
+            'total;dur=%.1f' % (total * 1000),
+        ])
+
+        endpoint = request.endpoint or 'none'
+        repeated = [(statement, count) for statement, count in stats.statements.items()
+                    if count >= self.app.config['INSTRUMENTATION_N_PLUS_ONE']]
+        for statement, count in repeated:
+            self.app.logger.warning("Possible N+1 in %s: %d x %s", endpoint, count, " ".join(statement.split()))
+        with self.lock:
+            self.latency[(endpoint, request.method)].observe(total)
+            self.queries[endpoint] += stats.queries
+            if repeated:
+                self.n_plus_one[endpoint] += 1
+
+        self.stop_profiler()
+        if stats.profiler is not None and total * 1000 >= self.app.config['INSTRUMENTATION_SLOW_MS']:
+            self.dump_profile(stats.profiler, endpoint, total)
+        return response
+
+    def stop_profiler(self, exc=None):
+        stats = current_stats()
+        if stats is not None and stats.profiling:
+            stats.profiler.disable()
+            stats.profiling = False
+            with self.lock:
+                self.profiling = False
+
+    def dump_profile(self, profiler, endpoint, total):
+        # Open with `python -m pstats <file>` or snakeviz
+        directory = self.app.config['INSTRUMENTATION_PROFILE_DIR']
+        os.makedirs(directory, exist_ok=True)
+        name = "%s-%d-%dms.prof" % (re.sub(r'[^\w.-]', '_', endpoint), time.time(), total * 1000)
+        profiler.dump_stats(os.path.join(directory, name))
+        self.app.logger.info("Slow request profile written to %s", name)
+
+    def metrics(self):
+        # Prometheus text format; every worker process keeps its own numbers
+        lines = [
+            "# HELP flask_request_duration_seconds Time spent handling requests.",
+            "# TYPE flask_request_duration_seconds histogram",
+        ]
+        with self.lock:
+            for (endpoint, method), histogram in sorted(self.latency.items()):
+                labels = 'endpoint="%s",method="%s"' % (endpoint, method)
+                for bound, count in zip(BUCKETS, histogram.counts):
+                    lines.append('flask_request_duration_seconds_bucket{%s,le="%s"} %d' % (labels, bound, count))
+                lines.append('flask_request_duration_seconds_bucket{%s,le="+Inf"} %d' % (labels, histogram.total))
+                lines.append('flask_request_duration_seconds_sum{%s} %f' % (labels, histogram.sum))
+                lines.append('flask_request_duration_seconds_count{%s} %d' % (labels, histogram.total))
+            lines.append("# HELP flask_request_queries_total SQL statements sent while handling requests.")
+            lines.append("# TYPE flask_request_queries_total counter")
+            for endpoint, count in sorted(self.queries.items()):
+                lines.append('flask_request_queries_total{endpoint="%s"} %d' % (endpoint, count))
+            lines.append("# HELP flask_n_plus_one_total Requests with a statement repeated like an N+1 lazy load.")
+            lines.append("# TYPE flask_n_plus_one_total counter")
+            for endpoint, count in sorted(self.n_plus_one.items()):
+                lines.append('flask_n_plus_one_total{endpoint="%s"} %d' % (endpoint, count))
+        return Response("\n".join(lines) + "\n", mimetype='text/plain; version=0.0.4')
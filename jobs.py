@@ -0,0 +1,223 @@
+import json
+import multiprocessing
+import os
+import random
+import signal
+import socket
+import threading
+from datetime import datetime, timedelta
+from sqlalchemy import delete, or_, update
+from sqlalchemy.exc import IntegrityError
+
+# Background jobs
+#
+# Follow-up work of the write views is stored in the jobs table, in the same
+# transaction as the change that caused it, and run later by `flask
+# run-jobs`; no broker is needed. Enqueueing a job under a key that is
+# already waiting updates that job instead of adding another, so a post saved
+# three times before a worker gets to it is indexed once. Workers take a job
+# with a conditional UPDATE that leases it for JOB_LEASE seconds, which works
+# the same on SQLite and MySQL, and a job whose worker died is taken again
+# once the lease runs out. Handlers must therefore be safe to run twice. A
+# failing job is retried with exponential backoff and left as 'failed' after
+# JOB_MAX_ATTEMPTS (see `flask retry-jobs`).
+
+
+def worker_id(thread):
+    return "%s:%d:%d" % (socket.gethostname()[:40], os.getpid(), thread)
+
+
+def worker_process(threads, once):
+    # Started with the spawn method, so the app is built from the environment again
+    from hello import create_app
+    app = create_app()
+    app.extensions['jobs'].serve(threads, once)
+
+
+class JobQueue:
+    def __init__(self, db, app=None):
+        self.db = db
+        self.handlers = {}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('JOB_WORKER_PROCESSES', 1)
+        app.config.setdefault('JOB_WORKER_THREADS', 4)
+        app.config.setdefault('JOB_MAX_ATTEMPTS', 5)
+        # Seconds before the first retry, doubled for every further one
+        app.config.setdefault('JOB_RETRY_DELAY', 10)
+        app.config.setdefault('JOB_RETRY_MAX_DELAY', 3600)
+        app.config.setdefault('JOB_LEASE', 300)
+        app.config.setdefault('JOB_POLL_INTERVAL', 1.0)
+        self.app = app
+        app.extensions['jobs'] = self
+
+    def handler(self, name):
+        """Register the function run for jobs called ``name``; the payload is passed as keyword arguments."""
+        def register(function):
+            self.handlers[name] = function
+            return function
+        return register
+
+    def enqueue(self, name, payload=None, key=None, delay=0):
+        """Add a job to the current transaction; it runs once that is committed."""
+        from models import Jobs
+        session = self.db.session
+        values = {'name': name,
+                  'payload': json.dumps(payload or {}, sort_keys=True),
+                  'run_at': datetime.utcnow() + timedelta(seconds=delay)}
+        if key is None:
+            session.add(Jobs(**values))
+            return
+        while True:
+            # A running job with the key is left alone; the version bump makes
+            # its worker queue it again instead of deleting it when done
+            updated = session.execute(
+                update(Jobs)
+                .where(Jobs.key == key)
+                .values(status='queued', attempts=0, last_error=None, version=Jobs.version + 1, **values))
+            if updated.rowcount:
+                return
+            try:
+                with session.begin_nested():
+                    session.add(Jobs(key=key, **values))
+                    session.flush()
+                return
+            except IntegrityError:
+                # Inserted by a concurrent request meanwhile, update that one
+                continue
+
+    def due(self, now, limit=10):
+        """Ids of jobs that may run at ``now``, oldest first."""
+        from models import Jobs
+        return (self.db.session.query(Jobs.id)
+                .filter(Jobs.status == 'queued', Jobs.run_at <= now,
+                        or_(Jobs.locked_until == None, Jobs.locked_until < now))
+                .order_by(Jobs.run_at, Jobs.id)
+                .limit(limit))
+
+    def claim(self, worker):
+        """Lease the next due job to ``worker`` and return its id, None when nothing is due."""
+        from models import Jobs
+        session = self.db.session
+        now = datetime.utcnow()
+        free = or_(Jobs.locked_until == None, Jobs.locked_until < now)
+        candidates = [row.id for row in self.due(now)]
+        session.rollback()
+        # Other workers race for the same rows; whoever's UPDATE matches first wins
+        random.shuffle(candidates)
+        for id in candidates:
+            claimed = session.execute(
+                update(Jobs)
+                .where(Jobs.id == id, Jobs.status == 'queued', free)
+                .values(locked_by=worker,
+                        locked_until=now + timedelta(seconds=self.app.config['JOB_LEASE']),
+                        attempts=Jobs.attempts + 1))
+            session.commit()
+            if claimed.rowcount:
+                return id
+        return None
+
+    def run(self, id, worker):
+        """Run a claimed job. The handler's writes and the job's removal commit together."""
+        from models import Jobs
+        session = self.db.session
+        job = session.get(Jobs, id)
+        if job is None or job.locked_by != worker:
+            session.rollback()
+            return
+        name, version = job.name, job.version
+        try:
+            handler = self.handlers.get(name)
+            if handler is None:
+                raise LookupError("No handler for job %r" % name)
+            handler(**json.loads(job.payload))
+            done = session.execute(delete(Jobs).where(Jobs.id == id, Jobs.version == version))
+            if not done.rowcount:
+                # Enqueued again while it ran
+                session.execute(update(Jobs).where(Jobs.id == id).values(locked_by=None, locked_until=None))
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            self.app.logger.warning("Job %d (%s) failed: %s", id, name, e)
+            self.failed(id, version, "%s: %s" % (type(e).__name__, e))
+
+    def failed(self, id, version, error):
+        from models import Jobs
+        session = self.db.session
+        job = session.get(Jobs, id)
+        if job is None:
+            return
+        config = self.app.config
+        job.locked_by = None
+        job.locked_until = None
+        job.last_error = error[:2000]
+        # A job enqueued again while it ran is simply due with its new payload
+        if job.version == version and job.attempts >= config['JOB_MAX_ATTEMPTS']:
+            job.status = 'failed'
+        elif job.version == version:
+            # Jitter keeps jobs that failed together from coming back together
+            delay = min(config['JOB_RETRY_DELAY'] * 2 ** (job.attempts - 1), config['JOB_RETRY_MAX_DELAY'])
+            job.run_at = datetime.utcnow() + timedelta(seconds=random.uniform(delay / 2, delay))
+        session.commit()
+
+    def work(self, worker, stop, once):
+        with self.app.app_context():
+            while not stop.is_set():
+                try:
+                    id = self.claim(worker)
+                    if id is not None:
+                        self.run(id, worker)
+                except Exception:
+                    # Lost database connection and the like: wait and carry on
+                    self.app.logger.exception("Job worker %s could not take a job", worker)
+                    self.db.session.rollback()
+                    id = None
+                if id is None:
+                    if once:
+                        return
+                    stop.wait(self.app.config['JOB_POLL_INTERVAL'])
+                self.db.session.remove()
+
+    def serve(self, threads, once=False):
+        """Run ``threads`` worker threads in this process until SIGTERM or Ctrl-C."""
+        stop = threading.Event()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(signum, lambda *args: stop.set())
+        workers = [threading.Thread(target=self.work, args=(worker_id(i), stop, once), name="jobs-%d" % i)
+                   for i in range(threads)]
+        for thread in workers:
+            thread.start()
+        # Joined with a timeout so the main thread still gets the signals
+        while any(thread.is_alive() for thread in workers):
+            for thread in workers:
+                thread.join(0.5)
+
+    def run_workers(self, processes, threads, once=False):
+        if processes <= 1:
+            return self.serve(threads, once)
+        context = multiprocessing.get_context('spawn')
+        children = [context.Process(target=worker_process, args=(threads, once)) for i in range(processes)]
+        for child in children:
+            child.start()
+
+        def forward(signum, frame):
+            for child in children:
+                if child.is_alive():
+                    os.kill(child.pid, signal.SIGTERM)
+        signal.signal(signal.SIGTERM, forward)
+        # Ctrl-C reaches the children from the terminal already
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        for child in children:
+            child.join()
+
+    def retry_failed(self, name=None):
+        """Queue failed jobs again with fresh attempts; returns how many."""
+        from models import Jobs
+        query = update(Jobs).where(Jobs.status == 'failed')
+        if name:
+            query = query.where(Jobs.name == name)
+        result = self.db.session.execute(query.values(status='queued', attempts=0, run_at=datetime.utcnow()))
+        self.db.session.commit()
+        return result.rowcount
@@ -1,10 +1,19 @@
 import logging
+import os
+import sys
 from logging.config import fileConfig
 
-from flask import current_app
+from flask import current_app, has_app_context
 
 from alembic import context
 
+# `flask db ...` already runs inside an app context; plain `alembic` does
+# not, so build the app from the factory in that case
+if not has_app_context():
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from hello import create_app
+    create_app().app_context().push()
+
 # this is the Alembic Config object, which provides
 # access to the values within the .ini file in use.
 config = context.config
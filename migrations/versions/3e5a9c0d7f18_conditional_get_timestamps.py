@@ -0,0 +1,35 @@
+"""Post and author profile timestamps for conditional GET
+
+Revision ID: 3e5a9c0d7f18
+Revises: a8d4f0e6b213
+Create Date: 2026-10-17 15:20:08.417236
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3e5a9c0d7f18'
+down_revision = 'a8d4f0e6b213'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('posts', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('updated_at', sa.DateTime(), nullable=True))
+
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('profile_updated_at', sa.DateTime(), nullable=True))
+
+    op.execute("UPDATE posts SET updated_at = date_posted")
+    op.execute("UPDATE users SET profile_updated_at = date_added")
+
+
+def downgrade():
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.drop_column('profile_updated_at')
+
+    with op.batch_alter_table('posts', schema=None) as batch_op:
+        batch_op.drop_column('updated_at')
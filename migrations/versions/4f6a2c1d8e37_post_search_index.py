@@ -0,0 +1,34 @@
+"""Full-text search index on posts
+
+Revision ID: 4f6a2c1d8e37
+Revises: bc99d62a9e84
+Create Date: 2026-10-17 09:12:04.318520
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4f6a2c1d8e37'
+down_revision = 'bc99d62a9e84'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # MySQL maintains a FULLTEXT index itself, SQLite needs an FTS5 table
+    # that the app fills (run `flask reindex-search` once after upgrading)
+    dialect = op.get_bind().dialect.name
+    if dialect == 'mysql':
+        op.create_index('ix_posts_title_content_fulltext', 'posts', ['title', 'content'], mysql_prefix='FULLTEXT')
+    elif dialect == 'sqlite':
+        op.execute("CREATE VIRTUAL TABLE IF NOT EXISTS posts_fts USING fts5(title, content)")
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'mysql':
+        op.drop_index('ix_posts_title_content_fulltext', table_name='posts')
+    elif dialect == 'sqlite':
+        op.execute("DROP TABLE IF EXISTS posts_fts")
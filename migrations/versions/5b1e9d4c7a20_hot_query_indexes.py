@@ -0,0 +1,37 @@
+"""Indexes for the feed, author and user list queries
+
+Revision ID: 5b1e9d4c7a20
+Revises: e2b8c5f1d093
+Create Date: 2026-10-17 12:48:10.206417
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5b1e9d4c7a20'
+down_revision = 'e2b8c5f1d093'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Check the result with `flask check-query-plans`
+    with op.batch_alter_table('posts', schema=None) as batch_op:
+        batch_op.create_index('ix_posts_date_posted_id', ['date_posted', 'id'], unique=False)
+        batch_op.create_index('ix_posts_poster_id_date_posted', ['poster_id', 'date_posted'], unique=False)
+
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.create_index('ix_users_date_added_id', ['date_added', 'id'], unique=False)
+        batch_op.create_index('ix_users_profile_pic', ['profile_pic'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.drop_index('ix_users_profile_pic')
+        batch_op.drop_index('ix_users_date_added_id')
+
+    with op.batch_alter_table('posts', schema=None) as batch_op:
+        batch_op.drop_index('ix_posts_poster_id_date_posted')
+        batch_op.drop_index('ix_posts_date_posted_id')
@@ -0,0 +1,31 @@
+"""Pre-rendered post content, excerpt and reading time
+
+Revision ID: 9d3e7b21a5c4
+Revises: 4f6a2c1d8e37
+Create Date: 2026-10-17 10:03:41.552871
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9d3e7b21a5c4'
+down_revision = '4f6a2c1d8e37'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Existing rows are filled by `flask backfill-posts`
+    with op.batch_alter_table('posts', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('content_html', sa.Text(), nullable=True))
+        batch_op.add_column(sa.Column('excerpt', sa.String(length=300), nullable=True))
+        batch_op.add_column(sa.Column('reading_time', sa.Integer(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('posts', schema=None) as batch_op:
+        batch_op.drop_column('reading_time')
+        batch_op.drop_column('excerpt')
+        batch_op.drop_column('content_html')
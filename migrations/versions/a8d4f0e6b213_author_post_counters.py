@@ -0,0 +1,33 @@
+"""Denormalized post counters on users
+
+Revision ID: a8d4f0e6b213
+Revises: 5b1e9d4c7a20
+Create Date: 2026-10-17 13:05:41.662093
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a8d4f0e6b213'
+down_revision = '5b1e9d4c7a20'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('post_count', sa.Integer(), nullable=False, server_default='0'))
+        batch_op.add_column(sa.Column('last_posted_at', sa.DateTime(), nullable=True))
+
+    # Same statement as `flask reconcile-authors`
+    op.execute("UPDATE users SET "
+               "post_count = (SELECT count(*) FROM posts WHERE posts.poster_id = users.id), "
+               "last_posted_at = (SELECT max(date_posted) FROM posts WHERE posts.poster_id = users.id)")
+
+
+def downgrade():
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.drop_column('last_posted_at')
+        batch_op.drop_column('post_count')
@@ -0,0 +1,36 @@
+"""Unique index on posts.slug
+
+Revision ID: c71f0a9b4e26
+Revises: 9d3e7b21a5c4
+Create Date: 2026-10-17 10:48:19.207733
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c71f0a9b4e26'
+down_revision = '9d3e7b21a5c4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Older posts may share a slug; number the later ones before the index exists
+    conn = op.get_bind()
+    posts = sa.table('posts', sa.column('id', sa.Integer), sa.column('slug', sa.String))
+    seen = set()
+    rows = conn.execute(sa.select(posts.c.id, posts.c.slug).where(posts.c.slug.isnot(None)).order_by(posts.c.id))
+    for id, slug in rows.fetchall():
+        if slug in seen:
+            conn.execute(posts.update().where(posts.c.id == id).values(slug="%s-%d" % (slug[:240], id)))
+        seen.add(slug)
+
+    with op.batch_alter_table('posts', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_posts_slug'), ['slug'], unique=True)
+
+
+def downgrade():
+    with op.batch_alter_table('posts', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_posts_slug'))
@@ -0,0 +1,73 @@
+"""Soft-deleted posts and the posts archive
+
+Revision ID: d4a7e1c93b58
+Revises: 7c2f4b9e1d05
+Create Date: 2026-10-17 21:07:52.318406
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd4a7e1c93b58'
+down_revision = '7c2f4b9e1d05'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    dialect = op.get_bind().dialect.name
+    with op.batch_alter_table('posts', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('deleted_at', sa.DateTime(), nullable=True))
+    if dialect in ('sqlite', 'postgresql'):
+        op.create_index('ix_posts_live_date_posted_id', 'posts', ['date_posted', 'id'], unique=False,
+                        sqlite_where=sa.text('deleted_at IS NULL'),
+                        postgresql_where=sa.text('deleted_at IS NULL'))
+
+    op.create_table('posts_archive',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('title', sa.String(length=255), nullable=True),
+    sa.Column('content', sa.Text(), nullable=True),
+    sa.Column('content_html', sa.Text(), nullable=True),
+    sa.Column('excerpt', sa.String(length=300), nullable=True),
+    sa.Column('reading_time', sa.Integer(), nullable=True),
+    sa.Column('date_posted', sa.DateTime(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.Column('slug', sa.String(length=255), nullable=True),
+    sa.Column('poster_id', sa.Integer(), nullable=True),
+    sa.Column('deleted_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['poster_id'], ['users.id'], ondelete='SET NULL'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('posts_archive', schema=None) as batch_op:
+        batch_op.create_index('ix_posts_archive_date_posted_id', ['date_posted', 'id'], unique=False)
+        batch_op.create_index('ix_posts_archive_poster_id_date_posted', ['poster_id', 'date_posted'], unique=False)
+        batch_op.create_index(batch_op.f('ix_posts_archive_slug'), ['slug'], unique=True)
+
+    # The archive has a full-text index of its own, like posts
+    if dialect == 'mysql':
+        op.create_index('ix_posts_archive_title_content_fulltext', 'posts_archive', ['title', 'content'],
+                        mysql_prefix='FULLTEXT')
+    elif dialect == 'sqlite':
+        op.execute("CREATE VIRTUAL TABLE IF NOT EXISTS posts_archive_fts USING fts5(title, content)")
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    # Archived posts go back to posts, deleted ones are dropped for good
+    columns = "id, title, content, content_html, excerpt, reading_time, date_posted, updated_at, slug, poster_id"
+    op.execute("INSERT INTO posts (%s) SELECT %s FROM posts_archive WHERE deleted_at IS NULL" % (columns, columns))
+    op.execute("DELETE FROM posts WHERE deleted_at IS NOT NULL")
+    if dialect == 'sqlite':
+        op.execute("DROP TABLE IF EXISTS posts_archive_fts")
+    with op.batch_alter_table('posts_archive', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_posts_archive_slug'))
+        batch_op.drop_index('ix_posts_archive_poster_id_date_posted')
+        batch_op.drop_index('ix_posts_archive_date_posted_id')
+    op.drop_table('posts_archive')
+
+    if dialect in ('sqlite', 'postgresql'):
+        op.drop_index('ix_posts_live_date_posted_id', table_name='posts')
+    with op.batch_alter_table('posts', schema=None) as batch_op:
+        batch_op.drop_column('deleted_at')
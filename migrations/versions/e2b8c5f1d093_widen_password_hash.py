@@ -0,0 +1,32 @@
+"""Widen users.password_hash for scrypt hashes
+
+Revision ID: e2b8c5f1d093
+Revises: c71f0a9b4e26
+Create Date: 2026-10-17 11:36:52.870114
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e2b8c5f1d093'
+down_revision = 'c71f0a9b4e26'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.alter_column('password_hash',
+               existing_type=sa.String(length=128),
+               type_=sa.String(length=255),
+               existing_nullable=True)
+
+
+def downgrade():
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.alter_column('password_hash',
+               existing_type=sa.String(length=255),
+               type_=sa.String(length=128),
+               existing_nullable=True)
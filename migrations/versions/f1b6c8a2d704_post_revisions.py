@@ -0,0 +1,47 @@
+"""Post revisions and drafts
+
+Revision ID: f1b6c8a2d704
+Revises: d4a7e1c93b58
+Create Date: 2026-10-17 23:26:10.472958
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f1b6c8a2d704'
+down_revision = 'd4a7e1c93b58'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('post_revisions',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('post_id', sa.Integer(), nullable=True),
+    sa.Column('author_id', sa.Integer(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.Column('draft', sa.Boolean(), nullable=False),
+    sa.Column('title', sa.String(length=255), nullable=True),
+    sa.Column('slug', sa.String(length=255), nullable=True),
+    sa.Column('parent_id', sa.Integer(), nullable=True),
+    sa.Column('depth', sa.Integer(), nullable=False),
+    sa.Column('data', sa.LargeBinary(), nullable=False),
+    sa.Column('length', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['author_id'], ['users.id'], ondelete='SET NULL'),
+    sa.ForeignKeyConstraint(['post_id'], ['posts.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('parent_id')
+    )
+    with op.batch_alter_table('post_revisions', schema=None) as batch_op:
+        batch_op.create_index('ix_post_revisions_author_id_post_id', ['author_id', 'post_id'], unique=False)
+        batch_op.create_index('ix_post_revisions_post_id_id', ['post_id', 'id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('post_revisions', schema=None) as batch_op:
+        batch_op.drop_index('ix_post_revisions_post_id_id')
+        batch_op.drop_index('ix_post_revisions_author_id_post_id')
+
+    op.drop_table('post_revisions')
@@ -0,0 +1,206 @@
+from datetime import datetime
+from flask_login import UserMixin
+from sqlalchemy import case, func, select
+from extensions import db, login_manager, passwords
+from user_cache import UserCache, SNAPSHOT_FIELDS
+
+# Columns shared by live posts and the archive
+class PostColumns:
+    id = db.Column(db.Integer, primary_key=True)
+    title = db.Column(db.String(255))
+    content = db.Column(db.Text)
+    # Derived from content by process_post() whenever the post is saved
+    content_html = db.Column(db.Text)
+    excerpt = db.Column(db.String(300))
+    reading_time = db.Column(db.Integer)
+    #author = db.Column(db.String(255))
+    date_posted = db.Column(db.DateTime, default=datetime.utcnow)
+    # Set again by edit_post(); the post page's ETag and Last-Modified
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+    slug = db.Column(db.String(255), unique=True, index=True)
+    # Couple user to post
+    poster_id = db.Column(db.Integer, db.ForeignKey("users.id"))
+    # Set by delete_post(); deleted posts stay in the table but are never shown
+    deleted_at = db.Column(db.DateTime)
+
+    @classmethod
+    def live(cls):
+        return cls.deleted_at == None
+
+# Create blog post model
+class Posts(PostColumns, db.Model):
+    __table_args__ = (
+        # The feed walks (date_posted, id) newest first in keyset ranges
+        db.Index('ix_posts_date_posted_id', 'date_posted', 'id'),
+        # The same walk over live posts only; MySQL has no partial indexes
+        # and skips the few deleted rows while walking the one above
+        db.Index('ix_posts_live_date_posted_id', 'date_posted', 'id',
+                 sqlite_where=db.text('deleted_at IS NULL'),
+                 postgresql_where=db.text('deleted_at IS NULL')).ddl_if(dialect=('sqlite', 'postgresql')),
+        # Users.posts and an author's posts in date order
+        db.Index('ix_posts_poster_id_date_posted', 'poster_id', 'date_posted'),
+    )
+
+# Posts moved out of the posts table by `flask archive-posts`, keeping their
+# ids and slugs so permalinks still work
+class ArchivedPosts(PostColumns, db.Model):
+    __tablename__ = 'posts_archive'
+    # Deleting a user keeps their archived posts unattributed, like live ones
+    poster_id = db.Column(db.Integer, db.ForeignKey("users.id", ondelete="SET NULL"))
+    poster = db.relationship("Users")
+
+    __table_args__ = (
+        db.Index('ix_posts_archive_date_posted_id', 'date_posted', 'id'),
+        db.Index('ix_posts_archive_poster_id_date_posted', 'poster_id', 'date_posted'),
+    )
+
+# Create Model
+class Users(db.Model, UserMixin):
+    id = db.Column(db.Integer, primary_key=True)
+    username = db.Column(db.String(20), nullable=False, unique=True)
+    name = db.Column(db.String(200), nullable=False)
+    email = db.Column(db.String(120), nullable=False, unique=True)
+    favorite_color = db.Column(db.String(120))
+    about_author = db.Column(db.Text(500), nullable=True)
+    date_added = db.Column(db.DateTime, default=datetime.utcnow)
+    profile_pic = db.Column(db.String(200), nullable=True)
+    # Do some password stuff
+    password_hash = db.Column(db.String(255))
+    # Kept in step with the posts table by post_added()/post_removed(),
+    # `flask reconcile-authors` repairs any drift
+    post_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    last_posted_at = db.Column(db.DateTime)
+    # Bumped by the profile forms, so pages showing the author revalidate
+    profile_updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+    posts = db.relationship("Posts", backref='poster')
+
+    # username and email lookups use their unique indexes
+    __table_args__ = (
+        # User list in sign-up order
+        db.Index('ix_users_date_added_id', 'date_added', 'id'),
+        # Checked before deleting a replaced profile picture
+        db.Index('ix_users_profile_pic', 'profile_pic'),
+    )
+
+    @property
+    def password(self):
+        raise AttributeError('password is not a readable attribute!')
+    
+    @password.setter
+    def password(self, password):
+        self.password_hash = passwords.hash(password)
+
+    def verify_password(self, password):
+        return passwords.verify(self.password_hash, password)
+
+    # Create a string
+    def __repr__(self):
+        return '<Name %r>' % self.name
+
+# Background jobs waiting to run (see jobs.py); finished jobs are deleted
+class Jobs(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(50), nullable=False)
+    payload = db.Column(db.Text, nullable=False)
+    # Jobs enqueued with the same key are merged into one
+    key = db.Column(db.String(191), unique=True)
+    # queued, or failed once JOB_MAX_ATTEMPTS ran out
+    status = db.Column(db.String(10), nullable=False, default='queued')
+    run_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    # Bumped when the job is enqueued again, so a running copy knows it is outdated
+    version = db.Column(db.Integer, nullable=False, default=1)
+    locked_by = db.Column(db.String(64))
+    locked_until = db.Column(db.DateTime)
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        # Workers look for due jobs in run_at order
+        db.Index('ix_jobs_status_run_at', 'status', 'run_at'),
+    )
+
+# Saved and autosaved versions of a post (see revisions.py)
+class PostRevisions(db.Model):
+    __tablename__ = 'post_revisions'
+    id = db.Column(db.Integer, primary_key=True)
+    # None for the draft of a post that has not been added yet
+    post_id = db.Column(db.Integer, db.ForeignKey("posts.id"))
+    author_id = db.Column(db.Integer, db.ForeignKey("users.id", ondelete="SET NULL"))
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    # Autosaved and not yet saved with the form
+    draft = db.Column(db.Boolean, nullable=False, default=False)
+    title = db.Column(db.String(255))
+    slug = db.Column(db.String(255))
+    # The revision this one was saved over; unique, so a post's revisions
+    # form a single line
+    parent_id = db.Column(db.Integer, unique=True)
+    # Revisions since the last full snapshot; 0 is a snapshot, anything else
+    # a compressed diff against the parent
+    depth = db.Column(db.Integer, nullable=False, default=0)
+    data = db.Column(db.LargeBinary, nullable=False)
+    length = db.Column(db.Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        # A post's history in order, and the chain behind one revision
+        db.Index('ix_post_revisions_post_id_id', 'post_id', 'id'),
+        # Drafts of new posts are looked up by author
+        db.Index('ix_post_revisions_author_id_post_id', 'author_id', 'post_id'),
+    )
+
+# Author counters, updated with single UPDATE statements in the same
+# transaction as the post itself so concurrent writers cannot lose counts
+def post_added(post):
+    if post.poster_id is None:
+        return
+    db.session.execute(
+        db.update(Users)
+        .where(Users.id == post.poster_id)
+        .values(post_count=Users.post_count + 1,
+                last_posted_at=case((Users.last_posted_at == None, post.date_posted),
+                                    (Users.last_posted_at < post.date_posted, post.date_posted),
+                                    else_=Users.last_posted_at)))
+
+def post_removed(poster_id):
+    # Call after the post has been flagged deleted and flushed
+    if poster_id is None:
+        return
+    db.session.execute(
+        db.update(Users)
+        .where(Users.id == poster_id)
+        .values(post_count=Users.post_count - 1,
+                last_posted_at=author_stats_subqueries()[1]))
+
+def author_stats_subqueries():
+    # Correlated (count, latest date) of the live posts of the user in the
+    # outer query, archived ones included so archiving leaves them alone
+    def stats(model):
+        mine = (model.poster_id == Users.id, model.live())
+        return (select(func.count(model.id)).where(*mine).scalar_subquery(),
+                select(func.max(model.date_posted)).where(*mine).scalar_subquery())
+    posts, latest = stats(Posts)
+    archived, archived_latest = stats(ArchivedPosts)
+    return posts + archived, func.coalesce(latest, archived_latest)
+
+def refresh_author_stats(user_ids):
+    """Recount post_count and last_posted_at of the given users from posts."""
+    if not user_ids:
+        return
+    count, latest = author_stats_subqueries()
+    db.session.execute(
+        db.update(Users)
+        .where(Users.id.in_(list(user_ids)))
+        .values(post_count=count, last_posted_at=latest))
+
+# Only the columns most pages show are read for the session user
+def load_user_snapshot(id):
+    return (db.session.query(*[getattr(Users, field) for field in SNAPSHOT_FIELDS])
+            .filter(Users.id == id)
+            .first())
+
+user_cache = UserCache(load_snapshot=load_user_snapshot,
+                       load_row=lambda id: Users.query.get(id))
+
+@login_manager.user_loader
+def load_user(user_id):
+    return user_cache.get(int(user_id))
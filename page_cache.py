@@ -0,0 +1,329 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from flask import Response, g, request, session
+from flask_login import current_user
+from redis_client import RedisClient
+
+# Rendered-page cache
+#
+# Anonymous GET requests for cached views are answered from a stored copy of
+# the rendered HTML. Every cached page carries tags naming the rows it shows
+# (for example "post:12" or "author:3"), and the write views invalidate those
+# tags, so only the pages that really changed are thrown away.
+
+
+class MemoryBackend:
+    """In-process LRU, bounded by the total size of the stored pages."""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.entries = OrderedDict()
+        self.tags = {}
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            body, expires = entry
+            if expires < time.time():
+                self._delete(key)
+                return None
+            self.entries.move_to_end(key)
+            return body
+
+    def set(self, key, body, tags, ttl):
+        if len(body) > self.max_bytes:
+            return
+        with self.lock:
+            self._delete(key)
+            self.entries[key] = (body, time.time() + ttl)
+            self.size += len(body)
+            for tag in tags:
+                self.tags.setdefault(tag, set()).add(key)
+            while self.size > self.max_bytes:
+                self._delete(next(iter(self.entries)))
+
+    def invalidate(self, tag):
+        with self.lock:
+            for key in self.tags.pop(tag, ()):
+                self._delete(key)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.tags.clear()
+            self.size = 0
+
+    def _delete(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.size -= len(entry[0])
+
+    def info(self):
+        return {"entries": len(self.entries), "bytes": self.size, "max_bytes": self.max_bytes}
+
+
+class FilesystemBackend:
+    """One file per page, shared by every worker on the host."""
+
+    prune_every = 100
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.writes = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, prefix, name):
+        return os.path.join(self.directory, prefix + hashlib.sha1(name.encode()).hexdigest())
+
+    def get(self, key):
+        path = self._path("page-", key)
+        try:
+            with open(path, "rb") as f:
+                expires = float(f.readline())
+                if expires < time.time():
+                    os.remove(path)
+                    return None
+                body = f.read()
+        except (OSError, ValueError):
+            return None
+        # Touch the file so pruning keeps recently used pages
+        os.utime(path)
+        return body
+
+    def set(self, key, body, tags, ttl):
+        path = self._path("page-", key)
+        tmp = "%s.%d.%d" % (path, os.getpid(), threading.get_ident())
+        with open(tmp, "wb") as f:
+            f.write(b"%f\n" % (time.time() + ttl))
+            f.write(body)
+        os.replace(tmp, path)
+        for tag in tags:
+            with open(self._path("tag-", tag), "a") as f:
+                f.write(path + "\n")
+        self.writes += 1
+        if self.writes % self.prune_every == 0:
+            self.prune()
+
+    def invalidate(self, tag):
+        # Claim the tag file first so pages tagged meanwhile start a new one
+        tag_path = self._path("tag-", tag)
+        claimed = "%s.%d.%d" % (tag_path, os.getpid(), threading.get_ident())
+        try:
+            os.rename(tag_path, claimed)
+        except OSError:
+            return
+        with open(claimed) as f:
+            for path in f.read().split():
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+        os.remove(claimed)
+
+    def clear(self):
+        for name in os.listdir(self.directory):
+            os.remove(os.path.join(self.directory, name))
+
+    def _pages(self):
+        for entry in os.scandir(self.directory):
+            if entry.name.startswith("page-"):
+                yield entry, entry.stat()
+
+    def prune(self):
+        # Drop least recently used pages until the directory fits the cap
+        pages = sorted(self._pages(), key=lambda page: page[1].st_mtime)
+        total = sum(stat.st_size for entry, stat in pages)
+        for entry, stat in pages:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(entry.path)
+            except OSError:
+                pass
+            total -= stat.st_size
+
+    def info(self):
+        pages = list(self._pages())
+        return {"entries": len(pages), "bytes": sum(stat.st_size for entry, stat in pages),
+                "max_bytes": self.max_bytes}
+
+
+class RedisBackend:
+    """Pages in any Redis-compatible server.
+
+    Size limits and eviction are left to the server (maxmemory together with
+    an allkeys-lru policy).
+    """
+
+    def __init__(self, url, prefix="flaskblogger:page:"):
+        self.client = RedisClient(url)
+        self.prefix = prefix
+
+    def get(self, key):
+        return self.client.call("GET", self.prefix + key)
+
+    def set(self, key, body, tags, ttl):
+        self.client.call("SET", self.prefix + key, body, "EX", int(ttl))
+        for tag in tags:
+            self.client.call("SADD", self.prefix + "tag:" + tag, self.prefix + key)
+            self.client.call("EXPIRE", self.prefix + "tag:" + tag, int(ttl))
+
+    def invalidate(self, tag):
+        tag_key = self.prefix + "tag:" + tag
+        keys = self.client.call("SMEMBERS", tag_key) or []
+        self.client.call("DEL", tag_key, *keys)
+
+    def clear(self):
+        keys = self.client.call("KEYS", self.prefix + "*") or []
+        if keys:
+            self.client.call("DEL", *keys)
+
+    def info(self):
+        return {"server": "%s:%d" % self.client.address}
+
+
+# Stored pages keep the headers that describe the body
+STORED_HEADERS = ('Content-Type', 'ETag', 'Last-Modified', 'Cache-Control')
+PACKED = b"PC1 "
+
+
+def pack(response):
+    headers = {name: response.headers[name] for name in STORED_HEADERS if name in response.headers}
+    return PACKED + json.dumps(headers).encode() + b"\n" + response.get_data()
+
+
+def unpack(body):
+    if not body.startswith(PACKED):
+        # Stored before headers were kept
+        return Response(body, mimetype='text/html')
+    headers, body = body[len(PACKED):].split(b"\n", 1)
+    response = Response(body)
+    response.headers.update(json.loads(headers))
+    return response
+
+
+class PageCache:
+    def __init__(self, app=None):
+        self.backend = None
+        self.hits = 0
+        self.misses = 0
+        self.bypasses = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('PAGE_CACHE_BACKEND', 'memory')
+        app.config.setdefault('PAGE_CACHE_TTL', 300)
+        app.config.setdefault('PAGE_CACHE_MAX_BYTES', 32 * 1024 * 1024)
+        app.config.setdefault('PAGE_CACHE_DIR', os.path.join(app.instance_path, 'page_cache'))
+        app.config.setdefault('PAGE_CACHE_REDIS_URL', 'redis://localhost:6379/0')
+        self.app = app
+        self.backend = None
+        app.extensions['page_cache'] = self
+
+    def get_backend(self):
+        if self.backend is None:
+            config = self.app.config
+            name = config['PAGE_CACHE_BACKEND']
+            if name == 'memory':
+                self.backend = MemoryBackend(config['PAGE_CACHE_MAX_BYTES'])
+            elif name == 'filesystem':
+                self.backend = FilesystemBackend(config['PAGE_CACHE_DIR'], config['PAGE_CACHE_MAX_BYTES'])
+            elif name == 'redis':
+                self.backend = RedisBackend(config['PAGE_CACHE_REDIS_URL'])
+            else:
+                raise ValueError("Unknown page cache backend %r" % name)
+        return self.backend
+
+    @property
+    def enabled(self):
+        return self.app.config['PAGE_CACHE_BACKEND'] != 'none'
+
+    def tag(self, *tags):
+        # Called from inside a cached view to name the rows the page shows
+        g.setdefault('page_cache_tags', set()).update(tags)
+
+    def invalidate(self, *tags):
+        if not self.enabled:
+            return
+        for tag in tags:
+            try:
+                self.get_backend().invalidate(tag)
+            except (OSError, ConnectionError, RuntimeError) as e:
+                self.app.logger.warning("Page cache invalidation failed: %s", e)
+
+    def cacheable(self):
+        # Logged-in users see their own controls, and pending flash messages
+        # belong to a single visitor, so neither may be served from the cache
+        return (self.enabled
+                and request.method == 'GET'
+                and not current_user.is_authenticated
+                and not session.get('_flashes'))
+
+    def key(self):
+        args = "&".join("%s=%s" % item for item in sorted(request.args.items(multi=True)))
+        params = "&".join("%s=%s" % item for item in sorted((request.view_args or {}).items()))
+        return "%s|%s|%s" % (request.endpoint, params, args)
+
+    def lookup(self, key):
+        """The stored response for ``key``, or None when it has to be rendered."""
+        try:
+            body = self.get_backend().get(key)
+        except (OSError, ConnectionError, RuntimeError) as e:
+            self.app.logger.warning("Page cache read failed: %s", e)
+            return None
+        if body is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        response = unpack(body)
+        response.headers['X-Cache'] = 'HIT'
+        # Stored validators let a hit still end in a 304
+        return response.make_conditional(request)
+
+    def store(self, key, response):
+        if response.status_code == 200 and not response.direct_passthrough:
+            try:
+                self.get_backend().set(key, pack(response), g.get('page_cache_tags', ()),
+                                       self.app.config['PAGE_CACHE_TTL'])
+            except (OSError, ConnectionError, RuntimeError) as e:
+                self.app.logger.warning("Page cache write failed: %s", e)
+        response.headers['X-Cache'] = 'MISS'
+        return response
+
+    def cached(self, view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if not self.cacheable():
+                self.bypasses += 1
+                return view(*args, **kwargs)
+
+            key = self.key()
+            response = self.lookup(key)
+            if response is None:
+                response = self.store(key, self.app.make_response(view(*args, **kwargs)))
+            return response
+        return wrapper
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        stats = {
+            "backend": self.app.config['PAGE_CACHE_BACKEND'],
+            "hits": self.hits,
+            "misses": self.misses,
+            "bypasses": self.bypasses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
+        if self.enabled:
+            stats.update(self.get_backend().info())
+        return stats
@@ -0,0 +1,107 @@
+import base64
+import binascii
+from datetime import datetime
+from sqlalchemy import and_, or_
+
+# Keyset (cursor) pagination
+#
+# Pages are addressed by the (timestamp, id) of the last row the client saw,
+# so every page is a single index range scan no matter how deep the reader
+# scrolls, and rows inserted in the meantime never shift the page boundaries.
+
+
+def encode_cursor(timestamp, id):
+    raw = "%s|%d" % (timestamp.isoformat(), id)
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    # Returns (timestamp, id) or None for a missing or tampered cursor
+    if not cursor:
+        return None
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        timestamp, id = base64.urlsafe_b64decode(padded).decode().split("|")
+        return datetime.fromisoformat(timestamp), int(id)
+    except (ValueError, binascii.Error, UnicodeDecodeError):
+        return None
+
+
+class KeysetPage:
+    def __init__(self, items, next_cursor=None, prev_cursor=None):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self):
+        return self.prev_cursor is not None
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+def keyset_query(query, order_column, id_column, per_page, after=None, before=None, descending=True):
+    """Filter, order and limit ``query`` to the rows of one page.
+
+    Works on a Query as well as on a select() for the async views. Returns
+    ``(query, backwards)``; the fetched rows go to :func:`keyset_page`.
+    """
+    def beyond(key, smaller):
+        stamp, id = key
+        if smaller:
+            return or_(order_column < stamp, and_(order_column == stamp, id_column < id))
+        return or_(order_column > stamp, and_(order_column == stamp, id_column > id))
+
+    def ordered(query, desc):
+        if desc:
+            return query.order_by(order_column.desc(), id_column.desc())
+        return query.order_by(order_column.asc(), id_column.asc())
+
+    before_key = decode_cursor(before)
+    if before_key is not None:
+        query = ordered(query.filter(beyond(before_key, not descending)), not descending)
+        return query.limit(per_page + 1), True
+
+    after_key = decode_cursor(after)
+    if after_key is not None:
+        query = query.filter(beyond(after_key, descending))
+    return ordered(query, descending).limit(per_page + 1), False
+
+
+def keyset_page(rows, order_column, id_column, per_page, backwards, after=None):
+    def cursor_for(row):
+        return encode_cursor(getattr(row, order_column.key), getattr(row, id_column.key))
+
+    has_more = len(rows) > per_page
+    if backwards:
+        items = list(reversed(rows[:per_page]))
+        return KeysetPage(items,
+                          next_cursor=cursor_for(items[-1]),
+                          prev_cursor=cursor_for(items[0]) if has_more else None)
+    items = rows[:per_page]
+    return KeysetPage(items,
+                      next_cursor=cursor_for(items[-1]) if has_more else None,
+                      prev_cursor=cursor_for(items[0]) if decode_cursor(after) is not None and items else None)
+
+
+def keyset_paginate(query, order_column, id_column, per_page, after=None, before=None, descending=True):
+    """Return one page of ``query`` ordered by (order_column, id_column), newest first unless not ``descending``.
+
+    ``after`` walks away from the first page, ``before`` back towards it.
+    Both are cursors as produced by :func:`encode_cursor`; invalid cursors
+    fall back to the first page.
+    """
+    page_query, backwards = keyset_query(query, order_column, id_column, per_page, after, before, descending)
+    rows = page_query.all()
+    if backwards and not rows:
+        # Nothing before the cursor any more, start over at the top
+        return keyset_paginate(query, order_column, id_column, per_page, descending=descending)
+    return keyset_page(rows, order_column, id_column, per_page, backwards, after)
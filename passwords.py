@@ -0,0 +1,137 @@
+import hashlib
+import hmac
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from werkzeug.security import generate_password_hash, check_password_hash
+
+# Password hashing policy
+#
+# The algorithm and cost come from PASSWORD_HASH_METHOD (any werkzeug method
+# string, e.g. "scrypt:32768:8:1" or "pbkdf2:sha256:600000"). Hashes stored
+# with another method or cost are replaced on the next successful login, and
+# all hashing runs on a small bounded pool so a burst of logins queues up
+# there instead of tying up every request worker on CPU.
+
+
+class HashingBusy(Exception):
+    """Raised when the hashing pool is saturated."""
+
+
+def legacy_check(pwhash, password):
+    # "sha256$salt$hexdigest" hashes written by werkzeug < 2.3, which newer
+    # werkzeug releases can no longer verify
+    try:
+        method, salt, hashval = pwhash.split("$", 2)
+    except ValueError:
+        return False
+    if method not in hashlib.algorithms_guaranteed:
+        return False
+    digest = hmac.new(salt.encode(), password.encode(), method).hexdigest()
+    return hmac.compare_digest(digest, hashval)
+
+
+def check(pwhash, password):
+    if not pwhash:
+        return False
+    method = pwhash.split("$", 1)[0]
+    if method.startswith("pbkdf2") or method.startswith("scrypt"):
+        return check_password_hash(pwhash, password)
+    return legacy_check(pwhash, password)
+
+
+def time_method(method, rounds=3):
+    # Median milliseconds for one hash with ``method``
+    samples = []
+    for i in range(rounds):
+        start = time.perf_counter()
+        generate_password_hash("calibration password", method)
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+def calibrate(target_ms, algorithm="scrypt"):
+    """Return (method, measured ms) closest to ``target_ms`` on this machine."""
+    if algorithm == "pbkdf2":
+        iterations = 50000
+        elapsed = time_method("pbkdf2:sha256:%d" % iterations)
+        iterations = max(1000, int(round(iterations * target_ms / elapsed, -3)))
+        method = "pbkdf2:sha256:%d" % iterations
+        return method, time_method(method)
+    if algorithm == "scrypt":
+        # scrypt cost must be a power of two; keep the one nearest the target
+        best = None
+        n = 2 ** 12
+        while n <= 2 ** 20:
+            method = "scrypt:%d:8:1" % n
+            elapsed = time_method(method)
+            if best is None or abs(elapsed - target_ms) < abs(best[1] - target_ms):
+                best = (method, elapsed)
+            if elapsed >= target_ms:
+                break
+            n *= 2
+        return best
+    raise ValueError("Unknown password hash algorithm %r" % algorithm)
+
+
+class PasswordHasher:
+    def __init__(self, app=None):
+        self.executor = None
+        self.slots = None
+        self.method = None
+        self.lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('PASSWORD_HASH_METHOD', 'scrypt:32768:8:1')
+        app.config.setdefault('PASSWORD_HASH_WORKERS', 2)
+        # Hashes allowed to wait for a free worker before new ones are refused
+        app.config.setdefault('PASSWORD_HASH_QUEUE', 16)
+        app.config.setdefault('PASSWORD_HASH_TIMEOUT', 5.0)
+        self.app = app
+        self.method = None
+        app.extensions['passwords'] = self
+
+    def _pool(self):
+        # Created lazily so each forked worker gets its own threads
+        with self.lock:
+            if self.executor is None:
+                config = self.app.config
+                self.executor = ThreadPoolExecutor(max_workers=config['PASSWORD_HASH_WORKERS'],
+                                                   thread_name_prefix="passwords")
+                self.slots = threading.BoundedSemaphore(config['PASSWORD_HASH_WORKERS'] + config['PASSWORD_HASH_QUEUE'])
+            return self.executor
+
+    def _run(self, fn, *args):
+        executor = self._pool()
+        if not self.slots.acquire(blocking=False):
+            raise HashingBusy()
+        try:
+            future = executor.submit(fn, *args)
+        except BaseException:
+            self.slots.release()
+            raise
+        future.add_done_callback(lambda f: self.slots.release())
+        try:
+            return future.result(timeout=self.app.config['PASSWORD_HASH_TIMEOUT'])
+        except TimeoutError:
+            raise HashingBusy()
+
+    @property
+    def current_method(self):
+        # werkzeug expands short names ("scrypt") into the full parameter
+        # string it stores, so compare against what it actually writes
+        if self.method is None:
+            self.method = generate_password_hash("x", self.app.config['PASSWORD_HASH_METHOD']).split("$", 1)[0]
+        return self.method
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, self.app.config['PASSWORD_HASH_METHOD'])
+
+    def verify(self, pwhash, password):
+        return self._run(check, pwhash, password)
+
+    def needs_rehash(self, pwhash):
+        return not pwhash or pwhash.split("$", 1)[0] != self.current_method
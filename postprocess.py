@@ -0,0 +1,136 @@
+import math
+import re
+from html import escape
+from html.parser import HTMLParser
+
+# Write-time processing of post content
+#
+# CKEditor hands us raw HTML. It is sanitized once when a post is saved and
+# stored next to the original together with a plain-text excerpt and a
+# reading-time estimate, so the read views only print stored columns.
+
+ALLOWED_TAGS = {
+    "a", "b", "blockquote", "br", "code", "div", "em", "h1", "h2", "h3", "h4",
+    "h5", "h6", "hr", "i", "img", "li", "ol", "p", "pre", "s", "span", "strong",
+    "sub", "sup", "table", "tbody", "td", "tfoot", "th", "thead", "tr", "u", "ul",
+}
+ALLOWED_ATTRIBUTES = {
+    "a": {"href", "title"},
+    "img": {"src", "alt", "title", "width", "height"},
+    "td": {"colspan", "rowspan"},
+    "th": {"colspan", "rowspan"},
+}
+URL_ATTRIBUTES = {"href", "src"}
+ALLOWED_SCHEMES = {"http", "https", "mailto"}
+VOID_TAGS = {"br", "hr", "img"}
+# Tags whose whole content is dropped, not just the tag itself
+DROP_CONTENT_TAGS = {"script", "style", "iframe", "object", "embed", "noscript", "template"}
+BLOCK_TAGS = {"p", "div", "br", "li", "blockquote", "pre", "tr", "h1", "h2", "h3", "h4", "h5", "h6"}
+
+EXCERPT_LENGTH = 280
+WORDS_PER_MINUTE = 200
+
+SCHEME_RE = re.compile(r"^([a-zA-Z][a-zA-Z0-9+.-]*):")
+SPACE_RE = re.compile(r"\s+")
+
+
+def safe_url(value):
+    # Relative URLs are fine, absolute ones need an allowed scheme
+    cleaned = "".join(ch for ch in value if ch > " ")
+    match = SCHEME_RE.match(cleaned)
+    return match is None or match.group(1).lower() in ALLOWED_SCHEMES
+
+
+class Sanitizer(HTMLParser):
+    """Allow-list HTML cleaner that also collects the visible text."""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.html = []
+        self.text = []
+        self.open_tags = []
+        self.dropping = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in DROP_CONTENT_TAGS:
+            self.dropping += 1
+            return
+        if self.dropping:
+            return
+        if tag in BLOCK_TAGS:
+            self.text.append(" ")
+        if tag not in ALLOWED_TAGS:
+            return
+        allowed = ALLOWED_ATTRIBUTES.get(tag, ())
+        cleaned = []
+        for name, value in attrs:
+            if name not in allowed or value is None:
+                continue
+            if name in URL_ATTRIBUTES and not safe_url(value):
+                continue
+            cleaned.append(' %s="%s"' % (name, escape(value, quote=True)))
+        if tag == "a":
+            cleaned.append(' rel="nofollow noopener"')
+        self.html.append("<%s%s>" % (tag, "".join(cleaned)))
+        if tag not in VOID_TAGS:
+            self.open_tags.append(tag)
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        if tag not in VOID_TAGS:
+            self.handle_endtag(tag)
+
+    def handle_endtag(self, tag):
+        if tag in DROP_CONTENT_TAGS:
+            self.dropping = max(0, self.dropping - 1)
+            return
+        if self.dropping or tag not in self.open_tags:
+            return
+        # Close anything left open inside this tag so the output stays balanced
+        while self.open_tags:
+            open_tag = self.open_tags.pop()
+            self.html.append("</%s>" % open_tag)
+            if open_tag == tag:
+                break
+        if tag in BLOCK_TAGS:
+            self.text.append(" ")
+
+    def handle_data(self, data):
+        if self.dropping:
+            return
+        self.html.append(escape(data, quote=False))
+        self.text.append(data)
+
+    def result(self):
+        self.close()
+        while self.open_tags:
+            self.html.append("</%s>" % self.open_tags.pop())
+        return "".join(self.html), SPACE_RE.sub(" ", "".join(self.text)).strip()
+
+
+def sanitize_html(html):
+    # Returns (clean html, plain text)
+    sanitizer = Sanitizer()
+    sanitizer.feed(html or "")
+    return sanitizer.result()
+
+
+def make_excerpt(text, length=EXCERPT_LENGTH):
+    if len(text) <= length:
+        return text
+    cut = text[:length].rsplit(" ", 1)[0]
+    return cut.rstrip(",.;:!?-") + "…"
+
+
+def reading_time(text):
+    # Minutes, never less than one
+    return max(1, math.ceil(len(text.split()) / WORDS_PER_MINUTE))
+
+
+def process_post(post):
+    """Fill the derived columns of ``post`` from its raw content."""
+    html, text = sanitize_html(post.content)
+    post.content_html = html
+    post.excerpt = make_excerpt(text)
+    post.reading_time = reading_time(text)
+    return post
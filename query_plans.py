@@ -0,0 +1,84 @@
+import re
+from contextlib import contextmanager
+from sqlalchemy import event
+
+# Query plan checks
+#
+# Runs the pages and lookups that should be served from an index, records
+# every SELECT they send, and asks the database for its plan with EXPLAIN.
+# A full table scan of one of the indexed tables is reported as a failure.
+
+CHECKED_TABLES = ("posts", "users")
+
+# "SCAN posts" (or "SCAN TABLE posts" before SQLite 3.36) without an index
+SQLITE_FULL_SCAN = re.compile(r"^SCAN (?:TABLE )?(\w+)(?: AS \w+)?$")
+
+
+@contextmanager
+def capture(engines):
+    """Collect (engine, statement, parameters) for every SELECT executed."""
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT"):
+            statements.append((conn.engine, statement, parameters))
+
+    for engine in engines:
+        event.listen(engine, "before_cursor_execute", record)
+    try:
+        yield statements
+    finally:
+        for engine in engines:
+            event.remove(engine, "before_cursor_execute", record)
+
+
+def explain(engine, statement, parameters):
+    """Return (plan lines, fully scanned tables) for one statement."""
+    with engine.connect() as conn:
+        if engine.dialect.name == "sqlite":
+            rows = conn.exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters).all()
+            lines = [row[-1] for row in rows]
+            scans = [m.group(1) for m in map(SQLITE_FULL_SCAN.match, lines) if m]
+        elif engine.dialect.name == "mysql":
+            rows = conn.exec_driver_sql("EXPLAIN " + statement, parameters).mappings().all()
+            lines = ["table=%(table)s type=%(type)s key=%(key)s rows=%(rows)s Extra=%(Extra)s" % row
+                     for row in rows]
+            scans = [row["table"] for row in rows if row["type"] == "ALL"]
+        else:
+            raise ValueError("EXPLAIN is not supported for %s" % engine.dialect.name)
+    return lines, [table for table in scans if table in CHECKED_TABLES]
+
+
+class PlanCheck:
+    def __init__(self, name, statement, lines, scans):
+        self.name = name
+        self.statement = statement
+        self.lines = lines
+        self.scans = scans
+
+    @property
+    def ok(self):
+        return not self.scans
+
+
+def check(engines, checks, session=None):
+    """Run each (name, callable) in ``checks`` and explain what it queried.
+
+    ``session`` is emptied before every check so rows loaded by an earlier
+    one are queried again instead of coming from the identity map.
+    """
+    results = []
+    for name, run in checks:
+        if session is not None:
+            session.expunge_all()
+        with capture(engines) as statements:
+            run()
+        # Lazy loads repeat the same statement for every row
+        seen = set()
+        for engine, statement, parameters in statements:
+            if statement in seen:
+                continue
+            seen.add(statement)
+            lines, scans = explain(engine, statement, parameters)
+            results.append(PlanCheck(name, statement, lines, scans))
+    return results
@@ -0,0 +1,277 @@
+import math
+import re
+import threading
+import time
+from collections import Counter, OrderedDict
+from flask import request
+from redis_client import RedisClient
+
+# Rate limiting
+#
+# Limits are configured per endpoint in RATELIMITS as rule strings:
+#
+#     '10/minute per ip on POST'       sliding window of one minute
+#     '2/second burst 20 per ip'       token bucket: 2 tokens a second, 20 at most
+#     '5/minute per username on POST'  keyed on a form field, lowercased
+#
+# Rules are checked in a before_request hook, so a rejected request gets its
+# 429 before the form is validated, a password is hashed or a query runs. A
+# rule whose key is missing from the request (no such form field) is skipped.
+# Behind a reverse proxy set PROXY_FIX_X_FOR, or every client shares the
+# proxy's address and with it one 'per ip' counter.
+
+PERIODS = {'second': 1, 'minute': 60, 'hour': 3600, 'day': 86400}
+RULE = re.compile(r"^\s*(\d+)\s*/\s*(second|minute|hour|day)(?:\s+burst\s+(\d+))?\s+per\s+(\w+)"
+                  r"(?:\s+on\s+([A-Za-z,\s]+?))?\s*$")
+# Form values are user input; only this much of them goes into a counter key
+MAX_KEY_LENGTH = 100
+
+
+class Rule:
+    def __init__(self, text):
+        match = RULE.match(text)
+        if match is None:
+            raise ValueError("Invalid rate limit %r" % text)
+        count, period, burst, self.key, methods = match.groups()
+        if not int(count) or burst == '0':
+            raise ValueError("Rate limit %r allows no requests" % text)
+        self.text = text
+        self.limit = int(count)
+        self.period = PERIODS[period]
+        # With a burst the rule is a token bucket, otherwise a sliding window
+        self.burst = int(burst) if burst else None
+        self.methods = {method.strip().upper() for method in methods.split(',')} if methods else None
+
+    def applies(self):
+        return self.methods is None or request.method in self.methods
+
+    def value(self):
+        if self.key == 'ip':
+            return request.remote_addr
+        value = request.form.get(self.key, '').strip().lower()
+        return value[:MAX_KEY_LENGTH] or None
+
+
+def window_wait(limit, period, elapsed, current, previous):
+    """Seconds until one more hit fits a sliding window, 0 when it fits now.
+
+    The window is approximated from two fixed ones: the hits of the previous
+    period count with the share of it the window still covers.
+    """
+    if previous * (1 - elapsed / period) + current + 1 <= limit:
+        return 0
+    if current + 1 <= limit:
+        return period * (1 - (limit - 1 - current) / previous) - elapsed
+    # Only the next period has room, once this one's hits have aged enough
+    return period - elapsed + period * (1 - (limit - 1) / current)
+
+
+class MemoryStore:
+    """Counters of this worker process, bounded to max_keys by LRU.
+
+    An evicted key starts over, so the cap must stay well above the number of
+    clients seen within the longest period.
+    """
+
+    def __init__(self, max_keys):
+        self.max_keys = max_keys
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def _entry(self, key, default):
+        entry = self.entries.get(key)
+        if entry is None:
+            entry = self.entries[key] = default
+            while len(self.entries) > self.max_keys:
+                self.entries.popitem(last=False)
+        else:
+            self.entries.move_to_end(key)
+        return entry
+
+    def hit_window(self, key, limit, period, now):
+        window, elapsed = divmod(now, period)
+        with self.lock:
+            entry = self._entry(key, [window, 0, 0])
+            if entry[0] != window:
+                # [window, hits in it, hits in the one before]
+                entry[:] = [window, 0, entry[1] if entry[0] == window - 1 else 0]
+            wait = window_wait(limit, period, elapsed, entry[1], entry[2])
+            if not wait:
+                entry[1] += 1
+        return wait
+
+    def take_token(self, key, rate, capacity, now):
+        with self.lock:
+            entry = self._entry(key, [capacity, now])
+            tokens = min(capacity, entry[0] + (now - entry[1]) * rate)
+            wait = 0 if tokens >= 1 else (1 - tokens) / rate
+            entry[:] = [tokens if wait else tokens - 1, now]
+        return wait
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def info(self):
+        return {"keys": len(self.entries), "max_keys": self.max_keys}
+
+
+# Both scripts read and update a counter in one atomic round trip
+WINDOW_SCRIPT = """
+local current = tonumber(redis.call('GET', KEYS[1]) or '0')
+local previous = tonumber(redis.call('GET', KEYS[2]) or '0')
+if previous * tonumber(ARGV[2]) + current + 1 > tonumber(ARGV[1]) then
+    return {0, current, previous}
+end
+redis.call('INCR', KEYS[1])
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+return {1, current + 1, previous}
+"""
+
+BUCKET_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'at')
+local tokens = tonumber(state[1]) or capacity
+local at = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - at) * rate)
+local allowed = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+    allowed = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'at', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+return {allowed, tostring(tokens)}
+"""
+
+
+class RedisStore:
+    """Counters shared by every worker, in any Redis-compatible server with scripting."""
+
+    def __init__(self, url, prefix="flaskblogger:ratelimit:"):
+        self.client = RedisClient(url)
+        self.prefix = prefix
+        self.scripts = {}
+
+    def _eval(self, script, keys, *args):
+        # EVALSHA sends only the digest; the server may not have the script yet
+        sha = self.scripts.get(script)
+        if sha is not None:
+            try:
+                return self.client.call("EVALSHA", sha, len(keys), *keys, *args)
+            except RuntimeError as e:
+                if not str(e).startswith("NOSCRIPT"):
+                    raise
+        self.scripts[script] = self.client.call("SCRIPT", "LOAD", script).decode()
+        return self.client.call("EVAL", script, len(keys), *keys, *args)
+
+    def hit_window(self, key, limit, period, now):
+        window, elapsed = divmod(now, period)
+        key = self.prefix + key
+        allowed, current, previous = self._eval(
+            WINDOW_SCRIPT, ("%s:%d" % (key, window), "%s:%d" % (key, window - 1)),
+            limit, repr(1 - elapsed / period), 2 * period)
+        if allowed:
+            return 0
+        return window_wait(limit, period, elapsed, current, previous)
+
+    def take_token(self, key, rate, capacity, now):
+        allowed, tokens = self._eval(BUCKET_SCRIPT, (self.prefix + key,), repr(rate), capacity, repr(now))
+        return 0 if allowed else (1 - float(tokens)) / rate
+
+    def clear(self):
+        keys = self.client.call("KEYS", self.prefix + "*") or []
+        if keys:
+            self.client.call("DEL", *keys)
+
+    def info(self):
+        return {"server": "%s:%d" % self.client.address}
+
+
+class RateLimiter:
+    def __init__(self, app=None):
+        self.store = None
+        self.rules = {}
+        self.rejected = Counter()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        # memory, redis or none
+        app.config.setdefault('RATELIMIT_STORE', 'memory')
+        app.config.setdefault('RATELIMIT_MEMORY_KEYS', 100000)
+        app.config.setdefault('RATELIMIT_REDIS_URL', 'redis://localhost:6379/0')
+        app.config.setdefault('RATELIMITS', {
+            # Every attempt costs a password hash
+            'auth.login': ['10/minute per ip on POST', '5/minute per username on POST'],
+            'auth.test_pw': ['10/minute per ip on POST', '5/minute per email on POST'],
+            'search.search': ['2/second burst 20 per ip'],
+            'posts.autosave': ['1/second burst 10 per ip'],
+        })
+        self.app = app
+        self.store = None
+        self.rules = {endpoint: [Rule(text) for text in rules]
+                      for endpoint, rules in app.config['RATELIMITS'].items()}
+        self.rejected = Counter()
+        app.extensions['ratelimit'] = self
+        app.before_request(self.check)
+
+    @property
+    def enabled(self):
+        return self.app.config['RATELIMIT_STORE'] != 'none'
+
+    def get_store(self):
+        if self.store is None:
+            config = self.app.config
+            name = config['RATELIMIT_STORE']
+            if name == 'memory':
+                self.store = MemoryStore(config['RATELIMIT_MEMORY_KEYS'])
+            elif name == 'redis':
+                self.store = RedisStore(config['RATELIMIT_REDIS_URL'])
+            else:
+                raise ValueError("Unknown rate limit store %r" % name)
+        return self.store
+
+    def hit(self, endpoint, index, rule, value):
+        """Seconds the client has to wait, 0 when the request may go ahead."""
+        key = "%s:%d:%s" % (endpoint, index, value)
+        now = time.time()
+        if rule.burst is None:
+            return self.get_store().hit_window(key, rule.limit, rule.period, now)
+        return self.get_store().take_token(key, rule.limit / rule.period, rule.burst, now)
+
+    def check(self):
+        rules = self.rules.get(request.endpoint)
+        if not rules or not self.enabled:
+            return None
+        for index, rule in enumerate(rules):
+            if not rule.applies():
+                continue
+            value = rule.value()
+            if value is None:
+                continue
+            try:
+                wait = self.hit(request.endpoint, index, rule, value)
+            except (OSError, ConnectionError, RuntimeError) as e:
+                # Better to let requests through than to fail every one of them
+                self.app.logger.warning("Rate limit check failed: %s", e)
+                return None
+            if wait:
+                self.rejected[request.endpoint] += 1
+                return self.reject(wait)
+        return None
+
+    def reject(self, wait):
+        retry_after = max(1, math.ceil(wait))
+        response = self.app.response_class("Too many requests, try again in %d seconds.\n" % retry_after,
+                                           status=429, mimetype='text/plain')
+        response.headers['Retry-After'] = str(retry_after)
+        return response
+
+    def stats(self):
+        stats = {"store": self.app.config['RATELIMIT_STORE'], "rejected": dict(self.rejected)}
+        if self.enabled:
+            stats.update(self.get_store().info())
+        return stats
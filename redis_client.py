@@ -0,0 +1,66 @@
+import socket
+import threading
+from urllib.parse import urlparse
+
+# Minimal RESP client, so any Redis-compatible server (or a local stand-in
+# speaking the same protocol) can hold shared state without a client library
+
+
+class RedisClient:
+    """One connection per thread, reopened after a network error."""
+
+    def __init__(self, url, timeout=1):
+        parsed = urlparse(url)
+        self.address = (parsed.hostname or "localhost", parsed.port or 6379)
+        self.db = int(parsed.path.lstrip("/") or 0)
+        self.password = parsed.password
+        self.timeout = timeout
+        self.local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            sock = socket.create_connection(self.address, timeout=self.timeout)
+            conn = self.local.conn = (sock, sock.makefile("rb"))
+            if self.password:
+                self.call("AUTH", self.password)
+            if self.db:
+                self.call("SELECT", self.db)
+        return conn
+
+    def call(self, *args):
+        sock, reader = self._connection()
+        parts = [b"*%d\r\n" % len(args)]
+        for arg in args:
+            if not isinstance(arg, bytes):
+                arg = str(arg).encode()
+            parts.append(b"$%d\r\n%s\r\n" % (len(arg), arg))
+        try:
+            sock.sendall(b"".join(parts))
+            return self._read(reader)
+        except OSError:
+            self.local.conn = None
+            raise
+
+    def _read(self, reader):
+        line = reader.readline()
+        if not line:
+            raise ConnectionError("Connection closed by Redis server")
+        kind, rest = line[:1], line[1:-2]
+        if kind == b"+":
+            return rest
+        if kind == b"-":
+            raise RuntimeError(rest.decode())
+        if kind == b":":
+            return int(rest)
+        if kind == b"$":
+            length = int(rest)
+            if length < 0:
+                return None
+            return reader.read(length + 2)[:-2]
+        if kind == b"*":
+            length = int(rest)
+            if length < 0:
+                return None
+            return [self._read(reader) for i in range(length)]
+        raise ConnectionError("Unexpected reply from Redis server")
@@ -0,0 +1,164 @@
+import json
+import zlib
+from datetime import datetime, timedelta
+from difflib import SequenceMatcher
+from flask import current_app
+from sqlalchemy import delete, func, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import defer
+from extensions import db, jobs
+from models import PostRevisions
+
+# Post revisions
+#
+# Every save of a post, and the editor's autosaves in between, is kept as a
+# revision. Most edits touch a few paragraphs of a long CKEditor document, so
+# a revision stores the zlib-compressed difference to the one before it: runs
+# of lines copied from the previous version plus the new lines. Every
+# REVISION_SNAPSHOT_INTERVAL revisions a compressed full copy starts a new
+# chain, so reading any revision applies fewer diffs than that. Autosaves
+# replace the author's current draft instead of piling up, and only the
+# newest REVISION_KEEP revisions of a post are kept (see prune()).
+
+
+def lines(content):
+    # CKEditor writes every block element on a line of its own
+    return (content or "").splitlines(keepends=True)
+
+
+def diff(old, new):
+    """Ops that turn ``old`` into ``new``: [start, count] copies lines of old, a string is new text."""
+    a, b = lines(old), lines(new)
+    ops = []
+    for tag, i1, i2, j1, j2 in SequenceMatcher(None, a, b, autojunk=False).get_opcodes():
+        if tag == 'equal':
+            ops.append([i1, i2 - i1])
+        elif j2 > j1:
+            ops.append("".join(b[j1:j2]))
+    return ops
+
+
+def patch(old, ops):
+    a = lines(old)
+    return "".join(op if isinstance(op, str) else "".join(a[op[0]:op[0] + op[1]]) for op in ops)
+
+
+def content_of(revision):
+    """The full content of ``revision``, rebuilt from the snapshot its chain starts with."""
+    if revision.depth == 0:
+        return zlib.decompress(revision.data).decode()
+    # A post's revisions form one line, so the chain is the rows right before it
+    chain = (PostRevisions.query
+             .filter(PostRevisions.post_id == revision.post_id, PostRevisions.id <= revision.id)
+             .order_by(PostRevisions.id.desc())
+             .limit(revision.depth + 1)
+             .all())
+    chain.reverse()
+    if chain[0].depth != 0:
+        raise ValueError("Revision %d has no snapshot to start from" % revision.id)
+    content = zlib.decompress(chain[0].data).decode()
+    for row in chain[1:]:
+        content = patch(content, json.loads(zlib.decompress(row.data)))
+    return content
+
+
+def latest(post_id, author_id=None):
+    """The newest revision of a post, or an author's draft of a new post when ``post_id`` is None."""
+    query = PostRevisions.query.filter(PostRevisions.post_id == post_id)
+    if post_id is None:
+        query = query.filter(PostRevisions.author_id == author_id)
+    return query.order_by(PostRevisions.id.desc()).first()
+
+
+def history(post_id):
+    return (PostRevisions.query.filter(PostRevisions.post_id == post_id)
+            .options(defer(PostRevisions.data))
+            .order_by(PostRevisions.id.desc()))
+
+
+def save_revision(post_id, author_id, title, slug, content, draft):
+    """Record a version of a post in the current transaction and return it.
+
+    An autosave replaces the author's open draft, and saving the form turns
+    that draft into a regular revision, so an editing session leaves one
+    revision behind however often the editor saved in between.
+    """
+    session = db.session
+    while True:
+        last = latest(post_id, author_id)
+        current = content_of(last) if last is not None else None
+        if last is not None and (last.title, last.slug, current) == (title, slug, content) \
+                and (draft or not last.draft):
+            return last
+        if last is not None and last.draft and last.author_id == author_id:
+            revision = last
+            parent = session.get(PostRevisions, last.parent_id) if last.parent_id else None
+            base = content_of(parent) if parent is not None else None
+        else:
+            revision = PostRevisions(post_id=post_id, parent_id=last.id if last is not None else None)
+            parent, base = last, current
+
+        snapshot = zlib.compress(content.encode())
+        revision.depth = 0
+        revision.data = snapshot
+        if parent is not None and parent.depth + 1 < current_app.config['REVISION_SNAPSHOT_INTERVAL']:
+            delta = zlib.compress(json.dumps(diff(base, content), separators=(',', ':')).encode())
+            # A rewrite of most of the post is cheaper to store whole
+            if len(delta) < len(snapshot):
+                revision.depth = parent.depth + 1
+                revision.data = delta
+        revision.author_id = author_id
+        revision.title = title
+        revision.slug = slug
+        revision.length = len(content)
+        revision.draft = draft
+        revision.created_at = datetime.utcnow()
+        try:
+            # parent_id is unique: of two editor tabs appending to the same
+            # revision one wins, the other diffs against the winner
+            with session.begin_nested():
+                session.add(revision)
+                session.flush()
+        except IntegrityError:
+            continue
+        if revision is not last and post_id is not None and current_app.config['REVISION_KEEP']:
+            jobs.enqueue('prune-revisions', {'post_id': post_id}, key='prune-revisions:%d' % post_id)
+        return revision
+
+
+def discard_new_post_drafts(author_id):
+    db.session.execute(delete(PostRevisions).where(PostRevisions.post_id == None,
+                                                   PostRevisions.author_id == author_id))
+
+
+def prune(post_id, keep):
+    """Drop all but the newest ``keep`` revisions of a post; returns how many went."""
+    boundary = history(post_id).offset(keep - 1).first() if keep > 0 else None
+    if boundary is None:
+        return 0
+    session = db.session
+    if boundary.depth:
+        # The oldest revision kept becomes the snapshot its successors build on
+        content = content_of(boundary)
+        following = (PostRevisions.post_id == post_id, PostRevisions.id > boundary.id)
+        next_snapshot = session.query(func.min(PostRevisions.id)).filter(*following, PostRevisions.depth == 0).scalar()
+        if next_snapshot is not None:
+            following += (PostRevisions.id < next_snapshot,)
+        session.execute(update(PostRevisions).where(*following)
+                        .values(depth=PostRevisions.depth - boundary.depth)
+                        .execution_options(synchronize_session=False))
+        boundary.data = zlib.compress(content.encode())
+        boundary.depth = 0
+    boundary.parent_id = None
+    session.flush()
+    result = session.execute(delete(PostRevisions).where(PostRevisions.post_id == post_id,
+                                                         PostRevisions.id < boundary.id))
+    return result.rowcount
+
+
+def prune_drafts(days):
+    """Drop drafts of new posts that were never added, after ``days``; returns how many."""
+    cutoff = datetime.utcnow() - timedelta(days=days)
+    result = db.session.execute(delete(PostRevisions).where(PostRevisions.post_id == None,
+                                                            PostRevisions.created_at < cutoff))
+    return result.rowcount
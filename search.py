@@ -0,0 +1,304 @@
+import math
+import re
+from collections import Counter, defaultdict
+from html import unescape
+from sqlalchemy import select, text
+
+# Full-text search for blog posts
+#
+# Three interchangeable backends keep an inverted index over post title and
+# content: MySQL FULLTEXT, SQLite FTS5, and a pure-Python BM25 index for tests
+# and databases without native full-text support. The views only talk to the
+# SearchBackend interface, so the query cost follows the index, not the size
+# of the posts table.
+
+TAG_RE = re.compile(r"<[^>]+>")
+TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+# Title matches count this many times more than content matches
+TITLE_WEIGHT = 2
+
+
+def strip_html(html):
+    return unescape(TAG_RE.sub(" ", html or ""))
+
+
+def tokenize(value):
+    return TOKEN_RE.findall(strip_html(value).lower())
+
+
+class SearchResults:
+    def __init__(self, items, total, page, per_page):
+        self.items = items
+        self.total = total
+        self.page = page
+        self.per_page = per_page
+
+    @property
+    def pages(self):
+        return max(1, math.ceil(self.total / self.per_page))
+
+    @property
+    def has_prev(self):
+        return self.page > 1
+
+    @property
+    def has_next(self):
+        return self.page < self.pages
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+class SearchBackend:
+    """Interface shared by all search backends.
+
+    ``index_post`` and ``remove_post`` are called from the write views after
+    the session has been flushed, so SQL backends update their index inside
+    the same transaction as the post itself.
+    """
+
+    # How the write views bring the index up to date: "job" in the
+    # index-post background job, "inline" in the request, None not at all
+    index_updates = "job"
+
+    def __init__(self, db, posts_table="posts"):
+        # posts_archive gets an index of its own (see `flask archive-posts`)
+        self.db = db
+        self.posts_table = posts_table
+
+    def index_post(self, post):
+        raise NotImplementedError
+
+    def remove_post(self, post_id):
+        raise NotImplementedError
+
+    def index_posts(self, posts):
+        for post in posts:
+            self.index_post(post)
+
+    def rebuild(self, posts):
+        raise NotImplementedError
+
+    def ranking_queries(self, terms, offset, limit):
+        # SQL backends return ((count query, params), (ranked ids query, params))
+        raise NotImplementedError
+
+    def query_ids(self, terms, offset, limit):
+        # Returns ([post ids in rank order], total number of matches)
+        (count, count_params), (ranked, ranked_params) = self.ranking_queries(terms, offset, limit)
+        total = self.db.session.execute(count, count_params).scalar()
+        rows = self.db.session.execute(ranked, ranked_params)
+        return [row[0] for row in rows], total
+
+    def search(self, model, searched, page=1, per_page=10, options=()):
+        terms = tokenize(searched)
+        if not terms:
+            return SearchResults([], 0, page, per_page)
+        ids, total = self.query_ids(terms, (page - 1) * per_page, per_page)
+        rows = {}
+        if ids:
+            # Deleted posts may still be indexed until their index-post job ran
+            rows = {row.id: row for row in model.query.options(*options).filter(model.id.in_(ids), model.live())}
+        return SearchResults([rows[id] for id in ids if id in rows], total, page, per_page)
+
+    async def search_async(self, session, model, searched, page=1, per_page=10, options=()):
+        """search() on an AsyncSession; only for backends with ranking_queries()."""
+        terms = tokenize(searched)
+        if not terms:
+            return SearchResults([], 0, page, per_page)
+        (count, count_params), (ranked, ranked_params) = self.ranking_queries(terms, (page - 1) * per_page, per_page)
+        total = (await session.execute(count, count_params)).scalar()
+        ids = [row[0] for row in await session.execute(ranked, ranked_params)]
+        rows = {}
+        if ids:
+            result = await session.execute(select(model).options(*options).where(model.id.in_(ids), model.live()))
+            rows = {row.id: row for row in result.scalars()}
+        return SearchResults([rows[id] for id in ids if id in rows], total, page, per_page)
+
+
+class MemorySearchBackend(SearchBackend):
+    """In-process inverted index ranked with Okapi BM25."""
+
+    # Every process has its own copy, which a job worker could not update
+    index_updates = "inline"
+    k1 = 1.2
+    b = 0.75
+
+    def __init__(self, db, posts_table="posts"):
+        super().__init__(db, posts_table)
+        self.postings = defaultdict(dict)
+        self.doc_terms = {}
+        self.doc_lengths = {}
+        self.total_length = 0
+        self.loaded = False
+
+    def _ensure_loaded(self, model):
+        if not self.loaded:
+            self.rebuild(model.query.filter(model.live()))
+
+    def index_post(self, post):
+        self.remove_post(post.id)
+        counts = Counter(tokenize(post.content))
+        for term in tokenize(post.title):
+            counts[term] += TITLE_WEIGHT
+        for term, count in counts.items():
+            self.postings[term][post.id] = count
+        self.doc_terms[post.id] = list(counts)
+        length = sum(counts.values())
+        self.doc_lengths[post.id] = length
+        self.total_length += length
+
+    def remove_post(self, post_id):
+        length = self.doc_lengths.pop(post_id, None)
+        if length is None:
+            return
+        self.total_length -= length
+        for term in self.doc_terms.pop(post_id):
+            docs = self.postings[term]
+            docs.pop(post_id, None)
+            if not docs:
+                del self.postings[term]
+
+    def rebuild(self, posts):
+        self.postings.clear()
+        self.doc_terms.clear()
+        self.doc_lengths.clear()
+        self.total_length = 0
+        for post in posts:
+            self.index_post(post)
+        self.loaded = True
+
+    def query_ids(self, terms, offset, limit):
+        doc_count = len(self.doc_lengths)
+        if not doc_count:
+            return [], 0
+        average = self.total_length / doc_count
+        scores = defaultdict(float)
+        for term in set(terms):
+            docs = self.postings.get(term)
+            if not docs:
+                continue
+            idf = math.log(1 + (doc_count - len(docs) + 0.5) / (len(docs) + 0.5))
+            for post_id, tf in docs.items():
+                norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[post_id] / average)
+                scores[post_id] += idf * tf * (self.k1 + 1) / (tf + norm)
+        ranked = sorted(scores, key=lambda post_id: (-scores[post_id], post_id))
+        return ranked[offset:offset + limit], len(ranked)
+
+    def search(self, model, searched, page=1, per_page=10, options=()):
+        self._ensure_loaded(model)
+        return super().search(model, searched, page, per_page, options)
+
+
+class SQLiteSearchBackend(SearchBackend):
+    """SQLite FTS5 virtual table keyed by post id, ranked with bm25()."""
+
+    def __init__(self, db, posts_table="posts"):
+        super().__init__(db, posts_table)
+        self.table = posts_table + "_fts"
+        self.ready = False
+
+    def create_table(self):
+        return text("CREATE VIRTUAL TABLE IF NOT EXISTS %s USING fts5(title, content)" % self.table)
+
+    def _ensure_table(self):
+        if not self.ready:
+            self.db.session.execute(self.create_table())
+            self.ready = True
+
+    def index_post(self, post):
+        self.remove_post(post.id)
+        self.db.session.execute(
+            text("INSERT INTO %s (rowid, title, content) VALUES (:id, :title, :content)" % self.table),
+            {"id": post.id, "title": post.title or "", "content": strip_html(post.content)})
+
+    def remove_post(self, post_id):
+        self._ensure_table()
+        self.db.session.execute(text("DELETE FROM %s WHERE rowid = :id" % self.table), {"id": post_id})
+
+    def index_posts(self, posts):
+        # One executemany per statement for bulk imports
+        posts = list(posts)
+        if not posts:
+            return
+        self._ensure_table()
+        self.db.session.execute(text("DELETE FROM %s WHERE rowid = :id" % self.table),
+                                [{"id": post.id} for post in posts])
+        self.db.session.execute(
+            text("INSERT INTO %s (rowid, title, content) VALUES (:id, :title, :content)" % self.table),
+            [{"id": post.id, "title": post.title or "", "content": strip_html(post.content)} for post in posts])
+
+    def rebuild(self, posts):
+        self._ensure_table()
+        self.db.session.execute(text("DELETE FROM %s" % self.table))
+        for post in posts:
+            self.index_post(post)
+        self.db.session.commit()
+
+    def query_ids(self, terms, offset, limit):
+        self._ensure_table()
+        return super().query_ids(terms, offset, limit)
+
+    async def search_async(self, session, model, searched, page=1, per_page=10, options=()):
+        if not self.ready:
+            await session.execute(self.create_table())
+            self.ready = True
+        return await super().search_async(session, model, searched, page, per_page, options)
+
+    def ranking_queries(self, terms, offset, limit):
+        # Quote every token so user input can never be parsed as FTS5 syntax
+        match = " OR ".join('"%s"' % term for term in set(terms))
+        count = text("SELECT count(*) FROM %s WHERE %s MATCH :match" % (self.table, self.table))
+        ranked = text("SELECT rowid FROM %s WHERE %s MATCH :match ORDER BY bm25(%s, %d, 1) LIMIT :limit OFFSET :offset"
+                      % (self.table, self.table, self.table, TITLE_WEIGHT))
+        return (count, {"match": match}), (ranked, {"match": match, "limit": limit, "offset": offset})
+
+
+class MySQLSearchBackend(SearchBackend):
+    """MySQL FULLTEXT index on (title, content) of the posts table.
+
+    InnoDB maintains the index itself on every insert, update and delete, so
+    the write hooks have nothing to do.
+    """
+
+    index_updates = None
+    match = "MATCH (title, content) AGAINST (:searched IN NATURAL LANGUAGE MODE)"
+
+    def index_post(self, post):
+        pass
+
+    def remove_post(self, post_id):
+        pass
+
+    def rebuild(self, posts):
+        self.db.session.execute(text("OPTIMIZE TABLE %s" % self.posts_table))
+
+    def ranking_queries(self, terms, offset, limit):
+        searched = " ".join(terms)
+        count = text("SELECT count(*) FROM %s WHERE %s AND deleted_at IS NULL" % (self.posts_table, self.match))
+        ranked = text("SELECT id FROM %s WHERE %s AND deleted_at IS NULL ORDER BY %s DESC, id "
+                      "LIMIT :limit OFFSET :offset" % (self.posts_table, self.match, self.match))
+        return (count, {"searched": searched}), (ranked, {"searched": searched, "limit": limit, "offset": offset})
+
+
+BACKENDS = {
+    "memory": MemorySearchBackend,
+    "sqlite": SQLiteSearchBackend,
+    "mysql": MySQLSearchBackend,
+}
+
+
+def create_backend(name, db, posts_table="posts"):
+    # "auto" picks the native full-text index of the configured database
+    if name == "auto":
+        name = db.engine.dialect.name
+        if name not in BACKENDS:
+            name = "memory"
+    try:
+        return BACKENDS[name](db, posts_table)
+    except KeyError:
+        raise ValueError("Unknown search backend %r" % name)
@@ -0,0 +1,80 @@
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+from sqlalchemy.exc import IntegrityError
+
+# Slug helpers for post URLs
+
+SLUG_RE = re.compile(r"[^a-z0-9]+")
+MAX_SLUG_LENGTH = 255
+
+
+def slugify(value):
+    value = unicodedata.normalize("NFKD", value or "").encode("ascii", "ignore").decode()
+    slug = SLUG_RE.sub("-", value.lower()).strip("-")
+    if slug.isdigit():
+        # /posts/<digits> is the id route, so such a slug would link to another post
+        slug = "post-" + slug
+    return slug[:MAX_SLUG_LENGTH]
+
+
+def candidate_slugs(base, attempts):
+    yield base
+    for n in range(2, attempts + 1):
+        suffix = "-%d" % n
+        yield base[:MAX_SLUG_LENGTH - len(suffix)] + suffix
+
+
+def save_with_unique_slug(session, post, base, attempts=50):
+    """Flush ``post`` under the first free slug derived from ``base``.
+
+    The unique index on posts.slug is the arbiter: each candidate is written
+    inside a savepoint and a collision simply rolls that savepoint back, so
+    two writers racing for the same slug can never both win. Slugs of
+    archived posts stay taken, their permalinks still work.
+    """
+    from models import ArchivedPosts
+    for slug in candidate_slugs(base, attempts):
+        if session.query(ArchivedPosts.id).filter_by(slug=slug).first() is not None:
+            continue
+        try:
+            with session.begin_nested():
+                post.slug = slug
+                session.add(post)
+                session.flush()
+            return post
+        except IntegrityError:
+            continue
+    raise ValueError("No free slug left for %r" % base)
+
+
+class SlugCache:
+    """Bounded LRU mapping of slug to post id, local to this process."""
+
+    def __init__(self, max_size=10000):
+        self.max_size = max_size
+        self.ids = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, slug):
+        with self.lock:
+            id = self.ids.get(slug)
+            if id is not None:
+                self.ids.move_to_end(slug)
+            return id
+
+    def set(self, slug, id):
+        with self.lock:
+            self.ids[slug] = id
+            self.ids.move_to_end(slug)
+            while len(self.ids) > self.max_size:
+                self.ids.popitem(last=False)
+
+    def discard(self, slug):
+        with self.lock:
+            self.ids.pop(slug, None)
+
+    def clear(self):
+        with self.lock:
+            self.ids.clear()
@@ -0,0 +1,60 @@
+// Saves the post form as a draft every AUTOSAVE_INTERVAL seconds while it
+// changes, and once more when the tab is hidden or closed
+(function () {
+    var form = document.querySelector('form[data-autosave]');
+    if (!form) {
+        return;
+    }
+    var status = document.getElementById('autosave-status');
+    var saved = null;
+    var submitting = false;
+
+    function body() {
+        var editor = window.CKEDITOR && CKEDITOR.instances.content;
+        return JSON.stringify({
+            post_id: form.dataset.postId ? parseInt(form.dataset.postId, 10) : null,
+            title: form.elements.title.value,
+            slug: form.elements.slug.value,
+            content: editor ? editor.getData() : form.elements.content.value
+        });
+    }
+
+    function save(leaving) {
+        var data = body();
+        if (submitting || data === saved) {
+            return;
+        }
+        var token = form.elements.csrf_token;
+        fetch(form.dataset.autosave, {
+            method: 'POST',
+            credentials: 'same-origin',
+            keepalive: leaving,
+            headers: {'Content-Type': 'application/json', 'X-CSRFToken': token ? token.value : ''},
+            body: data
+        }).then(function (response) {
+            if (!response.ok) {
+                throw new Error(response.status);
+            }
+            return response.json();
+        }).then(function (result) {
+            saved = data;
+            status.textContent = 'Draft saved at ' + new Date(result.saved_at).toLocaleTimeString();
+        }).catch(function () {
+            status.textContent = 'Draft not saved, trying again shortly';
+        });
+    }
+
+    // What the page was opened with is not a change worth saving
+    if (window.CKEDITOR) {
+        CKEDITOR.on('instanceReady', function () { saved = body(); });
+    } else {
+        saved = body();
+    }
+    form.addEventListener('submit', function () { submitting = true; });
+    document.addEventListener('visibilitychange', function () {
+        if (document.visibilityState === 'hidden') {
+            save(true);
+        }
+    });
+    setInterval(function () { save(false); }, (parseInt(form.dataset.interval, 10) || 30) * 1000);
+})();
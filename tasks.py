@@ -0,0 +1,56 @@
+from flask import current_app
+from extensions import db, images, jobs, search_index
+from models import Posts, Users
+from revisions import prune
+
+# Follow-up work of the write views, run by `flask run-jobs`
+#
+# The views call the helpers below before they commit, so a job is only
+# stored when the change that needs it is. Page cache invalidation stays in
+# the views: the memory backend lives in the web process itself.
+
+
+@jobs.handler('index-post')
+def index_post(id):
+    # Also covers deleted and archived posts, so add, edit and delete share one key
+    post = db.session.get(Posts, id)
+    if post is None or post.deleted_at is not None:
+        search_index().remove_post(id)
+    else:
+        search_index().index_post(post)
+
+
+@jobs.handler('image-variants')
+def image_variants(name):
+    # Skipped for a picture replaced again before the job ran
+    if Users.query.filter_by(profile_pic=name).first() is not None:
+        images.make_variants(name)
+
+
+@jobs.handler('discard-picture')
+def discard_picture(name):
+    # Someone may have uploaded the same picture since it was replaced
+    if Users.query.filter_by(profile_pic=name).first() is None:
+        images.remove(name)
+
+
+@jobs.handler('prune-revisions')
+def prune_revisions(post_id):
+    prune(post_id, current_app.config['REVISION_KEEP'])
+
+
+def post_changed(post_id):
+    """Bring the search index in line with a flushed post (or its deletion)."""
+    updates = search_index().index_updates
+    if updates == "job":
+        jobs.enqueue('index-post', {'id': post_id}, key='index-post:%d' % post_id)
+    elif updates == "inline":
+        index_post(post_id)
+
+
+def picture_replaced(new, old):
+    """Make the variants of a new profile picture and drop the one it replaced."""
+    if new:
+        jobs.enqueue('image-variants', {'name': new}, key='image-variants:%s' % new)
+    if old and old != new:
+        jobs.enqueue('discard-picture', {'name': old}, key='discard-picture:%s' % old)
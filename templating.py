@@ -0,0 +1,85 @@
+import os
+from jinja2 import FileSystemBytecodeCache, nodes
+from jinja2.ext import Extension
+from markupsafe import Markup
+from page_cache import MemoryBackend
+
+# Template rendering
+#
+# Fragments that look the same for many requests are rendered once and kept
+# in this process for a while:
+#
+#     {% cache 600, current_user.get_id() %} ... {% endcache %}
+#
+# The first argument is the lifetime in seconds, any further ones are key
+# parts next to the template name and line, so the block above is stored
+# once per user. Compiled templates are written to TEMPLATE_BYTECODE_DIR,
+# where new workers load them instead of compiling; `flask compile-templates`
+# fills it on deploy.
+
+
+class CacheTag(Extension):
+    tags = {'cache'}
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        args = [parser.parse_expression()]
+        while parser.stream.skip_if('comma'):
+            args.append(parser.parse_expression())
+        body = parser.parse_statements(('name:endcache',), drop_needle=True)
+        name = nodes.Const("%s:%d" % (parser.name, lineno))
+        call = self.call_method('_render', [name, nodes.List(args)])
+        return nodes.CallBlock(call, [], [], body).set_lineno(lineno)
+
+    def _render(self, name, args, caller):
+        return self.environment.fragment_cache.render(name, args[0], args[1:], caller)
+
+
+class Templating:
+    def __init__(self, app=None):
+        self.fragments = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('FRAGMENT_CACHE', True)
+        app.config.setdefault('FRAGMENT_CACHE_MAX_BYTES', 4 * 1024 * 1024)
+        app.config.setdefault('TEMPLATE_BYTECODE_DIR', os.path.join(app.instance_path, 'jinja_cache'))
+        self.app = app
+        self.fragments = MemoryBackend(app.config['FRAGMENT_CACHE_MAX_BYTES'])
+        app.extensions['templating'] = self
+        app.jinja_env.add_extension(CacheTag)
+        app.jinja_env.extend(fragment_cache=self)
+
+        directory = app.config['TEMPLATE_BYTECODE_DIR']
+        if directory:
+            try:
+                os.makedirs(directory, exist_ok=True)
+            except OSError as e:
+                app.logger.warning("Template bytecode cache disabled: %s", e)
+            else:
+                app.jinja_env.bytecode_cache = FileSystemBytecodeCache(directory)
+
+    @property
+    def enabled(self):
+        # Edited templates show up at once while they are being reloaded
+        return self.app.config['FRAGMENT_CACHE'] and not self.app.jinja_env.auto_reload
+
+    def render(self, name, ttl, parts, caller):
+        if not self.enabled:
+            return caller()
+        key = "|".join([name] + [str(part) for part in parts])
+        body = self.fragments.get(key)
+        if body is not None:
+            return Markup(body.decode())
+        html = caller()
+        self.fragments.set(key, html.encode(), (), ttl)
+        return html
+
+    def compile(self):
+        """Compile every template into the bytecode cache; returns how many."""
+        env = self.app.jinja_env
+        names = env.list_templates(extensions=('html', 'xml'))
+        for name in names:
+            env.get_template(name)
+        return len(names)
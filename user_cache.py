@@ -0,0 +1,85 @@
+import threading
+import time
+from collections import OrderedDict
+from flask import g
+from flask_login import UserMixin
+
+# Session user cache
+#
+# Flask-Login asks for the current user on every authenticated request. The
+# loader answers from a small immutable snapshot (id, username, name,
+# profile_pic) kept in a TTL/LRU cache, and the full Users row is only fetched
+# when a view or template touches one of its other columns.
+
+SNAPSHOT_FIELDS = ("id", "username", "name", "profile_pic")
+
+
+class SessionUser(UserMixin):
+    """Read-only stand-in for Users used as ``current_user``."""
+
+    def __init__(self, cache, id, username, name, profile_pic):
+        object.__setattr__(self, "cache", cache)
+        object.__setattr__(self, "id", id)
+        object.__setattr__(self, "username", username)
+        object.__setattr__(self, "name", name)
+        object.__setattr__(self, "profile_pic", profile_pic)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("SessionUser is read-only, update the Users row instead")
+
+    def __getattr__(self, name):
+        # Only reached for attributes outside the snapshot
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return getattr(self.row(), name)
+
+    def row(self):
+        """The full Users row, loaded at most once per request."""
+        rows = g.setdefault("session_user_rows", {})
+        if self.id not in rows:
+            rows[self.id] = self.cache.load_row(self.id)
+        return rows[self.id]
+
+    def __repr__(self):
+        return "<SessionUser %r>" % self.name
+
+
+class UserCache:
+    def __init__(self, load_snapshot, load_row, max_size=10000, ttl=300):
+        # load_snapshot(id) returns the SNAPSHOT_FIELDS of a user or None,
+        # load_row(id) returns the ORM row
+        self.load_snapshot = load_snapshot
+        self.load_row = load_row
+        self.max_size = max_size
+        self.ttl = ttl
+        self.users = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, id):
+        with self.lock:
+            entry = self.users.get(id)
+            if entry is not None:
+                user, expires = entry
+                if expires >= time.monotonic():
+                    self.users.move_to_end(id)
+                    return user
+                del self.users[id]
+
+        values = self.load_snapshot(id)
+        if values is None:
+            return None
+        user = SessionUser(self, *values)
+        with self.lock:
+            self.users[id] = (user, time.monotonic() + self.ttl)
+            self.users.move_to_end(id)
+            while len(self.users) > self.max_size:
+                self.users.popitem(last=False)
+        return user
+
+    def invalidate(self, id):
+        with self.lock:
+            self.users.pop(id, None)
+
+    def clear(self):
+        with self.lock:
+            self.users.clear()
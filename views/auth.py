@@ -0,0 +1,80 @@
+from flask import Blueprint, render_template, flash, redirect, url_for
+from flask_login import login_user, login_required, logout_user
+from webforms import LoginForm, PasswordForm
+from extensions import db, passwords
+from passwords import HashingBusy
+from models import Users
+
+bp = Blueprint('auth', __name__)
+
+@bp.route('/login', methods=['GET', 'POST'])
+def login():
+    form = LoginForm()
+
+    if form.validate_on_submit():
+        user = Users.query.filter_by(username=form.username.data).first()
+        if user:
+            #chech pass hash
+            try:
+                valid = passwords.verify(user.password_hash, form.password.data)
+            except HashingBusy:
+                flash("Too many logins at the moment, try again in a bit.")
+                return render_template('login.html', form=form)
+            if valid:
+                #upgrade hashes made with an old algorithm or cost
+                if passwords.needs_rehash(user.password_hash):
+                    try:
+                        user.password_hash = passwords.hash(form.password.data)
+                        db.session.commit()
+                    except HashingBusy:
+                        pass
+                login_user(user)
+                return redirect(url_for('users.dashboard'))
+            else:
+                flash("Wrong password - Do you try to hack?!")
+        else:
+            flash("User does not exist - Nice try buddy.")
+
+    return render_template('login.html', form=form)
+
+# Create logout page
+@bp.route('/logout', methods=['GET', 'POST'])
+@login_required
+def logout():
+    logout_user()
+    flash("You are logged out - Bye")
+    return redirect(url_for('auth.login'))
+
+# Create pw test page
+@bp.route('/test_pw', methods=['GET', 'POST'])
+def test_pw():
+    email = None
+    password = None
+    pw_to_check = None
+    passed = None
+    form = PasswordForm()
+
+
+    # Validate form
+    if form.validate_on_submit():
+        email = form.email.data
+        password = form.password_hash.data
+        # clear the form
+        form.email.data = ''
+        form.password_hash.data = ''
+
+        #look up user by email
+        pw_to_check = Users.query.filter_by(email=email).first()
+
+        # Check hash password
+        try:
+            passed = pw_to_check is not None and passwords.verify(pw_to_check.password_hash, password)
+        except HashingBusy:
+            flash("Too many password checks at the moment, try again in a bit.")
+
+    return render_template("test_pw.html", 
+                           email = email, 
+                           password = password,
+                           pw_to_check = pw_to_check,
+                           passed = passed, 
+                           form = form)
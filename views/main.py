@@ -0,0 +1,95 @@
+from flask import Blueprint, g, render_template, flash, redirect, url_for, jsonify
+from flask_login import login_required, current_user
+from webforms import NamerForm, SearchForm
+from extensions import db, page_cache, ratelimiter
+from database import pool_stats
+from werkzeug.local import LocalProxy
+
+bp = Blueprint('main', __name__)
+
+# Built the first time a template uses it: most pages never do, and building
+# the form creates a CSRF token
+def search_form():
+    if 'search_form' not in g:
+        g.search_form = SearchForm()
+    return g.search_form
+
+@bp.app_context_processor
+def base():
+    return dict(form=LocalProxy(search_form))
+
+# Create a route decorator
+@bp.route('/')
+def index():
+    first_name = "Peter"
+    return render_template("index.html", 
+                           first_name = first_name)
+
+#Create custom error message
+
+#Invalid URL
+
+@bp.app_errorhandler(404)
+def page_not_found(e):
+    return render_template("404.html"), 404
+
+#internal server Error
+
+@bp.app_errorhandler(500)
+def internal_server_error(e):
+    return render_template("500.html"), 500
+
+# Create name page
+@bp.route('/name', methods=['GET', 'POST'])
+def name():
+    name = None
+    form = NamerForm()
+    # Validate form
+    if form.validate_on_submit():
+        name = form.name.data
+        form.name.data = ''
+        flash("Form submitted succesfully!")
+
+    return render_template("name.html", 
+                           name = name, 
+                           form = form)
+
+@bp.route('/admin')
+@login_required
+def admin():
+    id = current_user.id
+    if id == 9:
+        return render_template("admin.html")
+    else:
+        flash("You are not god enough to see this page. Go back you peasant.")
+        return redirect(url_for('posts.posts'))
+
+# Connection pool statistics
+@bp.route('/admin/db')
+@login_required
+def db_stats():
+    if current_user.id == 9:
+        return jsonify(pool_stats(db))
+    else:
+        flash("You are not god enough to see this page. Go back you peasant.")
+        return redirect(url_for('posts.posts'))
+
+# Page cache hit/miss counters
+@bp.route('/admin/cache')
+@login_required
+def cache_stats():
+    if current_user.id == 9:
+        return jsonify(page_cache.stats())
+    else:
+        flash("You are not god enough to see this page. Go back you peasant.")
+        return redirect(url_for('posts.posts'))
+
+# Rate limit rejections per endpoint
+@bp.route('/admin/ratelimits')
+@login_required
+def ratelimit_stats():
+    if current_user.id == 9:
+        return jsonify(ratelimiter.stats())
+    else:
+        flash("You are not god enough to see this page. Go back you peasant.")
+        return redirect(url_for('posts.posts'))
@@ -0,0 +1,327 @@
+from datetime import datetime
+from flask import Blueprint, Response, abort, current_app, render_template, flash, jsonify, request, redirect, url_for
+from flask_login import login_required, current_user
+from flask_wtf.csrf import validate_csrf
+from wtforms import ValidationError
+from sqlalchemy.orm import joinedload, defer
+from werkzeug.http import http_date
+from webforms import PostForm
+from extensions import db, page_cache, slug_cache
+from database import read_only
+from models import ArchivedPosts, PostRevisions, Posts, Users, post_added, post_removed
+from conditional import conditional_response
+from pagination import keyset_paginate
+from revisions import content_of, discard_new_post_drafts, history, latest, save_revision
+from postprocess import process_post
+from slugs import slugify, save_with_unique_slug
+from tasks import post_changed
+
+bp = Blueprint('posts', __name__)
+
+# Canonical post links use the slug when the post has one; older posts may
+# have a numeric slug, which /posts/<int:id> would take for an id
+@bp.app_template_global()
+def post_url(post, _external=False):
+    if post.slug and not post.slug.isdigit():
+        return url_for('posts.post_by_slug', slug=post.slug, _external=_external)
+    return url_for('posts.post', id=post.id, _external=_external)
+
+# Dates in the Atom (RFC 3339) and RSS (RFC 822) feeds, stored naive in UTC
+@bp.app_template_filter()
+def rfc3339(date):
+    return date.strftime('%Y-%m-%dT%H:%M:%SZ')
+
+@bp.app_template_filter()
+def rfc822(date):
+    return http_date(date)
+
+# Add Post Page
+@bp.route('/add-post', methods=["GET", "POST"])
+#@login_required
+def add_post():
+    form = PostForm()
+
+    if form.validate_on_submit():
+        poster = current_user.id
+        post = Posts(title=form.title.data, content=form.content.data, poster_id = poster)
+        process_post(post)
+        slug = slugify(form.slug.data) or slugify(form.title.data) or "post"
+        # Clear the form
+        form.title.data = ""
+        form.content.data = ""
+        #form.author.data = ""
+        form.slug.data = ""
+
+        #Add post data to database, numbering the slug if it is taken
+        save_with_unique_slug(db.session, post, slug)
+        post_changed(post.id)
+        post_added(post)
+        save_revision(post.id, poster, post.title, post.slug, post.content, draft=False)
+        discard_new_post_drafts(poster)
+        db.session.commit()
+        page_cache.invalidate('feed:head', 'author-posts:%d' % poster)
+
+        #return a message
+        flash("Post is submitted succesfully")
+
+    elif request.method == 'GET' and current_user.is_authenticated:
+        draft = latest(None, current_user.id)
+        if draft is not None:
+            load_revision(form, draft)
+            flash("Your unsaved draft from %s has been restored" % draft.created_at.strftime('%Y-%m-%d %H:%M'))
+
+    #redirect to webpage
+    return render_template("add_post.html", form=form, post=None)
+
+def load_revision(form, revision):
+    form.title.data = revision.title
+    form.content.data = content_of(revision)
+    form.slug.data = revision.slug
+
+# Autosaved by static/js/autosave.js while a post is being written; the form
+# posts JSON, so its CSRF token comes in a header
+@bp.route('/posts/autosave', methods=['POST'])
+@login_required
+def autosave():
+    if current_app.config.get('WTF_CSRF_ENABLED', True):
+        try:
+            validate_csrf(request.headers.get('X-CSRFToken'))
+        except ValidationError as e:
+            return jsonify(error=str(e)), 400
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict) or not isinstance(data.get('content'), str):
+        return jsonify(error="Expected a JSON object with the post content"), 400
+    post_id = data.get('post_id')
+    # bool is an int too, and true would mean post 1
+    if not (type(post_id) is int or post_id is None):
+        return jsonify(error="post_id must be a number"), 400
+
+    if post_id is not None:
+        post = Posts.query.filter(Posts.id == post_id, Posts.live()).first()
+        if post is None or post.poster_id != current_user.id:
+            return jsonify(error="No such post of yours"), 404
+    revision = save_revision(post_id, current_user.id, str(data.get('title') or '')[:255],
+                             str(data.get('slug') or '')[:255], data['content'], draft=True)
+    db.session.commit()
+    return jsonify(revision=revision.id, saved_at=revision.created_at.isoformat() + 'Z')
+
+# The feed only shows excerpts, so the content columns stay in the database
+# and the authors are loaded in the same query
+def feed_options(model=Posts):
+    return [joinedload(model.poster), defer(model.content), defer(model.content_html)]
+
+# Newest-first page of the live posts, or of the archive
+def feed_page(model=Posts):
+    return keyset_paginate(model.query.filter(model.live()).options(*feed_options(model)),
+                           model.date_posted, model.id,
+                           current_app.config['POSTS_PER_PAGE'],
+                           after=request.args.get('after'),
+                           before=request.args.get('before'))
+
+# The async views of aio.py pass in the page they fetched themselves
+def render_feed(page=None, archive=False):
+    if page is None:
+        page = feed_page()
+    # Only the newest pages move when a post is added, older keyset pages are stable
+    page_cache.tag(*['post:%d' % post.id for post in page])
+    page_cache.tag(*['author:%d' % post.poster_id for post in page if post.poster_id is not None])
+    if not request.args.get('after') and not archive:
+        page_cache.tag('feed:head')
+    return conditional_response(
+        ('feed', archive, [(post.id, post.updated_at, profile_version(post)) for post in page],
+         page.next_cursor, page.prev_cursor),
+        lambda: render_template("posts.html", posts=page.items, page=page, archive=archive))
+
+def profile_version(post):
+    return post.poster.profile_updated_at if post.poster else None
+
+def show_post(post):
+    page_cache.tag('post:%d' % post.id)
+    # Posts of deleted users are kept without an author
+    if post.poster_id is not None:
+        page_cache.tag('author:%d' % post.poster_id)
+    changed = [stamp for stamp in (post.updated_at, profile_version(post)) if stamp]
+    return conditional_response(
+        ('post', post.id, post.updated_at, post.poster_id, profile_version(post)),
+        lambda: render_template("post.html", post=post),
+        last_modified=max(changed, default=None))
+
+# View post page
+@bp.route('/posts')
+@page_cache.cached
+@read_only
+def posts():
+    return render_feed()
+
+# Old permalinks keep working once a post has been moved to the archive;
+# that costs a second primary key or slug lookup only for archived posts
+def find_post(id):
+    post = Posts.query.get(id) or ArchivedPosts.query.get(id)
+    return post if post is not None and post.deleted_at is None else None
+
+def find_post_by_slug(slug):
+    post = Posts.query.filter_by(slug=slug).first() or ArchivedPosts.query.filter_by(slug=slug).first()
+    return post if post is not None and post.deleted_at is None else None
+
+@bp.route('/posts/<int:id>')
+@page_cache.cached
+@read_only
+def post(id):
+    post = find_post(id)
+    if post is None:
+        abort(404)
+    return show_post(post)
+
+@bp.route('/posts/<slug>')
+@page_cache.cached
+@read_only
+def post_by_slug(slug):
+    post = None
+    id = slug_cache.get(slug)
+    if id is not None:
+        post = find_post(id)
+        if post is None or post.slug != slug:
+            # Changed or deleted by another worker
+            slug_cache.discard(slug)
+            post = None
+    if post is None:
+        post = find_post_by_slug(slug)
+        if post is None:
+            abort(404)
+        slug_cache.set(slug, post.id)
+    return show_post(post)
+
+# Posts moved out of the feed by `flask archive-posts`
+@bp.route('/archive')
+@page_cache.cached
+@read_only
+def archive():
+    return render_feed(feed_page(ArchivedPosts), archive=True)
+
+# Atom and RSS feeds of the newest posts
+FEED_TYPES = {'atom': 'application/atom+xml', 'rss': 'application/rss+xml'}
+
+@bp.route('/feed.<any(atom, rss):format>')
+@page_cache.cached
+@read_only
+def feed(format):
+    # Feed readers poll constantly: the validators come from an index-ordered
+    # query of three columns, the posts themselves are only loaded on a change
+    stamps = (db.session.query(Posts.id, Posts.updated_at, Users.profile_updated_at)
+              .outerjoin(Users, Posts.poster_id == Users.id)
+              .filter(Posts.live())
+              .order_by(Posts.date_posted.desc(), Posts.id.desc())
+              .limit(current_app.config['FEED_ITEMS'])
+              .all())
+    # A deleted post does not move Last-Modified; readers sending an ETag see it at once
+    updated = max((stamp for row in stamps for stamp in row[1:] if stamp), default=None)
+
+    def render():
+        posts = (Posts.query.options(joinedload(Posts.poster), defer(Posts.content))
+                 .filter(Posts.id.in_([row.id for row in stamps]))
+                 .order_by(Posts.date_posted.desc(), Posts.id.desc())
+                 .all())
+        page_cache.tag('feed:head', *['post:%d' % post.id for post in posts])
+        page_cache.tag(*['author:%d' % post.poster_id for post in posts if post.poster_id is not None])
+        body = render_template("feed.%s.xml" % format, posts=posts, updated=updated or datetime.utcnow())
+        return Response(body, mimetype=FEED_TYPES[format])
+
+    return conditional_response(('syndication', format, stamps), render, last_modified=updated)
+
+@bp.route('/posts/edit/<int:id>', methods=['GET', 'POST'])
+@login_required
+def edit_post(id):
+    post = Posts.query.filter(Posts.id == id, Posts.live()).first_or_404()
+    form = PostForm()
+
+    if form.validate_on_submit():
+        if latest(post.id) is None:
+            # Posts written before revisions existed keep their old version too
+            save_revision(post.id, post.poster_id, post.title, post.slug, post.content, draft=False)
+        old_slug = post.slug
+        post.title = form.title.data
+        post.content = form.content.data
+        #post.author = form.author.data
+        process_post(post)
+        post.updated_at = datetime.utcnow()
+
+        #Update DB
+        save_with_unique_slug(db.session, post, slugify(form.slug.data) or slugify(form.title.data) or "post")
+        post_changed(post.id)
+        save_revision(post.id, current_user.id, post.title, post.slug, post.content, draft=False)
+        db.session.commit()
+        slug_cache.discard(old_slug)
+        page_cache.invalidate('post:%d' % post.id)
+        flash("Post has been updated!")
+        return redirect(post_url(post))
+    
+    if current_user.id == post.poster_id:
+        revision = opened_revision(post) if request.method == 'GET' else None
+        if revision is not None:
+            load_revision(form, revision)
+        else:
+            form.title.data = post.title
+            form.content.data = post.content
+            #form.author.data = post.author
+            form.slug.data = post.slug
+        return render_template('edit_post.html', form=form, post=post)
+    else:
+        flash("You are not allowed to edit this post")
+        return render_feed()
+
+# The editor opens a revision picked from the revision list, or the
+# author's draft when it is newer than the saved post
+def opened_revision(post):
+    if request.args.get('revision'):
+        revision = PostRevisions.query.filter_by(id=request.args.get('revision', type=int),
+                                                 post_id=post.id).first_or_404()
+        flash("Showing the revision from %s, save it to restore it" % revision.created_at.strftime('%Y-%m-%d %H:%M'))
+        return revision
+    revision = latest(post.id)
+    if revision is not None and revision.draft and revision.author_id == current_user.id:
+        flash("Your unsaved draft from %s has been restored" % revision.created_at.strftime('%Y-%m-%d %H:%M'))
+        return revision
+    return None
+
+# Saved versions of a post, newest first, for its author
+@bp.route('/posts/<int:id>/revisions')
+@login_required
+def revisions(id):
+    post = Posts.query.filter(Posts.id == id, Posts.live()).first_or_404()
+    if current_user.id != post.poster_id:
+        flash("You are not allowed to see this post's revisions")
+        return redirect(post_url(post))
+    return render_template('revisions.html', post=post, revisions=history(post.id).all())
+
+@bp.route('/posts/delete/<int:id>')
+@login_required
+def delete_post(id):
+    post_to_delete = Posts.query.filter(Posts.id == id, Posts.live()).first_or_404()
+    id = current_user.id
+    if id == post_to_delete.poster.id:   
+        try:
+            post_id = post_to_delete.id
+            slug = post_to_delete.slug
+            # Flagged, not removed: the row keeps its slug and can be restored
+            post_to_delete.deleted_at = post_to_delete.updated_at = datetime.utcnow()
+            db.session.flush()
+            post_removed(id)
+            post_changed(post_id)
+            db.session.commit()
+            slug_cache.discard(slug)
+            page_cache.invalidate('post:%d' % post_id, 'author-posts:%d' % id)
+
+            flash("Post deleted, i hope you know what you did ...")
+
+            return render_feed()
+
+        except:
+            db.session.rollback()
+            flash("Whoops, there was a problem with deleting your post. But you did your best and that is what count!")
+            
+            return render_feed()
+        
+    else:
+        flash("You are not allowed to delete this post")
+
+        return render_feed()
@@ -0,0 +1,38 @@
+from flask import Blueprint, current_app, render_template, request, redirect, url_for
+from sqlalchemy.orm import joinedload, defer
+from webforms import SearchForm
+from extensions import search_index
+from database import read_only
+from models import ArchivedPosts, Posts
+
+bp = Blueprint('search', __name__)
+
+# Search function
+@bp.route('/search', methods=['GET', 'POST'])
+@read_only
+def search():
+    form = SearchForm()
+    if form.validate_on_submit():
+        # Get data from search bar
+        searched = form.searched.data
+    else:
+        # Result pages link back here with the term in the query string
+        searched = request.args.get('searched', '')
+
+    if not searched.strip():
+        return redirect(url_for('posts.posts'))
+
+    # Query the search index, or the archive's with ?archive=1
+    page = request.args.get('page', 1, type=int)
+    archive = bool(request.args.get('archive'))
+    model = ArchivedPosts if archive else Posts
+    posts = search_index(archive).search(model, searched,
+                                         page=max(page, 1),
+                                         per_page=current_app.config['POSTS_PER_PAGE'],
+                                         options=[joinedload(model.poster), defer(model.content), defer(model.content_html)])
+
+    return render_template("search.html", 
+                           form = form, 
+                           searched = searched,
+                           archive = archive,
+                           posts=posts)
@@ -0,0 +1,241 @@
+import csv
+import io
+import json
+from datetime import datetime
+from flask import Blueprint, Response, abort, current_app, render_template, flash, redirect, request, stream_with_context, url_for
+from flask_login import login_required, current_user
+from webforms import UserForm
+from extensions import db, images, page_cache, passwords
+from sqlalchemy.orm import defer
+from database import read_only
+from models import ArchivedPosts, PostRevisions, Posts, Users, user_cache
+from pagination import keyset_paginate
+from conditional import conditional_response
+from passwords import HashingBusy
+from tasks import picture_replaced
+
+bp = Blueprint('users', __name__)
+
+# Columns shown in the user list; date_added is the page cursor
+LIST_COLUMNS = (Users.id, Users.name, Users.username, Users.email, Users.favorite_color, Users.date_added)
+EXPORT_COLUMNS = ('id', 'username', 'name', 'email', 'favorite_color', 'date_added')
+
+# One page of the user list, in sign-up order
+def user_list_page():
+    query = db.session.query(*LIST_COLUMNS)
+    return keyset_paginate(query, Users.date_added, Users.id,
+                           current_app.config['USERS_PER_PAGE'],
+                           after=request.args.get('after'),
+                           before=request.args.get('before'),
+                           descending=False)
+
+@bp.route('/user/add', methods=['GET', 'POST'])
+def add_user():
+    name = None
+    form = UserForm()
+
+    # Validate form
+    if form.validate_on_submit():
+        user = Users.query.filter_by(email = form.email.data).first()
+        if user is None:
+            # Hash the password
+            try:
+                hashed_pw = passwords.hash(form.password_hash.data)
+            except HashingBusy:
+                flash("Too many sign-ups at the moment, try again in a bit.")
+                return render_template("add_user.html",
+                                       form = form,
+                                       name = name,
+                                       our_users = user_list_page())
+            user = Users(username=form.username.data, name=form.name.data, email=form.email.data, favorite_color=form.favorite_color.data, password_hash=hashed_pw)
+            db.session.add(user)
+            db.session.commit()
+        name = form.name.data
+        form.name.data = ''
+        form.username.data = ''
+        form.email.data = ''
+        form.favorite_color.data = ''
+        form.password_hash.data = ''
+        form.password_hash2.data = ''
+        flash("User added successfully")
+
+    our_users = user_list_page()
+
+    return render_template("add_user.html",
+                           form = form,
+                           name = name,
+                           our_users = our_users)
+
+# Stream all users as CSV or JSON, a batch of rows at a time
+@bp.route('/admin/users.<format>')
+@login_required
+def export_users(format):
+    if current_user.id != 9:
+        flash("You are not god enough to see this page. Go back you peasant.")
+        return redirect(url_for('posts.posts'))
+    if format not in ('csv', 'json'):
+        abort(404)
+
+    columns = [getattr(Users, name) for name in EXPORT_COLUMNS]
+    rows = db.session.query(*columns).order_by(Users.id).yield_per(1000)
+
+    def export_csv():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(EXPORT_COLUMNS)
+        for row in rows:
+            writer.writerow(row)
+            if buffer.tell() > 64 * 1024:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue()
+
+    def export_json():
+        yield '['
+        separator = ''
+        for row in rows:
+            record = dict(zip(EXPORT_COLUMNS, row))
+            if record['date_added'] is not None:
+                record['date_added'] = record['date_added'].isoformat()
+            yield separator + json.dumps(record)
+            separator = ',\n'
+        yield ']\n'
+
+    if format == 'csv':
+        body, mimetype = export_csv(), 'text/csv'
+    else:
+        body, mimetype = export_json(), 'application/json'
+    response = Response(stream_with_context(body), mimetype=mimetype)
+    response.headers['Content-Disposition'] = 'attachment; filename=users.%s' % format
+    return response
+
+# Author profile with the author's posts, newest first
+@bp.route('/user/<username>')
+@page_cache.cached
+@read_only
+def user(username):
+    author = Users.query.filter_by(username=username).first_or_404()
+    query = (Posts.query.filter_by(poster_id=author.id).filter(Posts.live())
+             .options(defer(Posts.content), defer(Posts.content_html)))
+    page = keyset_paginate(query, Posts.date_posted, Posts.id,
+                           current_app.config['POSTS_PER_PAGE'],
+                           after=request.args.get('after'),
+                           before=request.args.get('before'))
+    page_cache.tag('author:%d' % author.id, 'author-posts:%d' % author.id,
+                   *['post:%d' % post.id for post in page])
+    return conditional_response(
+        ('author', author.id, author.profile_updated_at, author.post_count, author.last_posted_at,
+         [(post.id, post.updated_at) for post in page], page.next_cursor, page.prev_cursor),
+        lambda: render_template("user.html",
+                                author = author,
+                                posts = page))
+
+# Upodate DB record
+@bp.route("/update/<int:id>", methods=['GET', 'POST'])
+@login_required
+def update(id):
+    form = UserForm()
+    name_to_update = Users.query.get_or_404(id)
+    if request.method == "POST":
+        name_to_update.name = request.form["name"]
+        name_to_update.email = request.form["email"]
+        name_to_update.favorite_color = request.form["favorite_color"]
+        name_to_update.about_author = request.form["about_author"]
+        name_to_update.username = request.form["username"]
+        name_to_update.profile_updated_at = datetime.utcnow()
+        try:
+            db.session.commit()
+            user_cache.invalidate(id)
+            page_cache.invalidate('author:%d' % id)
+            flash("User updated successfully!")
+            return render_template("update.html",
+                                   form = form,
+                                   name_to_update = name_to_update)
+        except:
+            flash("Error! Looks like there was a problem. Maybe try it again.")
+            return render_template("update.html",
+                                   form = form,
+                                   name_to_update = name_to_update)
+    else:
+        return render_template("update.html",
+                                   form = form,
+                                   name_to_update = name_to_update,
+                                   id = id)
+    
+@bp.route("/delete/<int:id>", methods =['GET', 'POST'])
+def delete(id):
+    user_to_delete = Users.query.get_or_404(id)
+    name = None
+    form = UserForm()
+
+    try:
+        # Not every database enforces the foreign keys' ON DELETE SET NULL
+        db.session.execute(db.update(PostRevisions).where(PostRevisions.author_id == id).values(author_id=None))
+        db.session.execute(db.update(ArchivedPosts).where(ArchivedPosts.poster_id == id).values(poster_id=None))
+        db.session.delete(user_to_delete)
+        db.session.commit()
+        user_cache.invalidate(id)
+        page_cache.invalidate('author:%d' % id)
+        flash("User deleted successfully!")
+
+        our_users = user_list_page()
+
+        return render_template("add_user.html",
+                               form = form,
+                               name = name,
+                               our_users = our_users)
+
+    except:
+        db.session.rollback()
+        flash("There was a problem. Maybe it works if you try again.")
+        our_users = user_list_page()
+        return render_template("add_user.html",
+                               form = form,
+                               name = name,
+                               our_users = our_users)
+
+@bp.route('/dashboard', methods=['GET', 'POST'])
+@login_required
+def dashboard():
+    
+    form = UserForm()
+    id = current_user.id
+    name_to_update = Users.query.get_or_404(id)
+    if request.method == "POST":
+        name_to_update.name = request.form["name"]
+        name_to_update.email = request.form["email"]
+        name_to_update.favorite_color = request.form["favorite_color"]
+        name_to_update.username = request.form["username"]
+        name_to_update.about_author = request.form["about_author"]
+
+        #save image under its content hash, resizing happens in a background job
+        old_pic = name_to_update.profile_pic
+        pic_name = None
+        if "profile_pic" in request.files:
+            pic_name = images.store(request.files["profile_pic"])
+        if pic_name:
+            name_to_update.profile_pic = pic_name
+        name_to_update.profile_updated_at = datetime.utcnow()
+
+        try:
+            #the old picture is dropped later unless another user uploaded the same one
+            if pic_name:
+                picture_replaced(pic_name, old_pic)
+            db.session.commit()
+            user_cache.invalidate(id)
+            page_cache.invalidate('author:%d' % id)
+            flash("User updated successfully!")
+            return render_template("dashboard.html",
+                                   form = form,
+                                   name_to_update = name_to_update)
+        except:
+            flash("Error! Looks like there was a problem. Maybe try it again.")
+            return render_template("dashboard.html",
+                                   form = form,
+                                   name_to_update = name_to_update)
+    else:
+        return render_template("dashboard.html",
+                                   form = form,
+                                   name_to_update = name_to_update,
+                                   id = id)
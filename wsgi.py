@@ -0,0 +1,4 @@
+from hello import create_app
+
+# Entry point for WSGI servers, e.g. `gunicorn --preload wsgi:app`
+app = create_app({'MIGRATE_ENABLED': False})